@@ -1,112 +1,22 @@
-import requests
-from typing import Optional, Dict, List
+import os
+import sys
 import json
 
-class BacklogAPIClient:
-    def __init__(self, space_name: str, api_key: str):
-        self.base_url = f"https://{space_name}.backlog.com/api/v2"
-        self.api_key = api_key
-
-    def _make_request(self, endpoint: str, method: str = 'GET', params: Dict = None) -> Dict:
-        """APIリクエストを実行し、JSONレスポンスを返す"""
-        url = f"{self.base_url}{endpoint}"
-        params = params or {}
-        params['apiKey'] = self.api_key
-
-        response = requests.request(method, url, params=params)
-        response.raise_for_status()
-        return response.json()
-
-    # 1. 在席管理プロジェクトの課題取得
-    def get_staff_issues(self, project_id: str = "550650") -> List[Dict]:
-        """在席管理プロジェクトの課題一覧を取得"""
-        params = {
-            "projectId[]": project_id,
-            "count": 3
-        }
-        json_response = self._make_request('/issues', params=params)
-        
-        # レスポンス例:
-        # [
-        #     {
-        #         "id": 123457,
-        #         "projectId": 550650,
-        #         "issueKey": "STAFF-456",
-        #         "summary": "山田 太郎",
-        #         "status": {"id": 242353, "name": "不在"},
-        #         "assignee": {"id": 12345, "name": "山田 太郎"}
-        #     }
-        # ]
-        return json_response
+import requests
 
-    # 2. 請求管理プロジェクトの差し戻し課題取得
-    def get_reverted_issues(self, project_id: str = "550648") -> List[Dict]:
-        """差し戻し状態の課題一覧を取得"""
-        params = {
-            "projectId[]": project_id,
-            "statusId[]": "262863",  # 差し戻しステータス
-        }
-        json_response = self._make_request('/issues', params=params)
-        
-        # レスポンス例:
-        # [
-        #     {
-        #         "id": 123456,
-        #         "issueKey": "BLG-123",
-        #         "summary": "○○病院 - P123456",
-        #         "status": {"id": 262863, "name": "差し戻し"}
-        #     }
-        # ]
-        return json_response
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(project_root)
 
-    # 3. 医療機関情報の取得
-    def get_hospital_issues(self, project_id: str = "569286") -> List[Dict]:
-        """医療機関の課題一覧を取得"""
-        params = {
-            "projectId[]": project_id,
-            "count": 100
-        }
-        json_response = self._make_request('/issues', params=params)
-        
-        # レスポンス例:
-        # [
-        #     {
-        #         "id": 123458,
-        #         "summary": "○○病院",
-        #         "customFields": [
-        #             {"name": "ID", "value": "hospital_user_123"},
-        #             {"name": "ポーリング", "value": {"name": "有効"}}
-        #         ]
-        #     }
-        # ]
-        return json_response
+# BacklogAPIClient は共通クライアント（src/utils/backlog_client.py）に統合済み
+from src.utils.backlog_client import BacklogAPIClient, get_backlog_client
 
-    # 4. 課題の状態更新
-    def update_issue_status(self, issue_id: str, status_id: str) -> Dict:
-        """課題のステータスを更新"""
-        params = {
-            "statusId": status_id
-        }
-        json_response = self._make_request(
-            f'/issues/{issue_id}',
-            method='PATCH',
-            params=params
-        )
-        
-        # レスポンス例:
-        # {
-        #     "id": 123456,
-        #     "status": {"id": 263209, "name": "差し戻し済み"}
-        # }
-        return json_response
+__all__ = ['BacklogAPIClient', 'get_backlog_client']
 
 # 使用例
 def main():
-    # クライアントの初期化
-    client = BacklogAPIClient(
-        space_name="oasis-inn",
-        api_key="1vxPXhjOB1yfbswK4ShCFrCnAC0QfBBFWVqNJG5KFoDZYjreOuZ3qOCEUfRrZaVN"
-    )
+    # クライアントの初期化（config/config.ini の [backlog] を使用）
+    client = get_backlog_client()
 
     try:
         # 1. 在席管理の課題を取得して処理
@@ -134,10 +44,10 @@ def main():
 
     except requests.exceptions.RequestException as e:
         print(f"APIリクエストエラー: {e}")
-        if hasattr(e, 'response'):
+        if getattr(e, 'response', None) is not None:
             print(f"エラーレスポンス: {e.response.text}")
     except Exception as e:
         print(f"予期せぬエラー: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 メインオーケストレーター
-各モニターシステムを統合管理する（順次ログイン処理版）
+各モニターシステムを統合管理する（並行ログイン処理版）
 - CLIUS監視
 - デジカル監視
 - モバカル監視
@@ -21,16 +21,34 @@ import configparser
 from datetime import datetime, timedelta
 import glob
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # プロジェクトルートへのパスを追加
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(project_root)
 
-from src.utils.logger import get_logger
+from src.utils.logger import get_logger, LoggerFactory
 from src.utils.login_status import LoginStatus
 from src.core import clius_monitor, digikar_monitor, movacal_monitor, clinics_monitor
 from src.core import ippo_monitor, movacli_monitor  # 新規追加
 from src.core import paper_monitor, task_assignment
+from src.core.ingestion_service import shutdown_ingestion_service
+from src.core.backlog_issue_pipeline import get_backlog_issue_pipeline, shutdown_backlog_issue_pipeline
+from src.core.webhook_notifier import shutdown_webhook_notifier
+from src.core.hospital_registry import get_hospital_registry
+from src.core.patient_snapshot import get_patient_snapshot_cache
+from src.core.patient_trace import register_trace_routes
+from src.core import assignment_trigger
+from src.core.assignment_trigger import REASON_SWEEP, get_assignment_trigger
+from src.utils.db_pool import close_db_pool
+from src.utils.backlog_client import close_backlog_clients
+from src.utils.loop_monitor import LoopLagMonitor, load_lag_threshold
+from src.utils.local_server import LocalEventServer, load_server_config
+from src.utils.metrics import (
+    get_metrics_registry, register_metrics_route, start_metrics_snapshot, shutdown_metrics_snapshot
+)
+from src.utils.profiler import load_profiler
 
 class ProcessOrchestrator:
     def __init__(self):
@@ -42,6 +60,9 @@ class ProcessOrchestrator:
         self.shutdown_event = asyncio.Event()
         self.monitor_processes = []
         
+        # タスク割り当ては同期処理のため専用スレッドで実行する（証明書待ちなどと既定のスレッドプールを奪い合わない）
+        self.task_assignment_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='task_assignment')
+        
         # ログイン状態管理
         self.clius_login_status = LoginStatus("CLIUS")
         self.digikar_login_status = LoginStatus("デジカル")
@@ -67,6 +88,9 @@ class ProcessOrchestrator:
         # シグナルハンドラの設定
         for sig in (signal.SIGTERM, signal.SIGINT):
             signal.signal(sig, self.handle_shutdown)
+        if self.profiler:
+            # SIGUSR1 で稼働中のままプロファイルを取得する（Windowsではフラグファイルかエンドポイントを使う）
+            self.profiler.install_signal_handler()
 
     def initialize_pid_file(self):
         """PIDファイルの初期化"""
@@ -126,7 +150,7 @@ class ProcessOrchestrator:
         
         config.read(config_path, encoding='utf-8')
         
-        self.task_assignment_interval = config.getint('setting', 'task_assignment_interval', fallback=5)
+        self.assignment_sweep_interval = config.getint('setting', 'assignment_sweep_interval', fallback=60)
         self.clius_polling_interval = config.getint('setting', 'clius_polling_interval', fallback=10)
         self.digikar_polling_interval = config.getint('setting', 'digikar_polling_interval', fallback=10)
         self.movacal_polling_interval = config.getint('setting', 'movacal_polling_interval', fallback=10)
@@ -134,6 +158,31 @@ class ProcessOrchestrator:
         self.ippo_polling_interval = config.getint('setting', 'ippo_polling_interval', fallback=10)  # 新規追加
         self.movacli_polling_interval = config.getint('setting', 'movacli_polling_interval', fallback=10)  # 新規追加
         self.paper_polling_interval = config.getint('setting', 'paper_polling_interval', fallback=30)
+        self.max_concurrent_logins = max(1, config.getint('setting', 'max_concurrent_logins', fallback=3))
+        self.loop_monitor = LoopLagMonitor(threshold=load_lag_threshold(config))
+        
+        # Backlogのwebhookや子プロセスからの通知を受けるイベント受信サーバー
+        server_config = load_server_config(config)
+        self.event_server = None
+        # 監視・割り当て処理のプロファイラー（シグナル・フラグファイル・POST /admin/profile で起動）
+        self.profiler = load_profiler(config)
+        if server_config['enabled']:
+            self.event_server = LocalEventServer(server_config['host'], server_config['port'],
+                                                 server_config['token'], server_config['admin_token'])
+            assignment_trigger.register_routes(self.event_server, config)
+            # 処理時間などのメトリクスを Prometheus 形式で公開する（GET /metrics）
+            register_metrics_route(self.event_server)
+            # 処理が遅かった患者のトレース（GET /traces/slowest）
+            register_trace_routes(self.event_server)
+            if self.profiler:
+                self.profiler.register_routes(self.event_server)
+        if not (self.event_server and self.event_server.token):
+            # Backlogのwebhookを受け付けられないため、在席変更・差し戻しは定期チェックで拾う
+            # （定期チェックは差分の問い合わせと鮮度による同期の省略で行うため、間隔を短くしても負荷は小さい）
+            self.assignment_sweep_interval = min(
+                self.assignment_sweep_interval,
+                config.getint('setting', 'assignment_sweep_interval_without_webhook', fallback=5))
+        self.metrics_config = config
         
         self.logger.info(f"CLIUSポーリング間隔を {self.clius_polling_interval} 秒に設定しました")
         self.logger.info(f"デジカルポーリング間隔を {self.digikar_polling_interval} 秒に設定しました")
@@ -142,6 +191,8 @@ class ProcessOrchestrator:
         self.logger.info(f"医歩ポーリング間隔を {self.ippo_polling_interval} 秒に設定しました")  # 新規追加
         self.logger.info(f"モバクリポーリング間隔を {self.movacli_polling_interval} 秒に設定しました")  # 新規追加
         self.logger.info(f"紙カルテポーリング間隔を {self.paper_polling_interval} 秒に設定しました")
+        self.logger.info(f"ログイン処理の同時実行数を {self.max_concurrent_logins} に設定しました")
+        self.logger.info(f"タスク割り当ての定期チェック間隔を {self.assignment_sweep_interval} 秒に設定しました")
 
     def _create_all_systems_bizrobo_summary(self):
         """個別ログインファイルから統合判定ファイルを作成"""
@@ -223,6 +274,59 @@ class ProcessOrchestrator:
         except Exception as e:
             self.logger.error(f"エラー用統合判定ファイル作成失敗: {e}")
 
+    async def prefetch_hospital_registry(self):
+        """医療機関情報をBacklogから一括取得する（各監視モジュールで共有）"""
+        try:
+            registry = get_hospital_registry()
+            await asyncio.get_event_loop().run_in_executor(None, registry.refresh)
+        except Exception as e:
+            # 取得できなかった場合は各監視モジュールの初期化時に再取得される
+            self.logger.error(f"医療機関情報の一括取得に失敗しました: {str(e)}")
+
+    async def run_login_phase(self):
+        """
+        各システムの監視を起動し、ログインを並行して行う
+
+        - 同時にログイン処理を行うシステム数は max_concurrent_logins で制限する
+        - pyautogui による証明書ダイアログの操作は、各監視モジュールが画面操作ロック
+          （src.utils.desktop_input）を取得して1つずつ行う。ロックはダイアログの操作中だけ
+          保持するため、それ以外のログイン処理は並行して進む
+        - 各システムは自分のログインが完了した時点からポーリングを開始する
+        """
+        login_semaphore = asyncio.Semaphore(self.max_concurrent_logins)
+
+        # (システム名, 起動処理)
+        systems = [
+            ("CLIUS", self.run_clius_monitor),
+            ("デジカル", self.run_digikar_monitor),
+            ("モバカル", self.run_movacal_monitor),
+            ("CLINICS", self.run_clinics_monitor),
+            ("医歩", self.run_ippo_monitor),
+            ("モバクリ", self.run_movacli_monitor),
+            ("紙カルテ", self.run_paper_monitor),
+        ]
+
+        async def start_system(name, runner):
+            start_time = datetime.now()
+            async with login_semaphore:
+                await runner()
+            elapsed = (datetime.now() - start_time).total_seconds()
+            self.logger.info(f"{name}モニタリングの初期化が完了しました ({elapsed:.1f}秒)")
+
+        self.logger.info(f"ログイン処理を並行実行します (同時実行数: {self.max_concurrent_logins})")
+        results = await asyncio.gather(
+            *(start_system(name, runner) for name, runner in systems),
+            return_exceptions=True
+        )
+
+        errors = [(name, result) for (name, _), result in zip(systems, results)
+                  if isinstance(result, BaseException)]
+        for name, error in errors:
+            self.logger.error(f"{name}モニタリングの起動に失敗しました: {error}")
+        if errors:
+            # 従来どおり、起動失敗はオーケストレーターのエラー処理に委ねる
+            raise errors[0][1]
+
     async def run_clius_monitor(self):
         """CLIUS監視の起動"""
         try:
@@ -383,10 +487,11 @@ class ProcessOrchestrator:
             self.logger.error(traceback.format_exc())
             raise
 
-    async def run_task_assignment(self):
+    async def run_task_assignment(self, reasons):
         """タスク割り当ての実行"""
         try:
-            await asyncio.get_event_loop().run_in_executor(None, task_assignment.main)
+            self.logger.debug(f"タスク割り当てを起動します: {', '.join(sorted(reasons))}")
+            await asyncio.get_event_loop().run_in_executor(self.task_assignment_executor, task_assignment.main, reasons)
             self.logger.debug("タスク割り当て処理が完了しました")
         except Exception as e:
             self.logger.error(f"タスク割り当て処理でエラーが発生しました: {str(e)}")
@@ -394,45 +499,47 @@ class ProcessOrchestrator:
             raise
 
     async def orchestrate(self):
-        """メインの実行フロー（順次ログイン処理）"""
+        """メインの実行フロー（並行ログイン処理）"""
         self.logger.debug("オーケストレーターを開始します")
-        last_task_assignment = None
+        last_assignment_sweep = None
         last_paper_monitor = None
         
+        # イベントループのブロッキングを検知するウォッチドッグ
+        self.loop_monitor.start()
+        
+        # メトリクスのスナップショットを bizrobo_flags に定期出力する
+        get_metrics_registry().register_collector('event_loop', self.loop_monitor.get_stats)
+        start_metrics_snapshot(self.metrics_config)
+        
+        if self.profiler:
+            self.profiler.bind(asyncio.get_running_loop())
+            self.profiler.start_watching()
+        
+        # タスク割り当ては起動要求（新規会計・在席変更・差し戻し）を受けて実行する
+        trigger = get_assignment_trigger()
+        trigger.bind(asyncio.get_event_loop())
+        if self.event_server:
+            try:
+                self.event_server.start()
+            except OSError as e:
+                self.logger.error(f"イベント受信サーバーを開始できませんでした（定期チェックのみで動作します）: {e}")
+                self.event_server = None
+        
+        # Backlogチケット作成パイプライン（スプールに残ったチケットの再試行もここで行う）
+        get_backlog_issue_pipeline()
+        
         try:
             while self.running:
                 try:
                     current_time = datetime.now()
 
-                    # 電子カルテモニタリング（初回のみ順次実行）
+                    # 電子カルテモニタリング（初回のみ起動）
                     if not self.monitor_processes:
-                        # CLIUSモニタリング開始
-                        await self.run_clius_monitor()
-                        self.logger.debug("CLIUSモニタリングの初期化が完了しました")
-                        
-                        # デジカルモニタリング開始
-                        await self.run_digikar_monitor()
-                        self.logger.debug("デジカルモニタリングの初期化が完了しました")
-                        
-                        # モバカルモニタリング開始
-                        await self.run_movacal_monitor()
-                        self.logger.debug("モバカルモニタリングの初期化が完了しました")
-
-                        # CLINICSモニタリング開始
-                        await self.run_clinics_monitor()
-                        self.logger.debug("CLINICSモニタリングの初期化が完了しました")
-
-                        # 医歩モニタリング開始（新規追加）
-                        await self.run_ippo_monitor()
-                        self.logger.debug("医歩モニタリングの初期化が完了しました")
+                        # 医療機関情報を一括取得（各システムはここから自分の分を受け取る）
+                        await self.prefetch_hospital_registry()
 
-                        # モバクリモニタリング開始（新規追加）
-                        await self.run_movacli_monitor()
-                        self.logger.debug("モバクリモニタリングの初期化が完了しました")
-
-                        # 紙カルテモニタリング開始
-                        await self.run_paper_monitor()
-                        self.logger.debug("紙カルテモニタリングの初期化が完了しました")
+                        # 各システムのログインを並行実行（証明書選択が必要なシステムは直列化）
+                        await self.run_login_phase()
 
                         # 全システムログイン完了後、統合サマリー作成
                         if self.create_bizrobo_summary_on_completion:
@@ -440,11 +547,10 @@ class ProcessOrchestrator:
                             self._create_all_systems_bizrobo_summary()
                             self.create_bizrobo_summary_on_completion = False
 
-                    # タスク割り当て処理の実行（設定された間隔ごと）
-                    if last_task_assignment is None or (current_time - last_task_assignment).total_seconds() >= self.task_assignment_interval:
-                        await self.run_task_assignment()
-                        last_task_assignment = current_time
-                        next_run = current_time + timedelta(seconds=self.task_assignment_interval)
+                    # タスク割り当て処理の定期チェック（webhookの取りこぼし対策）
+                    if last_assignment_sweep is None or (current_time - last_assignment_sweep).total_seconds() >= self.assignment_sweep_interval:
+                        await self.run_task_assignment({REASON_SWEEP})
+                        last_assignment_sweep = current_time
 
                     # 紙カルテモニタリング処理の実行（設定された間隔ごと）
                     if last_paper_monitor is None or (current_time - last_paper_monitor).total_seconds() >= self.paper_polling_interval:
@@ -452,20 +558,18 @@ class ProcessOrchestrator:
                         last_paper_monitor = current_time
                         next_paper_run = current_time + timedelta(seconds=self.paper_polling_interval)
 
-                    # 短い間隔でシャットダウンチェック
-                    if await asyncio.wait_for(self.shutdown_event.wait(), timeout=1):
+                    # 割り当ての起動要求を待つ（最大1秒ごとにシャットダウンを確認）
+                    reasons = await trigger.wait(timeout=1)
+                    if self.shutdown_event.is_set():
                         self.logger.info("シャットダウンイベントを検知しました")
                         break
-
-                    # CPU使用率抑制のための短い待機
-                    await asyncio.sleep(0.1)
+                    if reasons:
+                        await self.run_task_assignment(reasons)
                     
-                except asyncio.TimeoutError:
-                    continue
                 except Exception as e:
                     self.logger.error(f"処理中にエラーが発生しました: {str(e)}")
                     self.logger.error(traceback.format_exc())
-                    last_task_assignment = None
+                    last_assignment_sweep = None
                     last_paper_monitor = None
                     await asyncio.sleep(5)
         
@@ -496,10 +600,66 @@ class ProcessOrchestrator:
         
         self.monitor_processes.clear()
         
+        # イベント受信サーバーの停止
+        if self.event_server:
+            self.event_server.stop()
+        
+        # タスク割り当て用スレッドの停止（実行中の割り当て処理の完了をループを止めずに待つ）
+        await asyncio.get_event_loop().run_in_executor(
+            None, partial(self.task_assignment_executor.shutdown, wait=True))
+        
+        # ループ遅延監視の停止
+        await self.loop_monitor.stop()
+        
+        # 変更検知の効果（送信を省略した患者データの割合）を出力
+        snapshot_stats = get_patient_snapshot_cache().get_stats()
+        self.logger.info(f"会計待ちの変更検知: 送信 {snapshot_stats['forwarded']}件, "
+                         f"省略 {snapshot_stats['skipped']}件 ({snapshot_stats['skip_ratio']:.1%})")
+        
+        # 常駐取り込みサービスの停止（DB接続の解放）
+        try:
+            shutdown_ingestion_service()
+        except Exception as e:
+            self.logger.error(f"取り込みサービス停止中にエラー: {e}")
+        
+        # チケット作成パイプラインの停止（投入済みのチケット作成と番号の書き戻しを完了させる）
+        try:
+            shutdown_backlog_issue_pipeline()
+        except Exception as e:
+            self.logger.error(f"チケット作成パイプライン停止中にエラー: {e}")
+        
+        # Webhook通知の停止（未送信の通知は送信するかスプールへ保存する）
+        try:
+            shutdown_webhook_notifier()
+        except Exception as e:
+            self.logger.error(f"Webhook通知停止中にエラー: {e}")
+        
+        # DB接続プールのクローズ（貸出メトリクスを出力）
+        try:
+            close_db_pool()
+        except Exception as e:
+            self.logger.error(f"DB接続プールのクローズ中にエラー: {e}")
+        
+        # Backlogクライアントのセッションを閉じる
+        close_backlog_clients()
+        
+        # メトリクスの最終スナップショットを出力
+        try:
+            shutdown_metrics_snapshot()
+        except Exception as e:
+            self.logger.error(f"メトリクスのスナップショット出力停止中にエラー: {e}")
+        
+        # プロファイラーの停止
+        if self.profiler:
+            self.profiler.stop()
+        
         # PIDファイルの削除
         self.remove_pid_file()
         
         self.logger.info("クリーンアップが完了しました")
+        
+        # 書き込み待ちのログをファイルへ反映する
+        LoggerFactory.shutdown()
 
 async def main():
     """エントリーポイント"""
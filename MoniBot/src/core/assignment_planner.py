@@ -0,0 +1,219 @@
+# src/core/assignment_planner.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.utils.logger import LoggerFactory
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('assignment_planner')
+
+# チケットステータスの定義
+TASK_STATUS_UNASSIGNED = '未割当'
+TASK_STATUS_ASSIGNED = '割当済'
+TASK_STATUS_REVERTED = '差戻'
+
+# 病院情報が見つからない場合の既定値
+UNKNOWN_HOSPITAL = {"病院名": "不明な病院", "電子カルテ名": "CLIUS"}
+
+
+@dataclass
+class Assignment:
+    """1件の割り当て計画（会計データとスタッフの組）"""
+    account_id: int
+    hospital_id: int
+    patient_id: str
+    team: Optional[str]
+    ticket_number: str
+    ticket_status: str                  # 割り当て前のチケット状態（取り消し時に戻す）
+    created_at: Optional[datetime]      # 取得時間（tbl_pendingaccounts.作成時間）
+    hospital_name: str
+    emr_name: str
+    original_ticket: Optional[str]      # 差し戻し前のチケット番号
+    staff: tuple                        # (スタッフID, 名前, BacklogユーザーID, ステータス, 最終割り当て時間)
+
+    @property
+    def staff_id(self) -> int:
+        return self.staff[0]
+
+    @property
+    def staff_name(self) -> str:
+        return self.staff[1]
+
+    @property
+    def backlog_user_id(self) -> str:
+        return self.staff[2]
+
+    @property
+    def hospital_info(self) -> Dict[str, str]:
+        return {"病院名": self.hospital_name, "電子カルテ名": self.emr_name}
+
+
+def _in_clause(values: Sequence) -> str:
+    return ', '.join(['%s'] * len(values))
+
+
+def load_pending_accounts(cursor) -> List[Dict[str, Any]]:
+    """
+    未割当・差戻の会計データを、割り当てに必要な付帯情報と合わせて1回のクエリで取得する
+
+    get_team_pending_accounts プロシージャと同じ条件・並び順（差戻を優先し、作成時間の古い順）で、
+    チケット番号・チケット状態・病院名・電子カルテ名と、差し戻し前のチケット番号を結合して返す。
+
+    Returns:
+        [{'account_id', 'hospital_id', 'patient_id', 'team', 'ticket_number', 'ticket_status',
+          'created_at', 'hospital_name', 'emr_name', 'original_ticket'}, ...]
+    """
+    cursor.execute("""
+        SELECT
+            pa.会計ID, pa.病院ID, pa.患者ID, h.チーム, pa.Backlogチケット番号, pa.チケット状態,
+            pa.作成時間, h.病院名, h.電子カルテ名,
+            (
+                SELECT ah.Backlogチケット番号
+                FROM tbl_assignmenthistory ah
+                WHERE ah.会計ID = pa.会計ID AND ah.差戻時間 IS NOT NULL
+                ORDER BY ah.差戻時間 DESC
+                LIMIT 1
+            ) AS 元チケット番号
+        FROM tbl_pendingaccounts pa
+        LEFT JOIN tbl_hospital h ON pa.病院ID = h.病院ID
+        WHERE pa.チケット状態 IN (%s, %s)
+        ORDER BY
+            CASE pa.チケット状態
+                WHEN %s THEN 0
+                ELSE 1
+            END,
+            pa.作成時間 ASC
+    """, (TASK_STATUS_UNASSIGNED, TASK_STATUS_REVERTED, TASK_STATUS_REVERTED))
+
+    pending_accounts = []
+    for (account_id, hospital_id, patient_id, team, ticket_number, ticket_status,
+         created_at, hospital_name, emr_name, original_ticket) in cursor.fetchall():
+        pending_accounts.append({
+            'account_id': account_id,
+            'hospital_id': hospital_id,
+            'patient_id': patient_id,
+            'team': team,
+            'ticket_number': ticket_number,
+            'ticket_status': ticket_status or TASK_STATUS_UNASSIGNED,
+            'created_at': created_at,
+            'hospital_name': hospital_name or UNKNOWN_HOSPITAL['病院名'],
+            'emr_name': emr_name or UNKNOWN_HOSPITAL['電子カルテ名'],
+            'original_ticket': original_ticket,
+        })
+    return pending_accounts
+
+
+def load_available_staff(cursor, teams: Sequence[str]) -> Dict[str, List[tuple]]:
+    """
+    指定チームの「在席」スタッフを最終割り当て時間の古い順に取得し、行ロックする
+
+    Returns:
+        チーム -> [(スタッフID, 名前, BacklogユーザーID, ステータス, 最終割り当て時間), ...]
+    """
+    teams = [team for team in teams if team]
+    if not teams:
+        return {}
+    cursor.execute(f"""
+        SELECT s.スタッフID, s.名前, s.BacklogユーザーID, s.ステータス, s.最終割り当て時間, st.チーム
+        FROM tbl_staff s
+        JOIN tbl_staff_teams st ON s.スタッフID = st.スタッフID
+        WHERE s.ステータス = '在席'  -- 厳密に「在席」のみ
+        AND st.チーム IN ({_in_clause(teams)})
+        ORDER BY s.最終割り当て時間 ASC
+        FOR UPDATE
+    """, list(teams))
+    staff_by_team: Dict[str, List[tuple]] = {}
+    for row in cursor.fetchall():
+        staff_by_team.setdefault(row[5], []).append(tuple(row[:5]))
+    return staff_by_team
+
+
+def plan_assignments(pending_accounts: Sequence[Dict[str, Any]],
+                     staff_by_team: Dict[str, List[tuple]]) -> List[Assignment]:
+    """
+    未割当の会計データにスタッフを割り当てる計画を立てる（DBアクセスなし）
+
+    会計データは取得順に処理し、チームの在席スタッフのうち最終割り当て時間が最も古い人を選ぶ。
+    割り当てたスタッフは「在席(処理中)」になるため、同じサイクルでは再度選ばない。
+    Backlogチケットがまだ作成されていない会計データは対象外とする。
+
+    Args:
+        pending_accounts: load_pending_accounts の結果
+        staff_by_team: load_available_staff の結果
+    """
+    assigned_staff = set()
+    plan: List[Assignment] = []
+
+    for account in pending_accounts:
+        if not account['ticket_number']:
+            continue
+
+        staff = next((s for s in staff_by_team.get(account['team'], []) if s[0] not in assigned_staff), None)
+        if staff is None:
+            continue
+        assigned_staff.add(staff[0])
+
+        plan.append(Assignment(staff=staff, **account))
+
+    return plan
+
+
+def apply_assignments(cursor, plan: List[Assignment]):
+    """
+    割り当て計画をDBへ反映する（コミットは呼び出し側で行う）
+
+    update_assignment プロシージャと同じ更新を、計画全体に対してまとめて実行する。
+    （プロシージャは内部でコミットするため、1トランザクションにまとめる目的では使用しない）
+    """
+    if not plan:
+        return
+    cursor.executemany("""
+        UPDATE tbl_pendingaccounts
+        SET チケット状態 = %s
+        WHERE 会計ID = %s
+    """, [(TASK_STATUS_ASSIGNED, a.account_id) for a in plan])
+    cursor.executemany("""
+        INSERT INTO tbl_assignmenthistory
+        (会計ID, スタッフID, 割り当て時間, Backlogチケット番号, 元チケット番号)
+        VALUES (%s, %s, NOW(), %s, %s)
+    """, [(a.account_id, a.staff_id, str(a.ticket_number), a.original_ticket) for a in plan])
+    cursor.executemany("""
+        UPDATE tbl_staff
+        SET ステータス = '在席(処理中)', 最終割り当て時間 = NOW()
+        WHERE スタッフID = %s
+    """, [(a.staff_id,) for a in plan])
+
+
+def cancel_assignments(cursor, assignments: List[Assignment]):
+    """
+    Backlogへの反映に失敗した割り当てを取り消す（コミットは呼び出し側で行う）
+
+    会計データのチケット状態とスタッフの状態・最終割り当て時間を割り当て前に戻し、
+    追加した割り当て履歴を削除する。
+    """
+    if not assignments:
+        return
+    cursor.executemany("""
+        UPDATE tbl_pendingaccounts
+        SET チケット状態 = %s
+        WHERE 会計ID = %s
+    """, [(a.ticket_status, a.account_id) for a in assignments])
+    cursor.executemany("""
+        DELETE FROM tbl_assignmenthistory
+        WHERE 会計ID = %s AND スタッフID = %s AND 差戻時間 IS NULL
+        ORDER BY 割り当てID DESC
+        LIMIT 1
+    """, [(a.account_id, a.staff_id) for a in assignments])
+    cursor.executemany("""
+        UPDATE tbl_staff
+        SET ステータス = '在席', 最終割り当て時間 = %s
+        WHERE スタッフID = %s
+    """, [(a.staff[4], a.staff_id) for a in assignments])
@@ -0,0 +1,158 @@
+# src/core/assignment_trigger.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import asyncio
+import configparser
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+import requests
+
+from src.utils.logger import LoggerFactory
+from src.utils.local_server import AUTH_TOKEN, LocalEventServer, load_server_config
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('assignment_trigger')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# タスク割り当てを起動する理由
+REASON_NEW_ACCOUNT = 'new_pending_account'   # チケット番号付きの会計データが登録された
+REASON_STAFF_STATUS = 'staff_status'          # スタッフの在席状態が変わった
+REASON_REVERTED = 'reverted'                  # 請求チケットが差し戻しされた
+REASON_SWEEP = 'sweep'                        # 定期的な全体チェック（取りこぼし対策）
+
+# 差し戻しのステータスID
+STATUS_REVERTED = '262863'
+
+# 子プロセスからの通知のタイムアウト（秒）
+NOTIFY_TIMEOUT = 2
+
+
+class AssignmentTrigger:
+    """
+    タスク割り当ての起動要求を集約する
+
+    notify() はどのスレッドからでも呼び出せる。割り当て処理の実行中に届いた要求は
+    まとめられ、処理完了後の wait() で一度に返される。
+    """
+
+    def __init__(self):
+        self._reasons: Set[str] = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """起動要求を待つイベントループを設定する（ループ上から呼び出すこと）"""
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    @property
+    def is_bound(self) -> bool:
+        return self._loop is not None
+
+    def notify(self, reason: str):
+        """割り当て処理の起動を要求する"""
+        with self._lock:
+            self._reasons.add(reason)
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> Set[str]:
+        """
+        起動要求を待ち、溜まっていた理由をまとめて返す
+
+        Args:
+            timeout: 最大待機時間（秒）。要求がなければ空集合を返す
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        with self._lock:
+            reasons, self._reasons = self._reasons, set()
+        return reasons
+
+
+_trigger = AssignmentTrigger()
+
+
+def get_assignment_trigger() -> AssignmentTrigger:
+    """プロセス内で共有するトリガーを取得する"""
+    return _trigger
+
+
+def notify_assignment(reason: str):
+    """
+    タスク割り当ての起動を要求する
+
+    オーケストレーターと同じプロセスであれば直接通知し、
+    子プロセス（subprocess モードの取り込み処理）からはイベント受信サーバー経由で通知する。
+    通知に失敗しても定期チェックで拾われるため、例外は送出しない。
+    """
+    if _trigger.is_bound:
+        _trigger.notify(reason)
+        return
+
+    server_config = load_server_config()
+    if not server_config['enabled']:
+        return
+    url = f"http://127.0.0.1:{server_config['port']}/events/assignment"
+    params = {'token': server_config['token']} if server_config['token'] else None
+    try:
+        requests.post(url, json={'reason': reason}, params=params, timeout=NOTIFY_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"タスク割り当ての起動通知を送信できませんでした: {e}")
+
+
+def classify_backlog_webhook(payload: Dict[str, Any], config: configparser.ConfigParser) -> Optional[str]:
+    """
+    Backlogのwebhookの内容から割り当て処理の起動理由を判定する
+
+    Returns:
+        str: 起動理由（割り当てに関係しない通知の場合None）
+    """
+    project_id = str((payload.get('project') or {}).get('id', ''))
+    content = payload.get('content') or {}
+
+    if project_id == config['backlog']['staff_project_id']:
+        return REASON_STAFF_STATUS
+
+    if project_id == config['backlog']['billing_project_id']:
+        for change in content.get('changes') or []:
+            if change.get('field') == 'status' and str(change.get('new_value')) == STATUS_REVERTED:
+                return REASON_REVERTED
+        if str((content.get('status') or {}).get('id', '')) == STATUS_REVERTED:
+            return REASON_REVERTED
+
+    return None
+
+
+def register_routes(server: LocalEventServer, config: configparser.ConfigParser):
+    """イベント受信サーバーにタスク割り当て用のルートを登録する"""
+
+    def handle_assignment_event(body: Dict[str, Any], query: Dict[str, str]) -> Tuple[int, Any]:
+        reason = body.get('reason') or REASON_NEW_ACCOUNT
+        _trigger.notify(reason)
+        return 202, {'accepted': reason}
+
+    def handle_backlog_webhook(body: Dict[str, Any], query: Dict[str, str]) -> Tuple[int, Any]:
+        reason = classify_backlog_webhook(body, config)
+        if reason:
+            logger.info(f"Backlogのwebhookを受信しました: {reason} (課題 {(body.get('content') or {}).get('key_id', '-')})")
+            _trigger.notify(reason)
+        return 200, {'accepted': reason}
+
+    server.add_route('POST', '/events/assignment', handle_assignment_event)
+    # 割り当て処理を起動できるため、外部からのwebhookは token の一致を必須とする
+    server.add_route('POST', '/backlog/webhook', handle_backlog_webhook, auth=AUTH_TOKEN)
+    if not server.token:
+        logger.warning("[event_server] token が未設定のため、Backlogのwebhook（POST /backlog/webhook）は受け付けません。"
+                       "在席変更・差し戻しは定期チェックで反映されます")
@@ -0,0 +1,295 @@
+# src/core/backlog_issue_pipeline.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from mysql.connector import Error
+
+from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.utils.db_pool import get_db_pool
+from src.utils.backlog_client import get_backlog_client
+from src.utils.backlog_metadata import get_metadata_cache
+from src.utils.spool import DEFAULT_MAX_ATTEMPTS, SPOOL_DIR, SpoolingWorker
+from src.core import medical_data_inserter
+from src.core.assignment_trigger import REASON_NEW_ACCOUNT, notify_assignment
+from src.core.patient_trace import STAGE_TICKET_CREATED, STAGE_TICKET_SAVED, get_patient_trace_store
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('backlog_issue_pipeline')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# 作成できなかったチケットを保存するスプールファイル（JSON Lines）
+DEFAULT_SPOOL_PATH = os.path.join(SPOOL_DIR, 'backlog_issues.jsonl')
+
+# パイプライン設定の既定値（[backlog] セクションで上書き可能）
+DEFAULT_QUEUE_SIZE = 100       # 作成待ちキューの上限
+DEFAULT_WORKERS = 4            # チケット作成を並行実行するスレッド数
+DEFAULT_RETRY_INTERVAL = 60    # スプールからの再試行間隔（秒）
+DEFAULT_PUT_TIMEOUT = 5        # キューが満杯の場合に投入を待つ最大時間（秒）
+FLUSH_INTERVAL = 1.0           # 書き戻し待ちがない場合に停止要求を確認する間隔（秒）
+FLUSH_BATCH_SIZE = 50          # 1回の書き込みでまとめる最大件数
+EXISTING_ISSUE_SEARCH_LIMIT = 20  # 再試行前に作成済みチケットを探す際の最大取得件数
+
+
+class BacklogIssuePipeline(SpoolingWorker):
+    """
+    Backlogチケット作成を取り込み処理から切り離すパイプライン
+
+    DB登録済みの会計データをキューで受け取り、複数スレッドでチケットを作成する
+    （レート制限は共通クライアントが管理する）。作成したチケット番号はまとめてDBへ書き戻す。
+    作成・書き戻しに失敗したジョブはスプールファイルへ保存し、一定間隔で再試行する。
+    """
+
+    thread_name = 'backlog_issue'
+    label = 'チケット作成'
+
+    def __init__(self, config: configparser.ConfigParser,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 workers: int = DEFAULT_WORKERS,
+                 retry_interval: float = DEFAULT_RETRY_INTERVAL,
+                 put_timeout: float = DEFAULT_PUT_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 spool_path: str = DEFAULT_SPOOL_PATH):
+        super().__init__(spool_path, queue_size, workers, retry_interval, put_timeout=put_timeout,
+                         max_attempts=max_attempts, stat_keys=('created', 'written'), log=logger)
+        self.config = config
+        self._results: queue.Queue = queue.Queue()
+
+    def _extra_threads(self) -> List[threading.Thread]:
+        return [threading.Thread(target=self._writer, name='backlog_issue_writer', daemon=True)]
+
+    def start(self):
+        """ワーカー・書き込み・再試行の各スレッドを開始する"""
+        if self._threads:
+            return
+        self._start_threads()
+        logger.info(f"Backlogチケット作成パイプラインを開始しました (ワーカー {self.workers}件, キュー上限 {self._jobs.maxsize}件)")
+
+    def submit(self, hospital_info: Dict[str, Any], account_info: Dict[str, Any]) -> bool:
+        """
+        チケット作成ジョブを投入する
+
+        キューが満杯の場合は put_timeout 秒まで待機し（バックプレッシャー）、
+        それでも空かなければスプールへ保存して後で再試行する。
+
+        Returns:
+            bool: キューに投入できた場合True（スプールへ回した場合False）
+        """
+        job = {'hospital_info': hospital_info, 'account_info': account_info, 'attempts': 0}
+        self._count('submitted')
+        return self._enqueue(job)
+
+    def _describe(self, job: Dict[str, Any]) -> str:
+        return f"会計ID {job['account_info']['会計ID']}"
+
+    def _is_exhausted(self, job: Dict[str, Any]) -> bool:
+        # チケット作成済みで番号の書き戻しだけが残っているジョブは上限なく再試行する
+        return not job.get('issue_key') and super()._is_exhausted(job)
+
+    def _handle(self, job: Dict[str, Any]):
+        """ジョブのチケットを作成する"""
+        account_id = job['account_info']['会計ID']
+
+        # チケット作成済みで番号の書き戻しだけが残っているジョブ
+        if job.get('issue_key'):
+            self._results.put((account_id, job['issue_key'], job))
+            return
+
+        if job['attempts'] > 0:
+            existing = self._find_existing_issue_key(job)
+            if existing:
+                logger.info(f"会計ID {account_id} のチケットは作成済みのため再作成しません: {existing}")
+                self._results.put((account_id, existing, job))
+                return
+
+        retrying = job['attempts'] > 0
+        job['attempts'] += 1
+        params = medical_data_inserter.build_backlog_issue_params(
+            self.config, job['hospital_info'], job['account_info'])
+        if params is None:
+            self._fail(job, "チケット作成用のメタデータを取得できませんでした")
+            return
+
+        if retrying:
+            # 前回の試行で応答が届かなかっただけで、Backlog側では作成済みの可能性がある
+            try:
+                existing = self._find_backlog_issue_key(params, job['account_info'])
+            except requests.exceptions.RequestException as e:
+                self._fail(job, f"作成済みチケットを確認できませんでした: {e}")
+                return
+            if existing:
+                logger.info(f"会計ID {account_id} のチケットはBacklogに作成済みのため再作成しません: {existing}")
+                job['issue_key'] = existing
+                self._results.put((account_id, existing, job))
+                return
+
+        try:
+            issue = get_backlog_client(self.config).create_issue(params)
+        except requests.exceptions.RequestException as e:
+            # 種別やカスタムフィールドの変更で失敗した可能性があるため、次回は再取得させる
+            get_metadata_cache().invalidate_project(self.config['backlog']['space_name'],
+                                                    self.config['backlog']['billing_project_id'])
+            self._fail(job, f"Backlog APIエラー: {e}")
+            return
+
+        self._count('created')
+        job['issue_key'] = issue['issueKey']
+        logger.info(f"Backlogチケットを作成しました: {issue['issueKey']} (会計ID {account_id})")
+        get_patient_trace_store().record_account(account_id, STAGE_TICKET_CREATED, ticket_number=issue['issueKey'])
+        self._results.put((account_id, issue['issueKey'], job))
+
+    def _find_existing_issue_key(self, job: Dict[str, Any]) -> Optional[str]:
+        """再試行前に、前回の試行でチケットが作成・保存されていないかを確認する"""
+        account_id = job['account_info']['会計ID']
+        try:
+            with get_db_pool().connection('backlog_issue_pipeline') as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute("""
+                        SELECT Backlogチケット番号
+                        FROM tbl_pendingaccounts
+                        WHERE 会計ID = %s
+                    """, (account_id,))
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+        except Error as e:
+            logger.warning(f"会計ID {account_id} のチケット番号を確認できませんでした: {e}")
+            return None
+        return row[0] if row and row[0] else None
+
+    def _find_backlog_issue_key(self, params: Dict[str, Any], account_info: Dict[str, Any]) -> Optional[str]:
+        """
+        同じ会計データのチケットがBacklogに作成済みであれば課題キーを返す
+
+        件名（病院名・患者ID）で検索し、説明文の取得時間が一致するものを同じ会計データとみなす。
+
+        Raises:
+            requests.exceptions.RequestException: 検索に失敗した場合
+        """
+        created = datetime.strptime(account_info['作成時間'], "%Y-%m-%d %H:%M:%S")
+        issues = get_backlog_client(self.config).get_issues({
+            "projectId[]": params['projectId'],
+            "keyword": params['summary'],
+            # createdSince は日付単位のため、タイムゾーン差を考慮して1日分さかのぼる
+            "createdSince": (created - timedelta(days=1)).strftime('%Y-%m-%d'),
+            "sort": "created",
+            "order": "desc",
+        }, max_items=EXISTING_ISSUE_SEARCH_LIMIT)
+        marker = f"取得時間: {account_info['作成時間']}"
+        for issue in issues:
+            if issue.get('summary') == params['summary'] and marker in (issue.get('description') or ''):
+                return issue['issueKey']
+        return None
+
+    def _fail(self, job: Dict[str, Any], reason: str):
+        self._count('failed')
+        logger.error(f"Backlogチケット作成に失敗しました（{job['attempts']}回目）: "
+                     f"会計ID {job['account_info']['会計ID']} - {reason}")
+        self._spool(job)
+
+    def _writer(self):
+        """作成済みチケット番号をDBへ書き戻す（その時点で溜まっている分はまとめて書き込む）"""
+        while not self._stop.is_set() or not self._results.empty():
+            try:
+                batch: List[Tuple[Any, str, Dict[str, Any]]] = [self._results.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < FLUSH_BATCH_SIZE:
+                try:
+                    batch.append(self._results.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[Any, str, Dict[str, Any]]]):
+        written = False
+        try:
+            with get_db_pool().connection('backlog_issue_pipeline') as connection:
+                written = medical_data_inserter.update_backlog_ticket_numbers(
+                    connection, [(account_id, issue_key) for account_id, issue_key, _ in batch])
+        except Error as e:
+            logger.error(f"チケット番号の書き戻し用のDB接続に失敗しました: {e}")
+
+        if written:
+            self._count('written', len(batch))
+            logger.debug(f"チケット番号を {len(batch)}件 まとめて保存しました")
+            trace_store = get_patient_trace_store()
+            for account_id, issue_key, _ in batch:
+                trace_store.record_account(account_id, STAGE_TICKET_SAVED, ticket_number=issue_key)
+            # チケット番号が揃った会計データは割り当て可能になるため、すぐに割り当てを起動する
+            notify_assignment(REASON_NEW_ACCOUNT)
+        else:
+            # チケットは作成済みなので、番号の書き戻しだけを再試行させる
+            for _, _, job in batch:
+                self._spool(job)
+
+        for _ in batch:
+            self._results.task_done()
+
+    def drain(self):
+        """投入済みのジョブとチケット番号の書き戻しが完了するまで待機する"""
+        self._jobs.join()
+        self._results.join()
+
+    def close(self):
+        """残りのジョブを処理してからスレッドを停止する"""
+        if not self._threads:
+            return
+        self.drain()
+        self._stop_threads()
+        stats = self.get_stats()
+        logger.info(f"Backlogチケット作成パイプラインを停止しました (作成 {stats['created']}件, "
+                    f"失敗 {stats['failed']}件, スプール {stats['spooled']}件)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """パイプラインのメトリクスを返す"""
+        stats = super().get_stats()
+        stats['pending_writes'] = self._results.qsize()
+        return stats
+
+
+_pipeline: Optional[BacklogIssuePipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_backlog_issue_pipeline(config: Optional[configparser.ConfigParser] = None) -> BacklogIssuePipeline:
+    """プロセス内で共有するチケット作成パイプラインを取得する（初回呼び出しで開始する）"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            if config is None:
+                config = configparser.ConfigParser()
+                config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+            section = config['backlog']
+            _pipeline = BacklogIssuePipeline(
+                config,
+                queue_size=section.getint('issue_queue_size', fallback=DEFAULT_QUEUE_SIZE),
+                workers=max(1, section.getint('issue_workers', fallback=DEFAULT_WORKERS)),
+                retry_interval=section.getfloat('issue_retry_interval', fallback=DEFAULT_RETRY_INTERVAL),
+                max_attempts=max(1, section.getint('issue_max_attempts', fallback=DEFAULT_MAX_ATTEMPTS)),
+            )
+            _pipeline.start()
+            get_metrics_registry().register_collector('backlog_issue_pipeline', _pipeline.get_stats)
+        return _pipeline
+
+
+def shutdown_backlog_issue_pipeline():
+    """共有パイプラインを停止する（残りのジョブは処理してから停止する）"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.close()
+            _pipeline = None
@@ -8,7 +8,13 @@ sys.path.append(project_root)
 
 # プロジェクト固有のインポート
 from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.core.hospital_registry import get_hospital_registry
+from src.core.ingestion_service import get_ingestion_service
+from src.core.patient_trace import start_patient_traces
+from src.core.patient_snapshot import get_patient_snapshot_cache
 from src.utils.login_status import LoginStatus
+from src.utils.desktop_input import get_desktop_input_lock
 
 # 標準ライブラリとサードパーティのインポート
 import asyncio
@@ -29,6 +35,10 @@ import traceback
 # ロガーの初期化
 logger = LoggerFactory.setup_logger('clinics_monitor')
 
+# データ抽出（画面からの読み取り）の所要時間
+EXTRACT_SECONDS = get_metrics_registry().histogram(
+    'monibot_extract_seconds', '電子カルテ画面からの患者データ抽出の所要時間', ('system', 'hospital'))
+
 # パス定義
 LOG_DIR = os.path.join(project_root, 'log')
 DEBUG_DIR = os.path.join(LOG_DIR, 'debug')
@@ -260,50 +270,18 @@ def load_config():
 def get_hospital_info(config):
     """Backlogから医療機関情報を取得する"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['hospital_project_id']
 
-        logger.info(f"Backlog APIリクエストを開始します")
+        logger.info(f"医療機関レジストリから医療機関情報を取得します")
         logger.info(f"プロジェクトID: {project_id}")
 
-        # プロジェクト情報を取得
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        project_endpoint = f"{base_url}/projects/{project_id}"
-        
-        params = {
-            "apiKey": api_key
-        }
-
-        project_response = requests.get(project_endpoint, params=params)
-        
-        if project_response.status_code != 200:
-            logger.error(f"プロジェクト情報の取得に失敗: ステータスコード {project_response.status_code}")
-            logger.error(f"エラー内容: {project_response.text}")
-            return []
-            
-        project_info = project_response.json()
-        logger.info(f"プロジェクト名: {project_info.get('name', '不明')}")
-
-        # 課題一覧を取得
-        issues_endpoint = f"{base_url}/issues"
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
-
-        response = requests.get(issues_endpoint, params=issue_params)
-        
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
-            logger.error(f"エラー内容: {response.text}")
+        # 医療機関レジストリからクリニクスの課題を取得（Backlogへの問い合わせは起動時にまとめて1回）
+        try:
+            issues = get_hospital_registry(config).get_issues('クリニクス')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return []
-
-        issues = response.json()
-        logger.info(f"取得した全課題数: {len(issues)}")
+        logger.info(f"対象システムの課題数: {len(issues)}")
 
         # グループ情報の集計用
         team_counts = {}
@@ -373,7 +351,7 @@ def get_hospital_info(config):
             if team:  # グループ未設定は表示しない
                 logger.info(f"- {team}: {count}件")
 
-        logger.info(f"取得した全課題数: {len(issues)}")
+        logger.info(f"対象システムの課題数: {len(issues)}")
         logger.info(f"クリニクス・ポーリング有効な医療機関数: {filtered_count}")
         
         if not all_hospitals:
@@ -395,18 +373,21 @@ def get_hospital_info(config):
 async def navigate_and_login(page, hospital_info, index, user_info, login_status):
     """ログインとページ遷移を実行"""
     try:
-        # 証明書選択スレッドの準備
-        cert_thread = threading.Thread(
-            target=select_certificate,
-            args=(hospital_info['cert_order'],)
-        )
-        cert_thread.start()
+        # 証明書選択ダイアログの表示から選択完了までは、他の監視と画面操作が競合しないようロックする
+        async with get_desktop_input_lock():
+            # 証明書選択スレッドの準備
+            cert_thread = threading.Thread(
+                target=select_certificate,
+                args=(hospital_info['cert_order'],)
+            )
+            cert_thread.start()
 
-        logger.info(f"{hospital_info['hospital_name']}: ページにアクセスしています...")
-        await page.goto("https://karte.medley.life/d", timeout=60000)
-        
-        # 証明書選択の完了を待つ
-        cert_thread.join()
+            logger.info(f"{hospital_info['hospital_name']}: ページにアクセスしています...")
+            await page.goto("https://karte.medley.life/d", timeout=60000)
+
+            # 証明書選択の完了を待つ
+            # join はブロッキングのため、他の監視を止めないようスレッドで待機する
+            await asyncio.get_event_loop().run_in_executor(None, cert_thread.join)
         await page.wait_for_load_state("networkidle", timeout=30000)
         logger.info(f"{hospital_info['hospital_name']}: 証明書選択完了しました")
 
@@ -646,6 +627,20 @@ async def process_and_insert_data(records, user_info):
             "patients": records
         }
 
+        # 前回の取り込みから変化のない患者は送信しない（定期的に全件を再送する）
+        snapshot = get_patient_snapshot_cache()
+        snapshot_key = (json_data['system_type'], json_data['issue_key'])
+        json_data['patients'] = snapshot.diff(snapshot_key, records)
+        if not json_data['patients']:
+            return
+
+        # 常駐取り込みサービスが有効な場合はプロセス内で処理する
+        ingestion_service = get_ingestion_service()
+        if ingestion_service.is_inprocess():
+            if await ingestion_service.process_patient_data(json_data):
+                snapshot.commit(snapshot_key, records, json_data['patients'])
+            return
+
         script_dir = os.path.dirname(os.path.abspath(__file__))
         inserter_path = os.path.join(script_dir, "medical_data_inserter.py")
         
@@ -690,6 +685,7 @@ async def process_and_insert_data(records, user_info):
             decoded_stderr = safe_decode(stderr)
             
             if process.returncode == 0:
+                snapshot.commit(snapshot_key, records, json_data['patients'])
                 if decoded_stdout.strip():
                     logger.info(f"データベース挿入成功: {decoded_stdout}")
                 logger.debug("データベース挿入が完了しました")
@@ -710,23 +706,48 @@ async def process_and_insert_data(records, user_info):
         logger.error(f"医療機関 {hospital_name}: データ処理中にエラー: {str(e)}")
         logger.error(f"詳細なエラー情報: {traceback.format_exc()}")
 
-async def periodic_extract_all(pages, interval, user_infos):
-    """定期的に全てのページから患者データを抽出し、データベースに挿入する"""
+async def monitor_hospital(page, index, user_info, interval, initial_delay=0):
+    """1医療機関のページを一定間隔で監視し、患者データをデータベースに挿入する"""
+    if initial_delay:
+        await asyncio.sleep(initial_delay)
+
+    loop = asyncio.get_running_loop()
     while True:
-        for index, (page, user_info) in enumerate(zip(pages, user_infos)):
-            try:
-                patient_data = await extract_patient_data(page, user_info)
-                
-                if patient_data:
-                    await process_and_insert_data(patient_data, user_info)
-            except Exception as e:
-                logger.error(f"ユーザー {index + 1} のデータ抽出中にエラー: {e}")
+        started = loop.time()
+        try:
+            with EXTRACT_SECONDS.time(system='クリニクス', hospital=user_info.get('hospital_name', '')):
+                patient_data = start_patient_traces(await extract_patient_data(page, user_info))
             
-            try:
-                await asyncio.sleep(interval)
-            except asyncio.CancelledError:
-                logger.debug("periodic_extract_allがキャンセルされました")
-                break
+            if patient_data:
+                await process_and_insert_data(patient_data, user_info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ユーザー {index + 1} のデータ抽出中にエラー: {e}")
+
+        # 処理時間を差し引いて、医療機関数に関係なく一定の間隔で監視する
+        elapsed = loop.time() - started
+        await asyncio.sleep(max(0, interval - elapsed))
+
+async def periodic_extract_all(pages, interval, user_infos):
+    """全ての医療機関ページを並行して定期監視し、データベースに挿入する"""
+    # 医療機関ごとに監視タスクを作成（開始時刻をずらして負荷を平準化）
+    count = max(1, len(pages))
+    tasks = [
+        asyncio.create_task(
+            monitor_hospital(page, index, user_info, interval, initial_delay=interval * index / count)
+        )
+        for index, (page, user_info) in enumerate(zip(pages, user_infos))
+    ]
+
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        logger.debug("periodic_extract_allがキャンセルされました")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 async def run(playwright, config, shutdown_event, login_status, hospitals):
     """メインの処理を実行する（非同期関数）"""
@@ -870,7 +891,8 @@ async def main_with_shutdown(shutdown_event, login_status):
             return
 
         # 医療機関情報を取得
-        hospitals = get_hospital_info(config)
+        # Backlog APIは同期呼び出しのため、イベントループを止めないようスレッドで実行する
+        hospitals = await asyncio.get_event_loop().run_in_executor(None, get_hospital_info, config)
         if not hospitals:
             logger.info("ポーリング対象の医療機関がないため、モニタリングをスキップします")
             # ログイン状態を完了に設定（医療機関数0として）
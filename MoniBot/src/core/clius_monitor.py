@@ -8,10 +8,17 @@ sys.path.append(project_root)
 
 # プロジェクト固有のインポート
 from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.utils.backlog_client import get_backlog_client
+from src.core.hospital_registry import get_hospital_registry
+from src.core.ingestion_service import get_ingestion_service
+from src.core.patient_trace import start_patient_traces
+from src.core.patient_snapshot import get_patient_snapshot_cache
 from src.utils.login_status import LoginStatus
 
 # 標準ライブラリとサードパーティのインポート
 import asyncio
+import functools
 from playwright.async_api import async_playwright, TimeoutError
 import configparser
 from datetime import datetime
@@ -30,6 +37,10 @@ from typing import List, Dict, Any
 # ロガーの初期化
 logger = LoggerFactory.setup_logger('clius_monitor')
 
+# データ抽出（画面からの読み取り）の所要時間
+EXTRACT_SECONDS = get_metrics_registry().histogram(
+    'monibot_extract_seconds', '電子カルテ画面からの患者データ抽出の所要時間', ('system', 'hospital'))
+
 # パス定義
 LOG_DIR = os.path.join(project_root, 'log')
 DEBUG_DIR = os.path.join(LOG_DIR, 'debug')
@@ -85,50 +96,18 @@ def get_custom_field_value(custom_fields: List[Dict[str, Any]], name: str) -> st
 def get_hospital_info(config):
     """Backlogから特定条件の医療機関情報を取得する"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['hospital_project_id']
 
-        logger.info(f"Backlog APIリクエストを開始します")
+        logger.info(f"医療機関レジストリから医療機関情報を取得します")
         logger.info(f"プロジェクトID: {project_id}")
 
-        # プロジェクト情報を取得
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        project_endpoint = f"{base_url}/projects/{project_id}"
-        
-        params = {
-            "apiKey": api_key
-        }
-
-        project_response = requests.get(project_endpoint, params=params)
-        
-        if project_response.status_code != 200:
-            logger.error(f"プロジェクト情報の取得に失敗: ステータスコード {project_response.status_code}")
-            logger.error(f"エラー内容: {project_response.text}")
-            return []
-            
-        project_info = project_response.json()
-        logger.info(f"プロジェクト名: {project_info.get('name', '不明')}")
-
-        # 課題一覧を取得
-        issues_endpoint = f"{base_url}/issues"
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
-
-        response = requests.get(issues_endpoint, params=issue_params)
-        
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
-            logger.error(f"エラー内容: {response.text}")
+        # 医療機関レジストリからCLIUSの課題を取得（Backlogへの問い合わせは起動時にまとめて1回）
+        try:
+            issues = get_hospital_registry(config).get_issues('CLIUS')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return []
-
-        issues = response.json()
-        logger.info(f"取得した全課題数: {len(issues)}")
+        logger.info(f"対象システムの課題数: {len(issues)}")
 
         # グループ情報の集計用
         team_counts = {}
@@ -186,7 +165,7 @@ def get_hospital_info(config):
             if team:  # グループ未設定は表示しない
                 logger.info(f"- {team}: {count}件")
 
-        logger.info(f"取得した全課題数: {len(issues)}")
+        logger.info(f"対象システムの課題数: {len(issues)}")
         logger.info(f"CLIUS・ポーリング有効な医療機関数: {filtered_count}")
         
         if not all_hospitals:
@@ -677,7 +656,8 @@ async def extract_patient_data(page, index):
         extracted_records = results.get('records', [])
         if extracted_records:
             for record in extracted_records:
-                logger.debug(f"抽出データ - ID: {record['patient_id']}, 診療科: {record['department']}, 時間: {record['end_time']}")
+                logger.debug("抽出データ - ID: %s, 診療科: %s, 時間: %s",
+                             record['patient_id'], record['department'], record['end_time'])
         else:
             logger.debug(f"ユーザー {index + 1}: OASIS会計＆算定待ちのデータはありません")
 
@@ -688,58 +668,95 @@ async def extract_patient_data(page, index):
         logger.error(traceback.format_exc())
         return []
 
-async def periodic_extract_all(pages, interval, user_infos):
-    '''定期的に全てのページから患者データを抽出し、medical_data_inserter.pyを呼び出してデータベースに挿入する'''
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    inserter_path = os.path.join(script_dir, "medical_data_inserter.py")
-    
+async def monitor_hospital(page, index, user_info, interval, ingestion_service, inserter_path, initial_delay=0):
+    '''1医療機関のページを一定間隔で監視し、患者データをデータベースに挿入する'''
+    if initial_delay:
+        await asyncio.sleep(initial_delay)
+
+    loop = asyncio.get_running_loop()
     while True:
-        for index, (page, user_info) in enumerate(zip(pages, user_infos)):
-            try:
-                logger.debug(f"periodic_extract_all - user_info全体: {user_info}")
-                patient_data = await extract_patient_data(page, index)
+        started = loop.time()
+        try:
+            logger.debug(f"monitor_hospital - user_info全体: {user_info}")
+            with EXTRACT_SECONDS.time(system='CLIUS', hospital=user_info.get('医療機関名', '')):
+                patient_data = start_patient_traces(await extract_patient_data(page, index))
+            
+            if patient_data:  # データがある場合のみ処理を実行
+                # issue_keyを取得（login_infoまたは直接user_infoから）
+                issue_key = (user_info.get('login_info', {}).get('issue_key') or 
+                           user_info.get('issue_key'))
                 
-                if patient_data:  # データがある場合のみ処理を実行
-                    # issue_keyを取得（login_infoまたは直接user_infoから）
-                    issue_key = (user_info.get('login_info', {}).get('issue_key') or 
-                               user_info.get('issue_key'))
-                    
-                    if not issue_key:
-                        logger.error(f"課題キーが見つかりません: {user_info.get('医療機関名')}")
-                        continue
-
-                    # 患者IDのリストを取得
-                    patient_ids = [p["patient_id"] for p in patient_data]
-
-                    # ログのフォーマットを統一して情報を整理
-                    # logger.info(f"患者データ検出: 病院名={user_info.get('医療機関名')}, "
-                    #             f"チーム={user_info.get('team')}, データ件数={len(patient_data)}, "
-                    #             f"患者ID={patient_ids}, Backlogチケット={issue_key}")
-
-                    json_data = json.dumps({
+                if not issue_key:
+                    logger.error(f"課題キーが見つかりません: {user_info.get('医療機関名')}")
+                else:
+                    json_data = {
                         "hospital_name": user_info.get('医療機関名', 'Unknown Hospital'),
                         "patients": patient_data,
                         "team": user_info.get('team'),
                         "system_type": user_info.get('システム種別', 'CLIUS'),
                         "issue_key": issue_key
-                    })
+                    }
 
-                    try:
-                        result = subprocess.run(
-                            [sys.executable, inserter_path],
-                            input=json_data,
-                            text=True,
-                            stdout=sys.stdout,
-                            stderr=sys.stderr,
-                            check=True
-                        )
-                    except subprocess.CalledProcessError as e:
-                        logger.error(f"データベース挿入エラー: {e}")
-            
-            except Exception as e:
-                logger.error(f"ユーザー {index + 1} のデータ抽出中にエラー: {e}")
+                    # 前回の取り込みから変化のない患者は送信しない（定期的に全件を再送する）
+                    snapshot = get_patient_snapshot_cache()
+                    snapshot_key = (json_data['system_type'], issue_key)
+                    json_data['patients'] = snapshot.diff(snapshot_key, patient_data)
+
+                    if not json_data['patients']:
+                        logger.debug(f"{json_data['hospital_name']}: 会計待ちに変化がないため取り込みをスキップします")
+                    # 常駐取り込みサービスが有効な場合はプロセス内で処理する
+                    elif ingestion_service.is_inprocess():
+                        if await ingestion_service.process_patient_data(json_data):
+                            snapshot.commit(snapshot_key, patient_data, json_data['patients'])
+                    else:
+                        try:
+                            # 子プロセスの完了待ちでイベントループを止めないようスレッドで実行する
+                            result = await asyncio.get_event_loop().run_in_executor(None, functools.partial(
+                                subprocess.run,
+                                [sys.executable, inserter_path],
+                                input=json.dumps(json_data),
+                                text=True,
+                                stdout=sys.stdout,
+                                stderr=sys.stderr,
+                                check=True
+                            ))
+                            snapshot.commit(snapshot_key, patient_data, json_data['patients'])
+                        except subprocess.CalledProcessError as e:
+                            logger.error(f"データベース挿入エラー: {e}")
         
-        await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ユーザー {index + 1} のデータ抽出中にエラー: {e}")
+
+        # 処理時間を差し引いて、医療機関数に関係なく一定の間隔で監視する
+        elapsed = loop.time() - started
+        if elapsed > interval:
+            logger.debug(f"ユーザー {index + 1}: 監視処理が間隔を超過しました ({elapsed:.1f}秒)")
+        await asyncio.sleep(max(0, interval - elapsed))
+
+async def periodic_extract_all(pages, interval, user_infos):
+    '''全ての医療機関ページを並行して定期監視し、患者データをデータベースに挿入する'''
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    inserter_path = os.path.join(script_dir, "medical_data_inserter.py")
+    ingestion_service = get_ingestion_service()
+
+    # 医療機関ごとに監視タスクを作成（開始時刻をずらして負荷を平準化）
+    count = max(1, len(pages))
+    tasks = [
+        asyncio.create_task(
+            monitor_hospital(page, index, user_info, interval, ingestion_service, inserter_path,
+                             initial_delay=interval * index / count)
+        )
+        for index, (page, user_info) in enumerate(zip(pages, user_infos))
+    ]
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 async def wait_for_page_load(page, timeout=30000):
@@ -1049,7 +1066,8 @@ async def main_with_shutdown(shutdown_event, login_status):
             return
 
         # 医療機関情報を取得
-        hospitals = get_hospital_info(config)
+        # Backlog APIは同期呼び出しのため、イベントループを止めないようスレッドで実行する
+        hospitals = await asyncio.get_event_loop().run_in_executor(None, get_hospital_info, config)
         if not hospitals:
             logger.info("ポーリング対象の医療機関がないため、モニタリングをスキップします")
             # 医療機関数0として処理を完了
@@ -1125,16 +1143,9 @@ async def main():
             return
 
         # プロジェクト一覧を取得して確認
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
-        projects_url = f"https://{space_name}.backlog.com/api/v2/projects"
-        params = {"apiKey": api_key}
-        
         try:
             logger.info("アクセス可能なプロジェクト一覧を取得中...")
-            response = requests.get(projects_url, params=params)
-            response.raise_for_status()
-            projects = response.json()
+            projects = get_backlog_client(config).get_projects()
             
             logger.info("アクセス可能なプロジェクト:")
             for project in projects:
@@ -8,7 +8,13 @@ sys.path.append(project_root)
 
 # プロジェクト固有のインポート
 from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.core.hospital_registry import get_hospital_registry
+from src.core.ingestion_service import get_ingestion_service
+from src.core.patient_trace import start_patient_traces
+from src.core.patient_snapshot import get_patient_snapshot_cache
 from src.utils.login_status import LoginStatus
+from src.utils.desktop_input import get_desktop_input_lock
 
 # 標準ライブラリとサードパーティのインポート
 import asyncio
@@ -30,6 +36,10 @@ from typing import List, Dict, Any
 # ロガーの初期化
 logger = LoggerFactory.setup_logger('digikar_monitor')
 
+# データ抽出（画面からの読み取り）の所要時間
+EXTRACT_SECONDS = get_metrics_registry().histogram(
+    'monibot_extract_seconds', '電子カルテ画面からの患者データ抽出の所要時間', ('system', 'hospital'))
+
 # パス定義
 LOG_DIR = os.path.join(project_root, 'log')
 DEBUG_DIR = os.path.join(LOG_DIR, 'debug')
@@ -91,50 +101,18 @@ def get_custom_field_value(custom_fields: List[Dict[str, Any]], name: str) -> st
 def get_hospital_info(config):
     """Backlogから特定条件の医療機関情報を取得する"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['hospital_project_id']
 
-        logger.info(f"Backlog APIリクエストを開始します")
+        logger.info(f"医療機関レジストリから医療機関情報を取得します")
         logger.info(f"プロジェクトID: {project_id}")
 
-        # プロジェクト情報を取得
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        project_endpoint = f"{base_url}/projects/{project_id}"
-        
-        params = {
-            "apiKey": api_key
-        }
-
-        project_response = requests.get(project_endpoint, params=params)
-        
-        if project_response.status_code != 200:
-            logger.error(f"プロジェクト情報の取得に失敗: ステータスコード {project_response.status_code}")
-            logger.error(f"エラー内容: {project_response.text}")
-            return []
-            
-        project_info = project_response.json()
-        logger.info(f"プロジェクト名: {project_info.get('name', '不明')}")
-
-        # 課題一覧を取得
-        issues_endpoint = f"{base_url}/issues"
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
-
-        response = requests.get(issues_endpoint, params=issue_params)
-        
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
-            logger.error(f"エラー内容: {response.text}")
+        # 医療機関レジストリからデジカルの課題を取得（Backlogへの問い合わせは起動時にまとめて1回）
+        try:
+            issues = get_hospital_registry(config).get_issues('デジカル')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return []
-
-        issues = response.json()
-        logger.info(f"取得した全課題数: {len(issues)}")
+        logger.info(f"対象システムの課題数: {len(issues)}")
 
         # グループ情報の集計用
         team_counts = {}
@@ -204,7 +182,7 @@ def get_hospital_info(config):
             if team:  # グループ未設定は表示しない
                 logger.info(f"- {team}: {count}件")
 
-        logger.info(f"取得した全課題数: {len(issues)}")
+        logger.info(f"対象システムの課題数: {len(issues)}")
         logger.info(f"デジカル・ポーリング有効な医療機関数: {filtered_count}")
         
         if not all_hospitals:
@@ -226,18 +204,21 @@ def get_hospital_info(config):
 async def navigate_and_login(page, hospital_info, index, user_info, login_status):
     """ログインとページ遷移を実行（XPath対応版）"""
     try:
-        # 証明書選択スレッドの準備
-        cert_thread = threading.Thread(
-            target=select_certificate,
-            args=(hospital_info['cert_order'],)
-        )
-        cert_thread.start()
-
-        logger.info(f"{hospital_info['hospital_name']}: ページにアクセスしています...")
-        await page.goto("https://digikar.jp/login", timeout=60000)
-        
-        # 証明書選択の完了を待つ
-        cert_thread.join()
+        # 証明書選択ダイアログの表示から選択完了までは、他の監視と画面操作が競合しないようロックする
+        async with get_desktop_input_lock():
+            # 証明書選択スレッドの準備
+            cert_thread = threading.Thread(
+                target=select_certificate,
+                args=(hospital_info['cert_order'],)
+            )
+            cert_thread.start()
+
+            logger.info(f"{hospital_info['hospital_name']}: ページにアクセスしています...")
+            await page.goto("https://digikar.jp/login", timeout=60000)
+
+            # 証明書選択の完了を待つ
+            # join はブロッキングのため、他の監視を止めないようスレッドで待機する
+            await asyncio.get_event_loop().run_in_executor(None, cert_thread.join)
 
         logger.info(f"{hospital_info['hospital_name']}: ログインフォームの表示を待機中...")
         await page.wait_for_selector('input.form-control.dk-form-login.dk-form-login-top', timeout=10000)
@@ -707,7 +688,7 @@ async def extract_patient_data(page, user_info):
         
         # 列マッピング情報をログ出力
         if 'columnMap' in debug_info:
-            logger.debug(f"{user_info['hospital_name']}: 列マッピング={debug_info['columnMap']}")
+            logger.debug("%s: 列マッピング=%s", user_info['hospital_name'], debug_info['columnMap'])
         
         if extracted_records:
             logger.info(f"{user_info['hospital_name']}: {len(extracted_records)}件のデータを抽出しました")
@@ -971,6 +952,20 @@ async def process_and_insert_data(records, hospital_info):
             "patients": records
         }
 
+        # 前回の取り込みから変化のない患者は送信しない（定期的に全件を再送する）
+        snapshot = get_patient_snapshot_cache()
+        snapshot_key = (json_data['system_type'], json_data['issue_key'])
+        json_data['patients'] = snapshot.diff(snapshot_key, records)
+        if not json_data['patients']:
+            return
+
+        # 常駐取り込みサービスが有効な場合はプロセス内で処理する
+        ingestion_service = get_ingestion_service()
+        if ingestion_service.is_inprocess():
+            if await ingestion_service.process_patient_data(json_data):
+                snapshot.commit(snapshot_key, records, json_data['patients'])
+            return
+
         # medical_data_inserter.pyのパスを取得
         script_dir = os.path.dirname(os.path.abspath(__file__))
         inserter_path = os.path.join(script_dir, "medical_data_inserter.py")
@@ -1018,6 +1013,7 @@ async def process_and_insert_data(records, hospital_info):
             # logger.info(f"医療機関: {json_data['hospital_name']}")
             
             if process.returncode == 0:
+                snapshot.commit(snapshot_key, records, json_data['patients'])
                 if decoded_stdout.strip():
                     logger.info(f"データベース挿入成功: {decoded_stdout}")
                 # logger.info("データベース挿入が完了しました")
@@ -1044,7 +1040,8 @@ async def periodic_extract_all(pages, interval, user_infos):
             for index, (page, user_info) in enumerate(zip(pages, user_infos)):
                 logger.debug(f"データ抽出を開始: {user_info.get('hospital_name', 'Unknown')}")
                 try:
-                    patient_data = await extract_patient_data(page, user_info)
+                    with EXTRACT_SECONDS.time(system='デジカル', hospital=user_info.get('hospital_name', '')):
+                        patient_data = start_patient_traces(await extract_patient_data(page, user_info))
                     if patient_data:
                         await process_and_insert_data(patient_data, user_info)
                 except Exception as e:
@@ -1206,7 +1203,8 @@ async def main_with_shutdown(shutdown_event, login_status):
             return
 
         # 医療機関情報を取得
-        hospitals = get_hospital_info(config)
+        # Backlog APIは同期呼び出しのため、イベントループを止めないようスレッドで実行する
+        hospitals = await asyncio.get_event_loop().run_in_executor(None, get_hospital_info, config)
         if not hospitals:
             logger.info("ポーリング対象の医療機関がないため、モニタリングをスキップします")
             # ログイン状態を完了に設定（医療機関数0として）
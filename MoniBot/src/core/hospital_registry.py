@@ -0,0 +1,116 @@
+# src/core/hospital_registry.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from src.utils.logger import LoggerFactory
+from src.utils.backlog_client import get_backlog_client
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('hospital_registry')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# 医療機関情報の再取得間隔の既定値（秒）。[setting] hospital_registry_refresh_interval で上書き可能
+DEFAULT_REFRESH_INTERVAL = 300
+
+
+class HospitalRegistry:
+    """
+    医療機関プロジェクト（hospital_project_id）の課題を一括取得し、課題種別ごとに保持する
+
+    各監視モジュールは自分のシステム種別（課題種別名）の分だけを受け取る。
+    refresh() を呼べば監視を止めずに最新の内容へ更新できる。
+    """
+
+    def __init__(self, config: configparser.ConfigParser,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.config = config
+        self.project_id = config['backlog']['hospital_project_id']
+        self.refresh_interval = refresh_interval
+        self._by_type: Dict[str, List[Dict[str, Any]]] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def fetched_at(self) -> Optional[float]:
+        """最後に取得に成功した時刻（time.time()）"""
+        return self._fetched_at
+
+    def refresh(self) -> bool:
+        """
+        Backlogから医療機関課題を再取得する
+
+        Returns:
+            bool: 取得に成功した場合True
+
+        Raises:
+            requests.exceptions.RequestException: 一度も取得できていない状態で失敗した場合
+        """
+        with self._lock:
+            try:
+                issues = get_backlog_client(self.config).get_issues({
+                    "projectId[]": self.project_id,
+                    "sort": "created",
+                    "order": "asc"
+                })
+            except requests.exceptions.RequestException as e:
+                if self._fetched_at is None:
+                    raise
+                logger.warning(f"医療機関情報の再取得に失敗したため、前回の内容を使用します: {e}")
+                return False
+
+            by_type: Dict[str, List[Dict[str, Any]]] = {}
+            for issue in issues:
+                issue_type = (issue.get('issueType') or {}).get('name')
+                if issue_type:
+                    by_type.setdefault(issue_type, []).append(issue)
+
+            self._by_type = by_type
+            self._fetched_at = time.time()
+
+        summary = ', '.join(f"{name}: {len(items)}件" for name, items in by_type.items())
+        logger.info(f"医療機関情報を取得しました (全{len(issues)}件 / {summary})")
+        return True
+
+    def get_issues(self, issue_type: str, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        指定した課題種別（システム種別）の医療機関課題を返す
+
+        Args:
+            issue_type: 課題種別名（'CLIUS', 'デジカル' など）
+            max_age: 取得からこの秒数を超えていれば再取得する（省略時は未取得の場合のみ取得）
+        """
+        if self._fetched_at is None:
+            self.refresh()
+        elif max_age is not None and time.time() - self._fetched_at > max_age:
+            self.refresh()
+        return list(self._by_type.get(issue_type, []))
+
+
+_registry: Optional[HospitalRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_hospital_registry(config: Optional[configparser.ConfigParser] = None) -> HospitalRegistry:
+    """プロセス内で共有する医療機関レジストリを取得する"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            if config is None:
+                config = configparser.ConfigParser()
+                config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+            refresh_interval = config.getint('setting', 'hospital_registry_refresh_interval',
+                                             fallback=DEFAULT_REFRESH_INTERVAL)
+            _registry = HospitalRegistry(config, refresh_interval=refresh_interval)
+        return _registry
@@ -0,0 +1,164 @@
+# src/core/ingestion_service.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import asyncio
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql.connector import Error
+
+from src.utils.logger import LoggerFactory
+from src.utils.db_pool import get_db_pool
+from src.utils.metrics import get_metrics_registry
+from src.core import medical_data_inserter
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('ingestion_service')
+
+# メトリクス（system は電子カルテの種別、hospital は医療機関名）
+_metrics = get_metrics_registry()
+INGEST_SECONDS = _metrics.histogram(
+    'monibot_ingest_seconds', '患者データの取り込み（DB登録・チケット作成の投入）の所要時間', ('system', 'hospital'))
+INGEST_QUEUE_SECONDS = _metrics.histogram(
+    'monibot_ingest_queue_seconds', '取り込みワーカーの空き待ち時間', ('system',))
+INGEST_TOTAL = _metrics.counter(
+    'monibot_ingest_total', '取り込みの実行回数', ('system', 'result'))
+INGEST_PATIENTS = _metrics.counter(
+    'monibot_ingest_patients_total', '取り込んだ患者データの件数', ('system', 'hospital'))
+
+# 取り込みモードの定義
+INSERTER_MODE_INPROCESS = 'inprocess'
+INSERTER_MODE_SUBPROCESS = 'subprocess'
+
+
+class IngestionService:
+    """
+    medical_data_inserter を常駐プロセス内で実行する取り込みサービス
+
+    設定・DB接続・HTTPセッションを使い回し、ポーリング毎のインタプリタ起動を不要にする。
+    DB接続は共有プールから借り、処理は専用の単一ワーカースレッドで直列に実行する。
+    """
+
+    def __init__(self, config_filename='config.ini'):
+        self.config_filename = config_filename
+        self._config = None
+        self._db_config = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingestion')
+        self.mode = self._load_mode()
+
+    def _load_mode(self):
+        """設定ファイルから取り込みモードを読み込む"""
+        config, _ = self._load_config()
+        mode = INSERTER_MODE_INPROCESS
+        if config is not None and config.has_option('setting', 'inserter_mode'):
+            mode = config.get('setting', 'inserter_mode').strip().lower()
+        if mode not in (INSERTER_MODE_INPROCESS, INSERTER_MODE_SUBPROCESS):
+            logger.warning(f"不明な取り込みモード '{mode}' のため '{INSERTER_MODE_INPROCESS}' を使用します")
+            mode = INSERTER_MODE_INPROCESS
+        return mode
+
+    def _load_config(self):
+        """設定を初回のみ読み込み、以降はキャッシュを返す"""
+        if self._config is None:
+            self._config, self._db_config = medical_data_inserter.load_config(self.config_filename)
+        return self._config, self._db_config
+
+    def is_inprocess(self):
+        """プロセス内モードで動作しているかを返す"""
+        return self.mode == INSERTER_MODE_INPROCESS
+
+    def process_patient_data_sync(self, data):
+        """
+        患者データを同期的に処理する
+
+        Args:
+            data: 監視モジュールが作成した医療機関・患者データ
+
+        Returns:
+            bool: すべての患者データを登録できた場合True
+        """
+        system = data.get('system_type', '')
+        hospital = data.get('hospital_name', '')
+        with INGEST_SECONDS.time(system=system, hospital=hospital):
+            success = self._process_patient_data(data)
+        INGEST_TOTAL.inc(system=system, result='success' if success else 'failure')
+        INGEST_PATIENTS.inc(len(data.get('patients', [])), system=system, hospital=hospital)
+        return success
+
+    def _process_patient_data(self, data):
+        with self._lock:
+            config, _ = self._load_config()
+            if config is None:
+                logger.error("設定ファイルが読み込めないため、データを処理できません")
+                return False
+
+            try:
+                connection = get_db_pool().get_connection('ingestion_service')
+            except Error as e:
+                logger.error(f"DB接続が確立できないため、データを処理できません: {e}")
+                return False
+
+            discard = False
+            cursor = connection.cursor(buffered=True)
+            try:
+                return medical_data_inserter.process_patient_data(connection, cursor, data, config=config)
+            except Error as e:
+                logger.error(f"データ処理中にDBエラーが発生したため接続を破棄します: {e}")
+                discard = True
+                return False
+            except Exception as e:
+                logger.error(f"データ処理中に予期せぬエラーが発生しました: {e}")
+                logger.debug(traceback.format_exc())
+                return False
+            finally:
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+                get_db_pool().release_connection(connection, discard=discard)
+
+    async def process_patient_data(self, data):
+        """患者データを非同期に処理する（イベントループをブロックしない）"""
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+
+        def run():
+            INGEST_QUEUE_SECONDS.observe(time.perf_counter() - submitted, system=data.get('system_type', ''))
+            return self.process_patient_data_sync(data)
+
+        return await loop.run_in_executor(self._executor, run)
+
+    def close(self):
+        """サービスを停止する"""
+        self._executor.shutdown(wait=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_ingestion_service():
+    """プロセス内で共有する取り込みサービスを取得する"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = IngestionService()
+            logger.info(f"取り込みサービスを初期化しました (モード: {_service.mode})")
+        return _service
+
+
+def shutdown_ingestion_service():
+    """共有取り込みサービスを停止する"""
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.close()
+            _service = None
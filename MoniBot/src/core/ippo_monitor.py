@@ -7,6 +7,7 @@ Backlogから医療機関情報を取得し、会計待ちデータを監視
 import os
 import sys
 import asyncio
+import functools
 import configparser
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import pyautogui
@@ -23,7 +24,13 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.append(project_root)
 
 from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.core.hospital_registry import get_hospital_registry
+from src.core.ingestion_service import get_ingestion_service
+from src.core.patient_trace import start_patient_traces
+from src.core.patient_snapshot import get_patient_snapshot_cache
 from src.utils.login_status import LoginStatus
+from src.utils.desktop_input import get_desktop_input_lock
 
 # ディレクトリ設定
 CONFIG_DIR = os.path.join(project_root, 'config')
@@ -33,6 +40,10 @@ SCREENSHOT_DIR = os.path.join(project_root, 'src', 'core', 'screenshots')
 # ロガー設定
 logger = LoggerFactory.setup_logger('ippo')
 
+# データ抽出（画面からの読み取り）の所要時間
+EXTRACT_SECONDS = get_metrics_registry().histogram(
+    'monibot_extract_seconds', '電子カルテ画面からの患者データ抽出の所要時間', ('system', 'hospital'))
+
 def select_certificate(cert_order: int):
     """証明書選択ダイアログを処理（十字キーで選択）"""
     try:
@@ -91,32 +102,17 @@ def get_custom_field_value(custom_fields: List[Dict[str, Any]], name: str) -> st
 def get_hospital_info(config):
     """Backlogから医歩の医療機関情報を取得する"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['hospital_project_id']
 
-        logger.info(f"Backlog APIリクエストを開始します")
+        logger.info(f"医療機関レジストリから医療機関情報を取得します")
         logger.info(f"プロジェクトID: {project_id}")
 
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        issues_endpoint = f"{base_url}/issues"
-        
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
-
-        response = requests.get(issues_endpoint, params=issue_params)
-        
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
-            logger.error(f"エラー内容: {response.text}")
+        # 医療機関レジストリから医歩の課題を取得（Backlogへの問い合わせは起動時にまとめて1回）
+        try:
+            issues = get_hospital_registry(config).get_issues('医歩')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return []
-
-        issues = response.json()
         logger.info(f"取得した課題数: {len(issues)}")
 
         hospitals = []
@@ -247,22 +243,25 @@ async def login_with_retry(page, hospital, max_retries=3):
     try:
         logger.info(f"{hospital['hospital_name']}: ログイン処理を開始します")
         
-        # 証明書選択が必要な場合、別スレッドで処理
-        cert_thread = None
-        if hospital.get('certificate_order'):
-            cert_order = int(hospital['certificate_order'])
-            logger.info(f"証明書選択準備: {cert_order}番目")
-            
-            # 証明書選択を別スレッドで実行
-            cert_thread = threading.Thread(target=select_certificate, args=(cert_order,))
-            cert_thread.start()
-        
-        # 医歩のログインページへ遷移
-        await page.goto('https://kyogoku.ippo.co.jp/Karte/', wait_until='domcontentloaded', timeout=60000)
-        
-        # 証明書選択スレッドの完了を待つ
-        if cert_thread:
-            cert_thread.join()
+        # 証明書選択ダイアログの表示から選択完了までは、他の監視と画面操作が競合しないようロックする
+        async with get_desktop_input_lock():
+            # 証明書選択が必要な場合、別スレッドで処理
+            cert_thread = None
+            if hospital.get('certificate_order'):
+                cert_order = int(hospital['certificate_order'])
+                logger.info(f"証明書選択準備: {cert_order}番目")
+
+                # 証明書選択を別スレッドで実行
+                cert_thread = threading.Thread(target=select_certificate, args=(cert_order,))
+                cert_thread.start()
+
+            # 医歩のログインページへ遷移
+            await page.goto('https://kyogoku.ippo.co.jp/Karte/', wait_until='domcontentloaded', timeout=60000)
+
+            # 証明書選択スレッドの完了を待つ
+            if cert_thread:
+                # join はブロッキングのため、他の監視を止めないようスレッドで待機する
+                await asyncio.get_event_loop().run_in_executor(None, cert_thread.join)
         
         await asyncio.sleep(3)
         
@@ -610,7 +609,8 @@ async def monitor_hospital(page, hospital, config, shutdown_event):
     while not shutdown_event.is_set():
         try:
             # データ抽出
-            accounting_data = await extract_accounting_wait_data(page, hospital)
+            with EXTRACT_SECONDS.time(system='医歩', hospital=hospital['hospital_name']):
+                accounting_data = start_patient_traces(await extract_accounting_wait_data(page, hospital))
             
             # データベースに挿入
             if accounting_data:
@@ -638,6 +638,20 @@ async def process_and_insert_data(records, hospital_info):
             "patients": records
         }
 
+        # 前回の取り込みから変化のない患者は送信しない（定期的に全件を再送する）
+        snapshot = get_patient_snapshot_cache()
+        snapshot_key = (json_data['system_type'], json_data['issue_key'])
+        json_data['patients'] = snapshot.diff(snapshot_key, records)
+        if not json_data['patients']:
+            return
+
+        # 常駐取り込みサービスが有効な場合はプロセス内で処理する
+        ingestion_service = get_ingestion_service()
+        if ingestion_service.is_inprocess():
+            if await ingestion_service.process_patient_data(json_data):
+                snapshot.commit(snapshot_key, records, json_data['patients'])
+            return
+
         script_dir = os.path.dirname(os.path.abspath(__file__))
         inserter_path = os.path.join(script_dir, "medical_data_inserter.py")
         
@@ -651,7 +665,9 @@ async def process_and_insert_data(records, hospital_info):
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
             
-        process = subprocess.run(
+        # 子プロセスの完了待ちでイベントループを止めないようスレッドで実行する
+        process = await asyncio.get_event_loop().run_in_executor(None, functools.partial(
+            subprocess.run,
             [sys.executable, inserter_path],
             input=json.dumps(json_data, ensure_ascii=False),
             text=True,
@@ -663,7 +679,8 @@ async def process_and_insert_data(records, hospital_info):
             },
             startupinfo=startupinfo,
             check=True
-        )
+        ))
+        snapshot.commit(snapshot_key, records, json_data['patients'])
 
         if process.stdout.strip():
             logger.info(f"データベース挿入成功: {process.stdout}")
@@ -781,7 +798,8 @@ async def main_with_shutdown(shutdown_event, login_status):
             return
 
         # 医療機関情報を取得
-        hospitals = get_hospital_info(config)
+        # Backlog APIは同期呼び出しのため、イベントループを止めないようスレッドで実行する
+        hospitals = await asyncio.get_event_loop().run_in_executor(None, get_hospital_info, config)
         if not hospitals:
             logger.info("ポーリング対象の医療機関がないため、モニタリングをスキップします")
             # ログイン状態を完了に設定（医療機関数0として）
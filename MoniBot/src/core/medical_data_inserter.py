@@ -6,15 +6,17 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-import mysql.connector
 from mysql.connector import Error
 import configparser
 from datetime import datetime
 import json
 import requests
-import time
 
-from src.utils.logger import LoggerFactory
+from src.utils.logger import LoggerFactory, LazyJson
+from src.core.patient_trace import get_patient_trace_store
+from src.utils.db_pool import get_db_pool
+from src.utils.backlog_metadata import get_metadata_cache
+from src.utils.backlog_client import get_backlog_client
 
 # ロガーの初期化
 logger = LoggerFactory.setup_logger('medical_data_inserter')
@@ -28,10 +30,6 @@ TASK_STATUS_UNASSIGNED = '未割当'
 TASK_STATUS_ASSIGNED = '割当済'
 TASK_STATUS_REVERTED = '差戻'
 
-# APIリクエスト用の定数
-MAX_RETRIES = 3  # 最大リトライ回数
-RETRY_DELAY = 3  # リトライの基本間隔（秒）
-
 def load_config(filename='config.ini'):
     """設定ファイルを読み込む"""
     config = configparser.ConfigParser()
@@ -49,14 +47,6 @@ def load_config(filename='config.ini'):
         logger.error(f"設定ファイルの読み込みに失敗しました: {e}")
         return None, None
 
-def mysql_connection(config):
-    try:
-        connection = mysql.connector.connect(**config)
-        return connection if connection.is_connected() else None
-    except Error as e:
-        logger.error(f"MySQLデータベースへの接続中にエラーが発生しました: {e}")
-        return None
-    
 def get_or_insert_hospital_data(cursor, hospital_name, electronic_medical_record_name, team, issue_key):
     """
     病院データを取得または挿入し、必要に応じてチーム情報を更新する
@@ -84,7 +74,10 @@ def get_or_insert_hospital_data(cursor, hospital_name, electronic_medical_record
 
 def api_request_with_retry(request_func, *args, **kwargs):
     """
-    シンプルなリトライロジックを含むAPIリクエスト関数
+    Backlog APIリクエストを実行する
+    
+    リトライ・レート制限の待機は共通Backlogクライアントが行うため、
+    ここでは最終的な失敗をログに記録してNoneを返す。
     
     Args:
         request_func: 実行する関数
@@ -93,128 +86,88 @@ def api_request_with_retry(request_func, *args, **kwargs):
     Returns:
         結果またはNone（失敗時）
     """
-    retries = 0
-    last_exception = None
-    
-    while retries < MAX_RETRIES:
-        try:
-            return request_func(*args, **kwargs)
-        except requests.exceptions.RequestException as e:
-            last_exception = e
-            retries += 1
-            
-            # レスポンス情報の取得
-            status_code = None
-            if hasattr(e, 'response') and e.response:
-                status_code = e.response.status_code
-            
-            # 429 Too Many Requestsの場合の特別処理
-            if status_code == 429:
-                # Retry-Afterヘッダーがあれば使用
-                retry_after = None
-                if hasattr(e, 'response') and e.response and 'Retry-After' in e.response.headers:
-                    retry_after = int(e.response.headers['Retry-After'])
-                
-                wait_time = retry_after if retry_after else RETRY_DELAY * 5
-                logger.warning(f"APIレート制限に達しました (429). {wait_time}秒後にリトライ {retries}/{MAX_RETRIES}...")
-                time.sleep(wait_time)
-                continue
-            
-            # リトライするべきエラー（サーバーエラーや接続エラー）
-            elif (status_code and 500 <= status_code < 600) or not status_code:
-                wait_time = RETRY_DELAY
-                logger.warning(f"APIリクエスト中にエラー発生. {wait_time}秒後にリトライ {retries}/{MAX_RETRIES}...")
-                time.sleep(wait_time)
-                continue
-            else:
-                # その他のクライアントエラーはリトライしない
-                logger.error(f"APIリクエスト中にクライアントエラー発生: {e}")
-                break
-        except Exception as e:
-            last_exception = e
-            logger.error(f"予期せぬエラーが発生: {e}")
-            break
-    
-    if last_exception:
-        logger.error(f"APIリクエストが {MAX_RETRIES} 回失敗しました: {last_exception}")
+    try:
+        return request_func(*args, **kwargs)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"APIリクエストが失敗しました: {e}")
+        if getattr(e, 'response', None) is not None:
+            logger.error(f"レスポンス内容: {e.response.text}")
+    except Exception as e:
+        logger.error(f"予期せぬエラーが発生: {e}")
     return None
 
-def get_priority_id(space_name, api_key):
-    '''Backlogの優先度リストから「中」優先度のIDを取得する'''
-    base_url = f"https://{space_name}.backlog.com/api/v2"
-    endpoint = f"{base_url}/priorities"
-    params = {"apiKey": api_key}
-    
-    def _get_priority():
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        priorities = response.json()
-        for priority in priorities:
-            if priority['name'] == '中':
-                return priority['id']
-        return priorities[0]['id'] if priorities else None
-    
-    return api_request_with_retry(_get_priority)
+def get_priority_id(client):
+    '''Backlogの優先度リストから「中」優先度のIDを取得する（キャッシュ利用）'''
+    priorities = get_metadata_cache().get_or_load(
+        ('priorities', client.space_name),
+        lambda: api_request_with_retry(client.get_priorities)
+    )
+    if not priorities:
+        return None
+    for priority in priorities:
+        if priority['name'] == '中':
+            return priority['id']
+    return priorities[0]['id']
+
+def get_issue_types(client, project_id):
+    '''プロジェクトの課題種別一覧を取得する（キャッシュ利用）'''
+    return get_metadata_cache().get_or_load(
+        ('issue_types', client.space_name, str(project_id)),
+        lambda: api_request_with_retry(client.get_issue_types, project_id)
+    )
 
-def get_issue_type_id(space_name, api_key, project_id, issue_type_name):
+def get_issue_type_id(client, project_id, issue_type_name):
     '''課題種別リストから、特定の名前の課題種別IDを取得する'''
-    base_url = f"https://{space_name}.backlog.com/api/v2"
-    endpoint = f"{base_url}/projects/{project_id}/issueTypes"
-    params = {"apiKey": api_key}
-    
-    def _get_issue_type():
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        issue_types = response.json()
-            
+    cache = get_metadata_cache()
+    # 見つからなかった種別は短い有効期間内は再取得しない（存在しない種別のたびにAPIを呼ばないため）
+    missing_key = ('issue_type_missing', client.space_name, str(project_id), issue_type_name)
+    if cache.get(missing_key):
+        logger.debug(f"課題種別 '{issue_type_name}' は存在しないことを確認済みです")
+        return None
+    for refresh in (False, True):
+        if refresh:
+            # 新しく追加された種別の可能性があるため、キャッシュを破棄して再取得する
+            get_metadata_cache().invalidate('issue_types', client.space_name, str(project_id))
+        issue_types = get_issue_types(client, project_id)
+        if issue_types is None:
+            return None
         for issue_type in issue_types:
             if issue_type['name'] == issue_type_name:
                 return issue_type['id']
-        logger.error(f"指定された種別 '{issue_type_name}' が見つかりません")
-        return None
-    
-    return api_request_with_retry(_get_issue_type)
-    
-def get_custom_field_id(space_name, api_key, project_id):
-    '''プロジェクトのカスタムフィールド一覧を取得'''
-    base_url = f"https://{space_name}.backlog.com/api/v2"
-    endpoint = f"{base_url}/projects/{project_id}/customFields"
-    params = {"apiKey": api_key}
-    
-    def _get_custom_fields():
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()
-        return response.json()
+    cache.put(missing_key, True, ttl=cache.missing_ttl)
+    logger.error(f"指定された種別 '{issue_type_name}' が見つかりません")
+    return None
     
-    return api_request_with_retry(_get_custom_fields)
+def get_custom_field_id(client, project_id):
+    '''プロジェクトのカスタムフィールド一覧を取得（キャッシュ利用）'''
+    return get_metadata_cache().get_or_load(
+        ('custom_fields', client.space_name, str(project_id)),
+        lambda: api_request_with_retry(client.get_custom_fields, project_id)
+    )
 
-def create_initial_backlog_issue(connection, config, hospital_info, account_info):
-    """医療機関データ取り込み時にBacklogチケットを作成"""
-    space_name = config['backlog']['space_name']
-    api_key = config['backlog']['api_key']
+def build_backlog_issue_params(config, hospital_info, account_info):
+    """会計データからBacklogチケット作成用のパラメータを組み立てる（メタデータ取得失敗時はNone）"""
+    client = get_backlog_client(config)
     project_id = config['backlog']['billing_project_id']
 
     # カスタムフィールド情報の取得
-    custom_fields = get_custom_field_id(space_name, api_key, project_id)
+    custom_fields = get_custom_field_id(client, project_id)
     if custom_fields is None:
         logger.error("カスタムフィールド情報の取得に失敗しました")
         return None
         
     # 優先度IDの取得
-    priority_id = get_priority_id(space_name, api_key)
+    priority_id = get_priority_id(client)
     if priority_id is None:
         logger.error("優先度IDの取得に失敗しました")
         return None
         
     # 課題種別IDの取得
-    issue_type_id = get_issue_type_id(space_name, api_key, project_id, hospital_info['電子カルテ名'])
+    issue_type_id = get_issue_type_id(client, project_id, hospital_info['電子カルテ名'])
     if issue_type_id is None:
         logger.error(f"課題種別 '{hospital_info['電子カルテ名']}' のIDの取得に失敗しました")
         return None
     
-    base_url = f"https://{space_name}.backlog.com/api/v2"
-    endpoint = f"{base_url}/issues"
-    
     # 時間のみを抽出（HH:MM:SS形式）
     time_only = datetime.strptime(account_info['作成時間'], "%Y-%m-%d %H:%M:%S").strftime("%H:%M:%S")
     
@@ -229,7 +182,6 @@ def create_initial_backlog_issue(connection, config, hospital_info, account_info
     summary = f"{hospital_info['病院名']} - {account_info['患者ID']}{re_account_prefix}"
     
     params = {
-        "apiKey": api_key,
         "projectId": project_id,
         "summary": summary,
         "issueTypeId": issue_type_id,
@@ -261,33 +213,34 @@ def create_initial_backlog_issue(connection, config, hospital_info, account_info
             if field['name'] == '再会計' and re_account_flag == 1:
                 params[f"customField_{field['id']}"] = "はい"
 
-    def _create_issue():
-        response = requests.post(endpoint, params=params)
-        response.raise_for_status()
-        return response.json()
-
-    # APIリクエストを実行し、成功したらチケット番号を保存
-    issue = api_request_with_retry(_create_issue)
-    if issue:
-        # 作成したチケット番号をDBに保存
-        update_backlog_ticket_number(connection, account_info['会計ID'], issue['issueKey'])
-        return issue
-    
-    return None
+    return params
+
+def update_backlog_ticket_numbers(connection, ticket_numbers):
+    """
+    複数の会計データにBacklogチケット番号をまとめて保存する
+
+    Args:
+        connection: データベース接続
+        ticket_numbers: (会計ID, チケット番号) のリスト
 
-def update_backlog_ticket_number(connection, account_id, ticket_number):
-    """会計データにBacklogチケット番号を保存"""
+    Returns:
+        bool: すべて保存できた場合True
+    """
+    if not ticket_numbers:
+        return True
     cursor = connection.cursor()
     try:
-        cursor.execute("""
+        cursor.executemany("""
             UPDATE tbl_pendingaccounts 
             SET Backlogチケット番号 = %s 
             WHERE 会計ID = %s
-        """, (ticket_number, account_id))
+        """, [(ticket_number, account_id) for account_id, ticket_number in ticket_numbers])
         connection.commit()
+        return True
     except Exception as e:
         logger.error(f"チケット番号更新中にエラー: {str(e)}")
         connection.rollback()
+        return False
     finally:
         cursor.close()
 
@@ -312,13 +265,23 @@ def insert_pending_account(cursor, hospital_id, patient_id, department, exam_dat
         logger.error(f"処理中にエラーが発生しました: {e}")
         return None, 0
 
-def process_patient_data(connection, cursor, data):
+def process_patient_data(connection, cursor, data, config=None):
     """
     患者データを処理し、DBとBacklogに登録する
-    トランザクション管理を強化し、Backlog APIエラー時はロールバックする
+    DB登録は患者ごとにコミットし、新規データのBacklogチケット作成はパイプラインへ投入する
+    （チケット作成に失敗してもDBの行はロールバックせず、パイプライン側で再試行する）
+
+    Args:
+        connection: データベース接続
+        cursor: データベースカーソル
+        data: 監視モジュールから受け取った医療機関・患者データ
+        config: 読み込み済みの設定（省略時は設定ファイルを読み込む）
+
+    Returns:
+        bool: すべての患者データを登録できた場合True
     """
     try:
-        logger.debug(f"受信データの詳細: {json.dumps(data, ensure_ascii=False, indent=2)}")
+        logger.debug("受信データの詳細: %s", LazyJson(data, indent=2))
         
         hospital_name = data.get('hospital_name')
         system_type = data.get('system_type')
@@ -328,22 +291,27 @@ def process_patient_data(connection, cursor, data):
 
         if not all([hospital_name, system_type, issue_key]):
             logger.error("必須データが不足しています")
-            return
+            return False
 
         # 病院データの取得または挿入
         hospital_id = get_or_insert_hospital_data(cursor, hospital_name, system_type, team, issue_key)
         if not hospital_id:
             logger.error(f"病院データの取得または挿入に失敗しました: {hospital_name}")
-            return
+            return False
 
         # 病院データをコミット
         connection.commit()
 
         if not patients:
             logger.debug("処理対象の患者データが空です")
-            return
+            return True
 
-        config = load_config()[0]
+        if config is None:
+            config = load_config()[0]
+        
+        # チケット作成はDB登録がすべて終わってからまとめて投入する
+        issue_jobs = []
+        failed_count = 0
         
         # 各患者データの処理をトランザクションで管理
         for patient in patients:
@@ -353,7 +321,7 @@ def process_patient_data(connection, cursor, data):
             connection.start_transaction()
             
             try:
-                logger.debug(f"患者データを処理: {json.dumps(patient, ensure_ascii=False)}")
+                logger.debug("患者データを処理: %s", LazyJson(patient))
                 exam_date = datetime.now().strftime("%Y-%m-%d")
                 department = patient.get('department', '不明')
                 re_account_flag = 1 if 're_account' in patient and patient['re_account'] else 0
@@ -366,14 +334,16 @@ def process_patient_data(connection, cursor, data):
                 if account_id is None or account_id == 0:
                     logger.error(f"会計データの挿入に失敗しました: {patient['patient_id']}")
                     connection.rollback()
+                    failed_count += 1
                     continue
 
                 # 新規データの場合のみBacklogチケットを作成
-                if account_id > 0 and updated_existing == 0:
+                new_account = account_id > 0 and updated_existing == 0
+                if new_account:
                     logger.info(f"新規データを登録しました: 病院ID {hospital_id}, "
                               f"患者ID {patient['patient_id']}, 会計ID {account_id}, "
                               f"診療科 {department}, 診察終了時間 {patient['end_time']}, "
-                              f"再会計フラグ: {re_account_flag}")
+                              f"再会計フラグ: {re_account_flag}, トレース {patient.get('trace_id', '-')}")
 
                     hospital_info = {
                         "病院名": hospital_name,
@@ -387,24 +357,34 @@ def process_patient_data(connection, cursor, data):
                         "作成時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                         "再会計フラグ": re_account_flag
                     }
-                    
-                    backlog_issue = create_initial_backlog_issue(connection, config, hospital_info, account_info)
-                    
-                    if backlog_issue is None:
-                        logger.error(f"Backlogチケット作成に失敗したため、トランザクションをロールバックします: 患者ID {patient['patient_id']}")
-                        connection.rollback()
-                        continue
+                    issue_jobs.append((hospital_info, account_info))
                 else:
                     logger.info(f"既存レコードが検出されました: 患者ID {patient['patient_id']}, 会計ID {account_id}")
                 
                 connection.commit()
                 logger.debug(f"患者ID {patient['patient_id']} の処理が完了し、トランザクションをコミットしました")
+
+                # 監視モジュールで付与したトレースを会計IDと紐付ける
+                if new_account:
+                    get_patient_trace_store().begin(
+                        patient.get('trace_id'), account_id, patient.get('extracted_at'),
+                        system=system_type, hospital=hospital_name, patient_id=patient['patient_id'])
                 
             except Exception as e:
                 connection.rollback()
+                failed_count += 1
                 logger.error(f"患者ID {patient.get('patient_id', 'Unknown')} の処理中にエラー発生: {e}")
                 logger.error(f"トランザクションをロールバックしました")
 
+        if issue_jobs:
+            from src.core.backlog_issue_pipeline import get_backlog_issue_pipeline
+            pipeline = get_backlog_issue_pipeline(config)
+            for hospital_info, account_info in issue_jobs:
+                pipeline.submit(hospital_info, account_info)
+            logger.debug(f"Backlogチケット作成を {len(issue_jobs)}件 投入しました")
+
+        return failed_count == 0
+
     except Exception as e:
         logger.error(f"患者データの処理中にエラーが発生しました: {e}")
         raise
@@ -417,41 +397,47 @@ def main():
         if not db_config:
             return
 
-        # データベース接続
-        connection = mysql_connection(db_config)
-        if not connection:
+        # データベース接続（共有プールから取得）
+        db_pool = get_db_pool()
+        try:
+            connection = db_pool.get_connection('medical_data_inserter')
+        except Error as e:
+            logger.error(f"MySQLデータベースへの接続中にエラーが発生しました: {e}")
             return
 
+        cursor = None
         try:
-            # 自動コミットを無効にする
-            connection.autocommit = False
             cursor = connection.cursor(buffered=True)
             
             # 標準入力からJSONデータを読み込む
             input_data = json.loads(sys.stdin.read())
             
             # データ処理
-            process_patient_data(connection, cursor, input_data)
+            succeeded = process_patient_data(connection, cursor, input_data, config=config)
             logger.debug("データ処理が完了しました")
 
+            # プロセス終了前に投入済みのチケット作成を完了させる（失敗分はスプールへ保存される）
+            from src.core.backlog_issue_pipeline import shutdown_backlog_issue_pipeline
+            shutdown_backlog_issue_pipeline()
+
+            # 登録に失敗した患者がいれば終了コードで呼び出し元（監視モジュール）へ伝える
+            if not succeeded:
+                return 1
+
         except json.JSONDecodeError as e:
             logger.error(f"JSONデータの解析に失敗しました: {e}")
         except Error as e:
             logger.error(f"データ処理中にエラーが発生しました: {e}")
-            if connection.is_connected() and connection.in_transaction:
-                connection.rollback()
         finally:
-            if connection.is_connected():
-                # 残っているトランザクションがあればロールバック
-                if connection.in_transaction:
-                    connection.rollback()
+            if cursor:
                 cursor.close()
-                connection.close()
-                logger.debug("MySQL接続を閉じました")
+            # 残っているトランザクションはプール返却時にロールバックされる
+            db_pool.release_connection(connection)
+            logger.debug("MySQL接続を閉じました")
 
     except Exception as e:
         logger.error(f"予期せぬエラーが発生しました: {e}")
         logger.exception("スタックトレース:")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
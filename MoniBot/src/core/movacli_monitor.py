@@ -10,6 +10,7 @@ Backlogから医療機関情報を取得し、#OASIS会計タグのデータを
 import os
 import sys
 import asyncio
+import functools
 import configparser
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import pyautogui
@@ -26,7 +27,13 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.append(project_root)
 
 from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.core.hospital_registry import get_hospital_registry
+from src.core.ingestion_service import get_ingestion_service
+from src.core.patient_trace import start_patient_traces
+from src.core.patient_snapshot import get_patient_snapshot_cache
 from src.utils.login_status import LoginStatus
+from src.utils.desktop_input import get_desktop_input_lock
 
 # ディレクトリ設定
 CONFIG_DIR = os.path.join(project_root, 'config')
@@ -35,6 +42,10 @@ SESSION_DIR = os.path.join(project_root, 'session')
 # ロガー設定（モバクリ専用）
 logger = LoggerFactory.setup_logger('movacli')
 
+# データ抽出（画面からの読み取り）の所要時間
+EXTRACT_SECONDS = get_metrics_registry().histogram(
+    'monibot_extract_seconds', '電子カルテ画面からの患者データ抽出の所要時間', ('system', 'hospital'))
+
 def select_certificate(cert_order: int):
     """証明書選択ダイアログを処理（十字キーで選択）"""
     try:
@@ -93,32 +104,17 @@ def get_custom_field_value(custom_fields: List[Dict[str, Any]], name: str) -> st
 def get_hospital_info(config):
     """Backlogからモバクリの医療機関情報を取得する"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['hospital_project_id']
 
-        logger.info(f"Backlog APIリクエストを開始します")
+        logger.info(f"医療機関レジストリから医療機関情報を取得します")
         logger.info(f"プロジェクトID: {project_id}")
 
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        issues_endpoint = f"{base_url}/issues"
-        
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
-
-        response = requests.get(issues_endpoint, params=issue_params)
-        
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
-            logger.error(f"エラー内容: {response.text}")
+        # 医療機関レジストリからモバクリの課題を取得（Backlogへの問い合わせは起動時にまとめて1回）
+        try:
+            issues = get_hospital_registry(config).get_issues('モバクリ')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return []
-
-        issues = response.json()
         logger.info(f"取得した課題数: {len(issues)}")
 
         hospitals = []
@@ -166,39 +162,41 @@ async def login_with_retry(page, hospital, max_retries=3):
         try:
             logger.info(f"{hospital['hospital_name']}: ログイン試行 {attempt + 1}/{max_retries}")
 
-            # 証明書選択が必要な場合、別スレッドで処理
-            cert_thread = None
-            cert_order = None
-            if hospital.get('certificate_order'):
-                cert_order = int(hospital['certificate_order'])
-                logger.info(f"証明書選択準備: {cert_order}番目")
-
-                # 証明書選択を別スレッドで実行
-                cert_thread = threading.Thread(target=select_certificate, args=(cert_order,))
-                cert_thread.start()
-
-            # モバクリのログインページへ遷移
-            # 注意: 証明書ダイアログが表示されると、ページ読み込みがブロックされるため
-            # wait_until='commit' で早期に制御を戻し、タイムアウトを回避する
-            logger.debug(f"{hospital['hospital_name']}: page.goto開始")
-            try:
-                await page.goto('https://c1.movacal.net/home', wait_until='commit', timeout=90000)
-            except PlaywrightTimeoutError as goto_error:
-                # タイムアウトしても証明書選択が完了すればページが読み込まれる可能性がある
-                logger.warning(f"{hospital['hospital_name']}: page.gotoがタイムアウト、証明書ダイアログ待機中の可能性: {goto_error}")
+            # 証明書選択ダイアログの表示から選択完了までは、他の監視と画面操作が競合しないようロックする
+            async with get_desktop_input_lock():
+                # 証明書選択が必要な場合、別スレッドで処理
+                cert_thread = None
+                cert_order = None
+                if hospital.get('certificate_order'):
+                    cert_order = int(hospital['certificate_order'])
+                    logger.info(f"証明書選択準備: {cert_order}番目")
+
+                    # 証明書選択を別スレッドで実行
+                    cert_thread = threading.Thread(target=select_certificate, args=(cert_order,))
+                    cert_thread.start()
+
+                # モバクリのログインページへ遷移
+                # 注意: 証明書ダイアログが表示されると、ページ読み込みがブロックされるため
+                # wait_until='commit' で早期に制御を戻し、タイムアウトを回避する
+                logger.debug(f"{hospital['hospital_name']}: page.goto開始")
+                try:
+                    await page.goto('https://c1.movacal.net/home', wait_until='commit', timeout=90000)
+                except PlaywrightTimeoutError as goto_error:
+                    # タイムアウトしても証明書選択が完了すればページが読み込まれる可能性がある
+                    logger.warning(f"{hospital['hospital_name']}: page.gotoがタイムアウト、証明書ダイアログ待機中の可能性: {goto_error}")
+                    # 証明書選択スレッドの完了を待つ
+                    if cert_thread and cert_thread.is_alive():
+                        logger.debug(f"{hospital['hospital_name']}: 証明書選択スレッド完了を待機中...")
+                        await asyncio.get_event_loop().run_in_executor(None, cert_thread.join, 30)
+                    # 追加待機してページ読み込みを待つ
+                    await asyncio.sleep(5)
+                logger.debug(f"{hospital['hospital_name']}: page.goto完了")
+
                 # 証明書選択スレッドの完了を待つ
                 if cert_thread and cert_thread.is_alive():
-                    logger.debug(f"{hospital['hospital_name']}: 証明書選択スレッド完了を待機中...")
-                    cert_thread.join(timeout=30)
-                # 追加待機してページ読み込みを待つ
-                await asyncio.sleep(5)
-            logger.debug(f"{hospital['hospital_name']}: page.goto完了")
-
-            # 証明書選択スレッドの完了を待つ
-            if cert_thread and cert_thread.is_alive():
-                logger.debug(f"{hospital['hospital_name']}: 証明書選択スレッド完了待ち開始")
-                cert_thread.join(timeout=30)
-                logger.debug(f"{hospital['hospital_name']}: 証明書選択スレッド完了")
+                    logger.debug(f"{hospital['hospital_name']}: 証明書選択スレッド完了待ち開始")
+                    await asyncio.get_event_loop().run_in_executor(None, cert_thread.join, 30)
+                    logger.debug(f"{hospital['hospital_name']}: 証明書選択スレッド完了")
 
             await asyncio.sleep(3)
 
@@ -1191,7 +1189,8 @@ async def monitor_hospital(page, hospital, config, shutdown_event):
             if monitoring_count % 10 == 1:
                 await log_memory_usage(page, hospital['hospital_name'], "データ抽出前")
             
-            oasis_data = await extract_oasis_data(page, hospital)
+            with EXTRACT_SECONDS.time(system='モバクリ', hospital=hospital['hospital_name']):
+                oasis_data = start_patient_traces(await extract_oasis_data(page, hospital))
             
             # データ抽出後のメモリ使用量を記録（詳細ログモード時のみ）
             if monitoring_count % 10 == 1:
@@ -1506,6 +1505,20 @@ async def process_and_insert_data(records, hospital_info):
             "patients": records
         }
 
+        # 前回の取り込みから変化のない患者は送信しない（定期的に全件を再送する）
+        snapshot = get_patient_snapshot_cache()
+        snapshot_key = (json_data['system_type'], json_data['issue_key'])
+        json_data['patients'] = snapshot.diff(snapshot_key, records)
+        if not json_data['patients']:
+            return
+
+        # 常駐取り込みサービスが有効な場合はプロセス内で処理する
+        ingestion_service = get_ingestion_service()
+        if ingestion_service.is_inprocess():
+            if await ingestion_service.process_patient_data(json_data):
+                snapshot.commit(snapshot_key, records, json_data['patients'])
+            return
+
         script_dir = os.path.dirname(os.path.abspath(__file__))
         inserter_path = os.path.join(script_dir, "medical_data_inserter.py")
         
@@ -1519,7 +1532,9 @@ async def process_and_insert_data(records, hospital_info):
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
             
-        process = subprocess.run(
+        # 子プロセスの完了待ちでイベントループを止めないようスレッドで実行する
+        process = await asyncio.get_event_loop().run_in_executor(None, functools.partial(
+            subprocess.run,
             [sys.executable, inserter_path],
             input=json.dumps(json_data, ensure_ascii=False),
             text=True,
@@ -1532,7 +1547,8 @@ async def process_and_insert_data(records, hospital_info):
             },
             startupinfo=startupinfo,
             check=True
-        )
+        ))
+        snapshot.commit(snapshot_key, records, json_data['patients'])
 
         if process.stdout.strip():
             logger.info(f"データベース挿入成功: {process.stdout}")
@@ -1670,7 +1686,8 @@ async def main_with_shutdown(shutdown_event, login_status):
             return
 
         # 医療機関情報を取得
-        hospitals = get_hospital_info(config)
+        # Backlog APIは同期呼び出しのため、イベントループを止めないようスレッドで実行する
+        hospitals = await asyncio.get_event_loop().run_in_executor(None, get_hospital_info, config)
         if not hospitals:
             logger.info("ポーリング対象の医療機関がないため、モニタリングをスキップします")
             # ログイン状態を完了に設定（医療機関数0として）
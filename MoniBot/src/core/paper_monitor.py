@@ -18,6 +18,9 @@ import requests
 import traceback
 
 from src.utils.logger import LoggerFactory
+from src.core.hospital_registry import get_hospital_registry
+from src.core.ingestion_service import get_ingestion_service
+from src.core.patient_trace import start_patient_traces
 from src.core.counter_manager import DailyCounter
 
 # ロガーの初期化
@@ -83,31 +86,11 @@ def get_custom_field_value(custom_fields: List[Dict[str, Any]], name: str) -> st
 def get_hospital_info(config: Dict) -> List[Dict[str, Any]]:
     """Backlogから紙カルテ医療機関情報を取得する"""
     try:
-        logger.debug("Backlog APIリクエスト開始")
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
-        project_id = config['backlog']['hospital_project_id']
-
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        project_endpoint = f"{base_url}/projects/{project_id}"
-        params = {"apiKey": api_key}
-
-        project_response = requests.get(project_endpoint, params=params)
-        project_response.raise_for_status()
-        project_info = project_response.json()
-
-        issues_endpoint = f"{base_url}/issues"
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
+        logger.debug("医療機関レジストリから医療機関情報を取得")
 
-        response = requests.get(issues_endpoint, params=issue_params)
-        response.raise_for_status()
-        issues = response.json()
+        # 医療機関レジストリから紙カルテの課題を取得（再取得は一定間隔ごと）
+        registry = get_hospital_registry(config)
+        issues = registry.get_issues('紙カルテ', max_age=registry.refresh_interval)
 
         team_counts = {}
         all_hospitals = []
@@ -147,7 +130,7 @@ def get_hospital_info(config: Dict) -> List[Dict[str, Any]]:
                 logger.error(f"課題 {issue.get('issueKey', '不明')} の処理中にエラー: {e}")
                 continue
 
-        logger.debug(f"取得した全課題数: {len(issues)}")
+        logger.debug(f"対象システムの課題数: {len(issues)}")
         logger.debug(f"紙カルテ・ポーリング有効な医療機関数: {filtered_count}")
 
         return all_hospitals
@@ -176,6 +159,7 @@ def process_and_insert_data(records, hospital_info):
             logger.error(f"medical_data_inserter.py が見つかりません: {inserter_path}")
             return False
 
+        start_patient_traces(records)
         json_data = {
             "hospital_name": hospital_info["hospital_name"],
             "system_type": hospital_info.get("system_type", "紙カルテ"),
@@ -184,6 +168,11 @@ def process_and_insert_data(records, hospital_info):
             "patients": records
         }
 
+        # 常駐取り込みサービスが有効な場合はプロセス内で処理する
+        ingestion_service = get_ingestion_service()
+        if ingestion_service.is_inprocess():
+            return ingestion_service.process_patient_data_sync(json_data)
+
         try:
             startupinfo = None
             if os.name == 'nt':
@@ -428,7 +417,11 @@ async def run(config: Dict, hospitals: List[Dict[str, Any]], shutdown_event: asy
                             "作成時間": current_time.strftime("%Y-%m-%d %H:%M:%S")
                         }]
 
-                        if process_and_insert_data(patient_data, hospital):
+                        # DB登録・Backlog登録は同期処理のため、イベントループを止めないようスレッドで実行する
+                        inserted = await asyncio.get_event_loop().run_in_executor(
+                            None, process_and_insert_data, patient_data, hospital
+                        )
+                        if inserted:
                             logger.info(f"ファイル処理完了: {file} -> {new_id}")
                         else:
                             # DBへの挿入が失敗した場合、ファイルを元に戻す
@@ -524,7 +517,8 @@ async def main_with_shutdown(shutdown_event: asyncio.Event, init_done: asyncio.E
             return
 
         logger.debug("Backlogから病院情報を取得開始")
-        hospitals = get_hospital_info(config)
+        # Backlog APIは同期呼び出しのため、イベントループを止めないようスレッドで実行する
+        hospitals = await asyncio.get_event_loop().run_in_executor(None, get_hospital_info, config)
         logger.debug(f"取得した病院数: {len(hospitals) if hospitals else 0}")
 
         if init_done:
@@ -0,0 +1,131 @@
+# src/core/patient_snapshot.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('patient_snapshot')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# 全件を再送する間隔の既定値（秒）。[setting] snapshot_resync_interval で上書き可能
+DEFAULT_RESYNC_INTERVAL = 600
+
+
+def record_signature(record: Dict[str, Any]) -> Tuple:
+    """患者データの変更検知に使う項目（患者ID・診察終了時間・診療科・再会計）"""
+    return (
+        str(record.get('patient_id')),
+        str(record.get('end_time')),
+        record.get('department'),
+        bool(record.get('re_account')),
+    )
+
+
+class PatientSnapshotCache:
+    """
+    医療機関ごとに前回取り込んだ会計待ち一覧を保持し、新規・変更分だけを取り出す
+
+    diff() で送信対象を求め、取り込みに成功したら commit() で一覧全体を記録する。
+    取り込みに失敗した場合は commit() しないため、次回のポーリングで再送される。
+    resync_interval ごと、および日付が変わった場合は全件を送信する。
+    """
+
+    def __init__(self, resync_interval: float = DEFAULT_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        # 医療機関キー -> (記録した署名の集合, 全件送信した時刻, 記録した日付)
+        self._snapshots: Dict[Hashable, Tuple[FrozenSet[Tuple], float, date]] = {}
+        self._lock = threading.Lock()
+        self.forwarded = 0
+        self.skipped = 0
+
+    def diff(self, hospital_key: Hashable, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        前回の取り込み内容と比較し、送信が必要な患者データを返す
+
+        Args:
+            hospital_key: 医療機関を識別するキー（システム種別と課題キーなど）
+            records: 今回取得した会計待ち一覧
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(hospital_key)
+            if snapshot is None:
+                changed = list(records)
+            else:
+                signatures, synced_at, synced_date = snapshot
+                if synced_date != date.today() or time.monotonic() - synced_at >= self.resync_interval:
+                    logger.debug(f"{hospital_key}: 定期再同期のため全件を送信します")
+                    changed = list(records)
+                else:
+                    changed = [r for r in records if record_signature(r) not in signatures]
+            self.forwarded += len(changed)
+            self.skipped += len(records) - len(changed)
+
+        if records and len(changed) < len(records):
+            logger.debug(f"{hospital_key}: {len(records)}件中 {len(changed)}件を送信します（変更なし {len(records) - len(changed)}件）")
+        return changed
+
+    def commit(self, hospital_key: Hashable, records: List[Dict[str, Any]], forwarded: List[Dict[str, Any]]):
+        """
+        取り込みに成功した一覧を記録する
+
+        Args:
+            hospital_key: diff() と同じキー
+            records: 今回取得した会計待ち一覧（全件）
+            forwarded: diff() が返し、実際に送信した患者データ
+        """
+        signatures = frozenset(record_signature(r) for r in records)
+        with self._lock:
+            snapshot = self._snapshots.get(hospital_key)
+            full_sync = snapshot is None or len(forwarded) == len(records)
+            synced_at = time.monotonic() if full_sync else snapshot[1]
+            self._snapshots[hospital_key] = (signatures, synced_at, date.today())
+
+    def invalidate(self, hospital_key: Optional[Hashable] = None):
+        """記録を破棄し、次回は全件を送信させる（キー省略時は全医療機関）"""
+        with self._lock:
+            if hospital_key is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(hospital_key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """送信件数・スキップ件数を返す"""
+        with self._lock:
+            total = self.forwarded + self.skipped
+            return {
+                'hospitals': len(self._snapshots),
+                'forwarded': self.forwarded,
+                'skipped': self.skipped,
+                'skip_ratio': self.skipped / total if total else 0.0,
+            }
+
+
+_cache: Optional[PatientSnapshotCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_patient_snapshot_cache() -> PatientSnapshotCache:
+    """プロセス内で共有するスナップショットキャッシュを取得する"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = configparser.ConfigParser()
+            config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+            resync_interval = config.getfloat('setting', 'snapshot_resync_interval',
+                                              fallback=DEFAULT_RESYNC_INTERVAL)
+            _cache = PatientSnapshotCache(resync_interval=resync_interval)
+            get_metrics_registry().register_collector('patient_snapshot', _cache.get_stats)
+        return _cache
@@ -0,0 +1,350 @@
+# src/core/patient_trace.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from src.utils.logger import LoggerFactory
+from src.utils.local_server import AUTH_LOCAL
+from src.utils.metrics import get_metrics_registry
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('patient_trace')
+
+# トレースの保存先（日付ごとの JSON Lines）
+TRACE_DIR = os.path.join(project_root, 'log', 'trace')
+TRACE_RETENTION_DAYS = 7
+MAX_TRACES = 5000  # メモリに保持するトレース数
+
+# 患者データが割り当て・通知されるまでの段階（この順に進む）
+STAGE_EXTRACTED = 'extracted'            # 電子カルテ画面から抽出
+STAGE_DB_INSERTED = 'db_inserted'        # tbl_pendingaccounts へ登録（会計ID の採番）
+STAGE_TICKET_CREATED = 'ticket_created'  # Backlogチケットを作成
+STAGE_TICKET_SAVED = 'ticket_saved'      # チケット番号をDBへ書き戻し（割り当て可能になる）
+STAGE_ASSIGNED = 'assigned'              # スタッフへ割り当て（Backlog更新済み）
+STAGE_WEBHOOK_SENT = 'webhook_sent'      # ダッシュボードへ通知
+STAGES = (STAGE_EXTRACTED, STAGE_DB_INSERTED, STAGE_TICKET_CREATED, STAGE_TICKET_SAVED,
+          STAGE_ASSIGNED, STAGE_WEBHOOK_SENT)
+
+# メトリクス
+_metrics = get_metrics_registry()
+STAGE_SECONDS = _metrics.histogram(
+    'monibot_trace_stage_seconds', '患者データの各段階の所要時間（前の段階からの経過時間）', ('stage',),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+TOTAL_SECONDS = _metrics.histogram(
+    'monibot_trace_total_seconds', '画面からの抽出から各段階までの経過時間', ('stage',),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_patient_traces(patients: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    抽出した患者データにトレースIDと抽出時刻を付与する（監視モジュールで抽出直後に呼ぶ）
+
+    トレースとして記録されるのは、取り込みで新規の会計データとして登録された患者のみ。
+    変更検知（patient_snapshot）はこれらの項目を比較に使わない。
+    """
+    extracted_at = time.time()
+    for patient in patients or []:
+        patient.setdefault('trace_id', new_trace_id())
+        patient.setdefault('extracted_at', extracted_at)
+    return patients
+
+
+class PatientTrace:
+    """1人の患者データの各段階の時刻"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.fields: Dict[str, Any] = {}
+        self.stages: Dict[str, float] = {}
+
+    def apply(self, entry: Dict[str, Any]):
+        stage = entry.get('stage')
+        if stage:
+            self.stages.setdefault(stage, entry['ts'])
+        for key, value in entry.items():
+            if key not in ('trace_id', 'stage', 'ts') and value is not None:
+                self.fields[key] = value
+
+    def previous_stage_time(self, stage: str) -> Optional[float]:
+        """指定した段階より前で、記録済みの直近の段階の時刻"""
+        index = STAGES.index(stage) if stage in STAGES else len(STAGES)
+        for previous in reversed(STAGES[:index]):
+            if previous in self.stages:
+                return self.stages[previous]
+        return None
+
+    @property
+    def total(self) -> float:
+        if not self.stages:
+            return 0.0
+        return max(self.stages.values()) - min(self.stages.values())
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """段階ごとの所要時間（前の段階からの経過秒数）"""
+        result = []
+        previous = None
+        for stage in STAGES:
+            if stage not in self.stages:
+                continue
+            ts = self.stages[stage]
+            result.append({
+                'stage': stage,
+                'at': datetime.fromtimestamp(ts).strftime('%H:%M:%S'),
+                'seconds': round(ts - previous, 3) if previous is not None else 0.0,
+            })
+            previous = ts
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'trace_id': self.trace_id, **self.fields,
+                'total_seconds': round(self.total, 3), 'stages': self.breakdown()}
+
+
+class PatientTraceStore:
+    """
+    患者データのトレースを記録する
+
+    各段階の記録は日付ごとの JSON Lines（log/trace/<日付>_trace.jsonl）に追記し、
+    会計ID からトレースIDを引く索引を持つ。子プロセスの取り込み処理など他プロセスが
+    追記した分は、索引にない会計IDを問い合わせた時点でファイルから読み込む。
+    """
+
+    def __init__(self, directory: str = TRACE_DIR, max_traces: int = MAX_TRACES):
+        self.directory = directory
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self._traces: 'OrderedDict[str, PatientTrace]' = OrderedDict()
+        self._by_account: Dict[str, str] = {}
+        self._file = None
+        self._file_date: Optional[str] = None
+        self._read_offset = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{day}_trace.jsonl")
+
+    def begin(self, trace_id: str, account_id: Any, extracted_at: Optional[float] = None, **fields):
+        """新規登録された会計データのトレースを開始する（抽出と登録の段階を記録する）"""
+        if extracted_at is not None:
+            self.record(trace_id, STAGE_EXTRACTED, ts=extracted_at, account_id=account_id, **fields)
+        self.record(trace_id, STAGE_DB_INSERTED, account_id=account_id, **fields)
+
+    def record(self, trace_id: Optional[str], stage: str, ts: Optional[float] = None, **fields):
+        """
+        段階を記録する（trace_id が None の場合は何もしない）
+
+        トレースは調査用のため、記録に失敗しても例外は送出せず、呼び出し元の処理
+        （割り当て・通知など）を止めない。
+        """
+        if not trace_id:
+            return
+        try:
+            self._record(trace_id, stage, ts, fields)
+        except Exception as e:
+            logger.warning(f"トレースを記録できませんでした: {trace_id} {stage} - {e}")
+
+    def _record(self, trace_id: str, stage: str, ts: Optional[float], fields: Dict[str, Any]):
+        entry = {'trace_id': trace_id, 'stage': stage, 'ts': ts if ts is not None else time.time()}
+        entry.update({key: value for key, value in fields.items() if value is not None})
+        with self._lock:
+            trace = self._apply(entry)
+            self._append(entry)
+            previous = trace.previous_stage_time(stage)
+            first = min(trace.stages.values())
+        if previous is not None:
+            STAGE_SECONDS.observe(max(0.0, entry['ts'] - previous), stage=stage)
+            TOTAL_SECONDS.observe(max(0.0, entry['ts'] - first), stage=stage)
+
+    def record_account(self, account_id: Any, stage: str, **fields) -> Optional[str]:
+        """
+        会計IDに対応するトレースに段階を記録する
+
+        Returns:
+            トレースID（トレースのない会計データの場合None）
+        """
+        trace_id = self.trace_id_of(account_id)
+        self.record(trace_id, stage, **fields)
+        return trace_id
+
+    def trace_id_of(self, account_id: Any) -> Optional[str]:
+        """会計IDに対応するトレースIDを返す（取得できない場合None。例外は送出しない）"""
+        if account_id is None:
+            return None
+        key = str(account_id)
+        try:
+            with self._lock:
+                trace_id = self._by_account.get(key)
+                if trace_id is None:
+                    self._refresh()
+                    trace_id = self._by_account.get(key)
+                return trace_id
+        except Exception as e:
+            logger.warning(f"会計ID {account_id} のトレースIDを取得できませんでした: {e}")
+            return None
+
+    def _apply(self, entry: Dict[str, Any]) -> PatientTrace:
+        trace_id = entry['trace_id']
+        trace = self._traces.get(trace_id)
+        if trace is None:
+            trace = self._traces[trace_id] = PatientTrace(trace_id)
+            while len(self._traces) > self.max_traces:
+                _, old = self._traces.popitem(last=False)
+                self._by_account.pop(str(old.fields.get('account_id')), None)
+        trace.apply(entry)
+        if entry.get('account_id') is not None:
+            self._by_account[str(entry['account_id'])] = trace_id
+        return trace
+
+    def _append(self, entry: Dict[str, Any]):
+        today = datetime.now().strftime('%Y%m%d')
+        try:
+            if self._file_date != today:
+                self._open(today)
+            self._file.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+            self._file.flush()
+        except OSError as e:
+            logger.warning(f"トレースを保存できませんでした: {e}")
+
+    def _open(self, day: str):
+        if self._file is not None:
+            self._file.close()
+        # 読み込み位置をバイト単位で扱うため、改行の変換が入らないバイナリモードで書き込む
+        self._file = open(self._path(day), 'ab')
+        self._file_date = day
+        self._read_offset = 0
+        self._remove_old_files()
+
+    def _remove_old_files(self):
+        cutoff = (datetime.now() - timedelta(days=TRACE_RETENTION_DAYS)).strftime('%Y%m%d')
+        for name in os.listdir(self.directory):
+            if name.endswith('_trace.jsonl') and name[:8] < cutoff:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _refresh(self):
+        """他プロセスが追記した分を読み込む（自分の追記分は重複して適用しても結果は変わらない）"""
+        path = self._path(self._file_date or datetime.now().strftime('%Y%m%d'))
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self._read_offset)
+                while True:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break  # 書き込み途中の行は次回読む
+                    self._read_offset = f.tell()
+                    try:
+                        self._apply(json.loads(line.decode('utf-8')))
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"他プロセスのトレースを読み込めませんでした: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._file_date = None
+
+
+def load_traces(day: Optional[str] = None, directory: str = TRACE_DIR) -> List[PatientTrace]:
+    """指定日（YYYYMMDD、省略時は今日）のトレースをファイルから読み込む"""
+    day = day or datetime.now().strftime('%Y%m%d')
+    traces: Dict[str, PatientTrace] = {}
+    try:
+        with open(os.path.join(directory, f"{day}_trace.jsonl"), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    trace_id = entry['trace_id']
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                traces.setdefault(trace_id, PatientTrace(trace_id)).apply(entry)
+    except FileNotFoundError:
+        return []
+    return list(traces.values())
+
+
+def slowest_traces(day: Optional[str] = None, limit: int = 20, stage: str = STAGE_ASSIGNED) -> List[Dict[str, Any]]:
+    """指定した段階まで進んだトレースを、抽出からの経過時間が長い順に返す"""
+    ranked = []
+    for trace in load_traces(day):
+        if stage in trace.stages and STAGE_EXTRACTED in trace.stages:
+            ranked.append((trace.stages[stage] - trace.stages[STAGE_EXTRACTED], trace))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return [trace.to_dict() for _, trace in ranked[:limit]]
+
+
+def register_trace_routes(server):
+    """
+    LocalEventServer に GET /traces/slowest?date=YYYYMMDD&limit=20&stage=assigned を登録する
+
+    患者ID・病院名・スタッフ名を含むため、token 未設定時は同一端末からのみ取得できる。
+    """
+    def handle_slowest(body, query):
+        try:
+            limit = int(query.get('limit', 20))
+        except ValueError:
+            return 400, {'error': 'invalid limit'}
+        stage = query.get('stage', STAGE_ASSIGNED)
+        if stage not in STAGES:
+            return 400, {'error': f'unknown stage: {stage}'}
+        return 200, {'date': query.get('date') or datetime.now().strftime('%Y%m%d'), 'stage': stage,
+                     'traces': slowest_traces(query.get('date'), limit, stage)}
+    server.add_route('GET', '/traces/slowest', handle_slowest, auth=AUTH_LOCAL)
+
+
+_store: Optional[PatientTraceStore] = None
+_store_lock = threading.Lock()
+
+
+def get_patient_trace_store() -> PatientTraceStore:
+    """プロセス内で共有するトレースの記録先を取得する"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PatientTraceStore()
+        return _store
+
+
+def main():
+    """その日の処理が遅かった患者を、段階ごとの内訳とともに表示する"""
+    parser = argparse.ArgumentParser(description='患者データのトレースを表示する')
+    parser.add_argument('--date', help='対象日 (YYYYMMDD、省略時は今日)')
+    parser.add_argument('--limit', type=int, default=20, help='表示件数')
+    parser.add_argument('--stage', default=STAGE_ASSIGNED, choices=STAGES, help='どの段階までの時間で並べるか')
+    args = parser.parse_args()
+
+    traces = slowest_traces(args.date, args.limit, args.stage)
+    if not traces:
+        print("該当するトレースはありません")
+        return
+    for trace in traces:
+        print(f"{trace['total_seconds']:>9.1f}秒  {trace['trace_id']}  会計ID {trace.get('account_id', '-')}  "
+              f"{trace.get('system', '')} / {trace.get('hospital', '')}  患者ID {trace.get('patient_id', '')}  "
+              f"{trace.get('ticket_number', '')}")
+        print('    ' + ' → '.join(f"{s['stage']}({s['at']}, +{s['seconds']:.1f}秒)" for s in trace['stages']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# src/core/reverted_ticket_tracker.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.utils.logger import LoggerFactory
+from src.utils.backlog_client import get_backlog_client
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('reverted_ticket_tracker')
+
+# ステータスIDの定義
+STATUS_REVERTED = '262863'        # 請求管理: 差し戻し
+STATUS_NOT_AVAILABLE = '242353'   # 在席管理: 不在
+
+# Backlog の updatedSince は日付単位のため、タイムゾーン差を考慮して1日分さかのぼって問い合わせる
+UPDATED_SINCE_MARGIN = timedelta(days=1)
+
+# 更新日時で絞り込まずに全件を確認する間隔の既定値（秒）。[setting] reverted_full_scan_interval で上書き可能
+DEFAULT_FULL_SCAN_INTERVAL = 600
+
+
+class StaffIssueCache:
+    """
+    BacklogユーザーIDごとの在席管理チケット（課題ID・ステータスID）を保持する
+
+    スタッフステータスの同期で取得した在席管理チケットから更新し、
+    差し戻し時の「不在」への更新で検索用のGETを省略するために使う。
+    """
+
+    def __init__(self):
+        self._issues: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def update_from_issues(self, issues: Iterable[Dict[str, Any]]):
+        """在席管理チケットの一覧から保持内容を更新する"""
+        entries = {}
+        for issue in issues:
+            if issue.get('assignee'):
+                entries[str(issue['assignee']['id'])] = {
+                    'id': issue['id'],
+                    'status_id': str((issue.get('status') or {}).get('id', '')),
+                }
+        with self._lock:
+            self._issues.update(entries)
+
+    def get(self, backlog_user_id) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._issues.get(str(backlog_user_id))
+            return dict(entry) if entry else None
+
+    def set_status(self, backlog_user_id, issue_id, status_id):
+        with self._lock:
+            self._issues[str(backlog_user_id)] = {'id': issue_id, 'status_id': str(status_id)}
+
+    def invalidate(self, backlog_user_id=None):
+        """保持内容を破棄する（ユーザー省略時は全件）"""
+        with self._lock:
+            if backlog_user_id is None:
+                self._issues.clear()
+            else:
+                self._issues.pop(str(backlog_user_id), None)
+
+
+class RevertedTicketTracker:
+    """
+    請求管理プロジェクトの差し戻しチケットを差分で取得する
+
+    前回処理したチケットの更新日時を記録し、以降は updatedSince を指定して
+    それより新しい更新だけを問い合わせる。処理に失敗したチケットがある場合は
+    記録を進めないため、次回も取得対象に残る。
+    取りこぼし対策として、full_scan_interval ごとに絞り込まずに全件を確認する。
+    """
+
+    def __init__(self, config, full_scan_interval: float = DEFAULT_FULL_SCAN_INTERVAL):
+        self.config = config
+        self.full_scan_interval = full_scan_interval
+        self._watermark: Optional[str] = None  # 処理済みの最新の更新日時（Backlogの updated 形式）
+        self._fetched_at: Optional[str] = None  # 直近の取得を開始した日時（Backlogの updated 形式）
+        self._last_full_scan: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self._watermark
+
+    def fetch(self, full: bool = False) -> List[Dict[str, Any]]:
+        """
+        差し戻しステータスのチケットを取得する
+
+        Args:
+            full: True の場合は更新日時で絞り込まずに全件を取得する
+                （False でも、未処理の記録が無い場合と full_scan_interval を過ぎた場合は全件を取得する）
+        """
+        params = {
+            "projectId[]": self.config['backlog']['billing_project_id'],
+            "statusId[]": STATUS_REVERTED,
+            "sort": "updated",
+            "order": "asc",
+        }
+        with self._lock:
+            watermark = self._watermark
+            full_scan_due = (self._last_full_scan is None
+                             or time.monotonic() - self._last_full_scan >= self.full_scan_interval)
+        full = full or full_scan_due or not watermark
+        if not full:
+            since = datetime.strptime(watermark[:10], '%Y-%m-%d') - UPDATED_SINCE_MARGIN
+            params["updatedSince"] = since.strftime('%Y-%m-%d')
+
+        # 取得中に更新されたチケットを取りこぼさないよう、問い合わせ前の日時を記録する
+        fetched_at = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        tickets = get_backlog_client(self.config).get_issues(params)
+        with self._lock:
+            self._fetched_at = fetched_at
+            if full:
+                self._last_full_scan = time.monotonic()
+        logger.debug(f"差し戻しチケットを {len(tickets)} 件取得しました"
+                     f"（{'全件' if 'updatedSince' not in params else params['updatedSince'] + ' 以降'}）")
+        return tickets
+
+    def commit(self, tickets: List[Dict[str, Any]], failed_keys: Iterable[str] = ()):
+        """
+        処理結果を記録する
+
+        Args:
+            tickets: fetch() で取得し処理したチケット
+            failed_keys: 処理に失敗したチケットの課題キー
+        """
+        failed_keys = set(failed_keys)
+        updated = [t.get('updated') for t in tickets if t.get('updated')]
+        failed_updated = [t.get('updated') for t in tickets if t.get('issueKey') in failed_keys and t.get('updated')]
+
+        with self._lock:
+            if failed_updated:
+                # 失敗したチケットが次回も取得されるよう、その更新日時までしか進めない
+                candidate = min(failed_updated)
+            else:
+                # すべて処理できた場合は取得時点まで進める（差し戻しが無い場合も次回から差分で問い合わせる）
+                if self._fetched_at:
+                    updated.append(self._fetched_at)
+                candidate = max(updated, default=None)
+            if candidate is None:
+                return
+            if self._watermark is None or candidate > self._watermark:
+                self._watermark = candidate
+
+
+_staff_issue_cache = StaffIssueCache()
+_tracker: Optional[RevertedTicketTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_staff_issue_cache() -> StaffIssueCache:
+    """プロセス内で共有する在席管理チケットのキャッシュを取得する"""
+    return _staff_issue_cache
+
+
+def get_reverted_ticket_tracker(config) -> RevertedTicketTracker:
+    """プロセス内で共有する差し戻しチケットのトラッカーを取得する"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = RevertedTicketTracker(
+                config,
+                full_scan_interval=config.getfloat('setting', 'reverted_full_scan_interval',
+                                                   fallback=DEFAULT_FULL_SCAN_INTERVAL),
+            )
+        return _tracker
@@ -6,14 +6,20 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
+import logging
+import threading
+import time
 import requests
 import mysql.connector
 import configparser
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import traceback
 
 from src.utils.logger import LoggerFactory
+from src.utils.db_pool import get_db_pool
+from src.utils.backlog_client import get_backlog_client
+from src.core.reverted_ticket_tracker import get_staff_issue_cache
 
 # ロガーの初期化
 logger = LoggerFactory.setup_logger('staff_status_sync')
@@ -22,6 +28,13 @@ logger = LoggerFactory.setup_logger('staff_status_sync')
 SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(SCRIPT_DIR, 'config')
 
+# 同期設定の既定値（[setting] セクションで上書き可能）
+DEFAULT_MAX_AGE = 10                # この秒数以内に同期済みであれば同期を省略する
+DEFAULT_RECONCILE_INTERVAL = 600    # この間隔でDBの状態を読み直し、保持している状態とのずれを解消する
+
+# 請求管理チケットの「処理中」ステータスID
+STATUS_PROCESSING = '2'
+
 def load_config():
     """INIファイルから設定情報を読み取る"""
     config = configparser.ConfigParser()
@@ -45,35 +58,21 @@ def get_project_name(config: Dict[str, Any], project_id: str) -> str:
     Returns:
         str: プロジェクト名
     """
-    space_name = config['backlog']['space_name']
-    api_key = config['backlog']['api_key']
-    url = f"https://{space_name}.backlog.com/api/v2/projects/{project_id}"
-    params = {
-        "apiKey": api_key
-    }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    project_data = response.json()
+    project_data = get_backlog_client(config).get_project(project_id)
     return project_data['name']
 
-def get_backlog_issues(config, project_id):
-    """Backlogから課題を取得する関数"""
-    space_name = config['backlog']['space_name']
-    api_key = config['backlog']['api_key']
-    url = f"https://{space_name}.backlog.com/api/v2/issues"
-    params = {
-        "apiKey": api_key,
-        "projectId[]": project_id,
-        "count": 100
-    }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    
-    # プロジェクト名を取得
-    project_name = get_project_name(config, project_id)
+def get_backlog_issues(config, project_id, status_id=None):
+    """Backlogから課題を取得する関数（100件を超える場合もページングして全件取得）"""
+    params = {"projectId[]": project_id}
+    if status_id:
+        params["statusId[]"] = status_id
+    issues = get_backlog_client(config).get_issues(params)
     
-    logger.debug(f"Backlog '{project_name}' (ID: {project_id}) から {len(response.json())} 件の課題を取得しました")
-    return response.json()
+    if logger.isEnabledFor(logging.DEBUG):
+        # プロジェクト名はデバッグ出力時のみ取得する
+        project_name = get_project_name(config, project_id)
+        logger.debug(f"Backlog '{project_name}' (ID: {project_id}) から {len(issues)} 件の課題を取得しました")
+    return issues
 
 def get_staff_category(issue):
     """Backlogの課題からカテゴリ（チーム）情報を取得"""
@@ -103,10 +102,12 @@ def get_staff_status(config):
     
     # 在席管理プロジェクトのチケット取得
     attendance_issues = get_backlog_issues(config, attendance_project_id)
+    # 差し戻し時に在席管理チケットを検索しなくて済むよう、課題IDを記録しておく
+    get_staff_issue_cache().update_from_issues(attendance_issues)
     # logger.info(f"在席管理チケット数: {len(attendance_issues)}")
     
-    # 請求管理プロジェクトのチケット取得
-    billing_issues = get_backlog_issues(config, billing_project_id)
+    # 請求管理プロジェクトのチケット取得（処理中のチケットのみ）
+    billing_issues = get_backlog_issues(config, billing_project_id, status_id=STATUS_PROCESSING)
     # logger.info(f"請求管理チケット数: {len(billing_issues)}")
 
     staff_status = {}
@@ -155,72 +156,205 @@ def get_staff_status(config):
 
     return staff_status
 
-def update_staff_table(config, staff_status):
-    """スタッフ情報をデータベースに更新する関数"""
-    conn = None
-    cursor = None
-    try:
-        conn = mysql.connector.connect(**config['mysql'])
-        cursor = conn.cursor()
-        
-        for backlog_user_id, info in staff_status.items():
-            # まず、スタッフが存在するか確認
-            cursor.execute("""
-                SELECT スタッフID 
-                FROM tbl_staff 
-                WHERE BacklogユーザーID = %s
-            """, (backlog_user_id,))
-            staff_result = cursor.fetchone()
-            
-            if staff_result:
-                # 既存スタッフの更新
-                staff_id = staff_result[0]
-                cursor.callproc('update_staff_status', 
-                            (backlog_user_id, info['name'], info['status'], datetime.now()))
-                
-                # チーム所属情報の更新
-                cursor.execute("DELETE FROM tbl_staff_teams WHERE スタッフID = %s", (staff_id,))
-                
-                for team in info['teams']:
-                    cursor.execute("""
-                        INSERT INTO tbl_staff_teams (スタッフID, チーム)
-                        VALUES (%s, %s)
-                    """, (staff_id, team))
+class StaffStatusSyncService:
+    """
+    Backlogのスタッフ状態をDB（tbl_staff / tbl_staff_teams）へ同期するサービス
+
+    前回同期したスタッフ・チームの状態をメモリに保持し、変化のあった行だけを
+    1トランザクションでまとめて反映する。最後に同期した時刻を保持するため、
+    直近に同期済みであれば同期を省略できる。
+    保持している状態はDBから読み込んだものを基準とし、reconcile_interval ごとに読み直す。
+    """
+
+    def __init__(self, config, max_age: float = DEFAULT_MAX_AGE,
+                 reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL):
+        self.config = config
+        self.max_age = max_age
+        self.reconcile_interval = reconcile_interval
+        # BacklogユーザーID -> {'staff_id', 'name', 'status', 'teams'}
+        self._known: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at: Optional[float] = None
+        self._synced_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def synced_at(self) -> Optional[float]:
+        """最後に同期が完了した時刻（time.time()）"""
+        return self._synced_at
+
+    def is_fresh(self, max_age: Optional[float] = None) -> bool:
+        """最後の同期から max_age 秒以内であればTrue"""
+        max_age = self.max_age if max_age is None else max_age
+        return self._synced_at is not None and time.time() - self._synced_at <= max_age
+
+    def forget(self, backlog_user_id=None):
+        """
+        保持している状態を破棄し、次回の同期で書き直させる
+
+        タスク割り当てや差し戻しでスタッフの状態をDBへ直接書き込んだ場合に呼び出す。
+
+        Args:
+            backlog_user_id: 対象のBacklogユーザーID（省略時は全員）
+        """
+        with self._lock:
+            if backlog_user_id is None:
+                self._known.clear()
+                self._loaded_at = None
             else:
-                # 新規スタッフの追加
-                # まずスタッフ基本情報を追加
-                cursor.callproc('update_staff_status', 
-                            (backlog_user_id, info['name'], info['status'], datetime.now()))
-                
-                # 追加されたスタッフのIDを取得
+                self._known.pop(str(backlog_user_id), None)
+
+    def sync_if_stale(self, max_age: Optional[float] = None) -> bool:
+        """直近に同期済みでなければ同期する"""
+        if self.is_fresh(max_age):
+            logger.debug("スタッフステータスは同期済みのため、同期を省略します")
+            return True
+        return self.sync()
+
+    def sync(self) -> bool:
+        """
+        Backlogのスタッフ状態を取得し、変化のあった分だけDBへ反映する
+
+        Returns:
+            bool: 同期に成功した場合True
+        """
+        with self._lock:
+            try:
+                staff_status = get_staff_status(self.config)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Backlog APIへのリクエスト中にエラーが発生しました: {e}")
+                return False
+
+            db_pool = get_db_pool()
+            conn = None
+            cursor = None
+            discard_connection = False
+            try:
+                conn = db_pool.get_connection('staff_status_sync')
+                cursor = conn.cursor()
+
+                if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reconcile_interval:
+                    self._load_known(cursor)
+
+                changes = self._diff(staff_status)
+                if changes:
+                    self._apply(conn, cursor, changes)
+                self._synced_at = time.time()
+                return True
+
+            except mysql.connector.Error as e:
+                discard_connection = isinstance(e, (mysql.connector.errors.OperationalError,
+                                                    mysql.connector.errors.InterfaceError))
+                if conn and not discard_connection:
+                    conn.rollback()
+                # 反映できたか不明なため、次回はDBから読み直す
+                self._known.clear()
+                self._loaded_at = None
+                logger.error(f"データベース操作中にエラーが発生しました: {e}")
+                return False
+            finally:
+                if cursor:
+                    cursor.close()
+                if conn:
+                    db_pool.release_connection(conn, discard=discard_connection)
+
+    def _load_known(self, cursor):
+        """DBの現在のスタッフ・チーム状態を読み込む"""
+        cursor.execute("""
+            SELECT s.スタッフID, s.BacklogユーザーID, s.名前, s.ステータス, st.チーム
+            FROM tbl_staff s
+            LEFT JOIN tbl_staff_teams st ON s.スタッフID = st.スタッフID
+            WHERE s.BacklogユーザーID IS NOT NULL
+        """)
+        known: Dict[str, Dict[str, Any]] = {}
+        for staff_id, backlog_user_id, name, status, team in cursor.fetchall():
+            entry = known.setdefault(str(backlog_user_id), {
+                'staff_id': staff_id, 'name': name, 'status': status, 'teams': set()
+            })
+            if team:
+                entry['teams'].add(team)
+        self._known = known
+        self._loaded_at = time.monotonic()
+        logger.debug(f"DBからスタッフ状態を読み込みました: {len(known)}名")
+
+    def _diff(self, staff_status: Dict[Any, Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Backlogの状態と保持している状態を比較し、変化のあったスタッフを返す"""
+        changes = []
+        for backlog_user_id, info in staff_status.items():
+            known = self._known.get(str(backlog_user_id))
+            if (known is None or known['name'] != info['name'] or known['status'] != info['status']
+                    or known['teams'] != set(info['teams'])):
+                changes.append((str(backlog_user_id), info))
+        return changes
+
+    def _apply(self, conn, cursor, changes: List[Tuple[str, Dict[str, Any]]]):
+        """変化のあったスタッフの状態とチーム所属を1トランザクションで反映する"""
+        sync_time = datetime.now()
+        team_deletes = []
+        team_inserts = []
+        updated: Dict[str, Dict[str, Any]] = {}
+
+        for backlog_user_id, info in changes:
+            known = self._known.get(backlog_user_id)
+            if known is None or known['name'] != info['name'] or known['status'] != info['status']:
+                cursor.callproc('update_staff_status',
+                                (backlog_user_id, info['name'], info['status'], sync_time))
+
+            if known is None:
+                # 新規スタッフ（または状態を破棄したスタッフ）はIDと現在のチームを確認する
                 cursor.execute("""
                     SELECT スタッフID 
                     FROM tbl_staff 
                     WHERE BacklogユーザーID = %s
                 """, (backlog_user_id,))
-                new_staff = cursor.fetchone()
-                
-                if new_staff:
-                    # チーム所属情報を追加
-                    for team in info['teams']:
-                        cursor.execute("""
-                            INSERT INTO tbl_staff_teams (スタッフID, チーム)
-                            VALUES (%s, %s)
-                        """, (new_staff[0], team))
-                    logger.info(f"新規スタッフを追加しました: {info['name']}, BacklogユーザーID: {backlog_user_id}")
+                staff_result = cursor.fetchone()
+                if not staff_result:
+                    continue
+                staff_id = staff_result[0]
+                cursor.execute("SELECT チーム FROM tbl_staff_teams WHERE スタッフID = %s", (staff_id,))
+                current_teams = {row[0] for row in cursor.fetchall()}
+            else:
+                staff_id = known['staff_id']
+                current_teams = known['teams']
+
+            new_teams = set(info['teams'])
+            team_deletes.extend((staff_id, team) for team in current_teams - new_teams)
+            team_inserts.extend((staff_id, team) for team in new_teams - current_teams)
+            updated[backlog_user_id] = {
+                'staff_id': staff_id, 'name': info['name'], 'status': info['status'], 'teams': new_teams
+            }
+
+        if team_deletes:
+            cursor.executemany("DELETE FROM tbl_staff_teams WHERE スタッフID = %s AND チーム = %s", team_deletes)
+        if team_inserts:
+            cursor.executemany("""
+                INSERT INTO tbl_staff_teams (スタッフID, チーム)
+                VALUES (%s, %s)
+            """, team_inserts)
 
         conn.commit()
+        self._known.update(updated)
+        logger.info(f"スタッフステータスを同期しました: 更新 {len(updated)}名 "
+                    f"(チーム追加 {len(team_inserts)}件, 削除 {len(team_deletes)}件)")
 
-    except mysql.connector.Error as e:
-        if conn:
-            conn.rollback()
-        logger.error(f"データベース操作中にエラーが発生しました: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
-            logger.debug("データベース接続を閉じました")
+
+_service: Optional[StaffStatusSyncService] = None
+_service_lock = threading.Lock()
+
+
+def get_staff_status_sync_service(config=None) -> StaffStatusSyncService:
+    """プロセス内で共有するスタッフ同期サービスを取得する"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            if config is None:
+                config = load_config()
+            _service = StaffStatusSyncService(
+                config,
+                max_age=config.getfloat('setting', 'staff_sync_max_age', fallback=DEFAULT_MAX_AGE),
+                reconcile_interval=config.getfloat('setting', 'staff_sync_reconcile_interval',
+                                                   fallback=DEFAULT_RECONCILE_INTERVAL),
+            )
+        return _service
 
 def main():
     try:
@@ -231,12 +365,9 @@ def main():
             logger.error("設定の読み込みに失敗しました")
             return
 
-        staff_status = get_staff_status(config)
-        if staff_status is None:
+        if not get_staff_status_sync_service(config).sync():
             logger.error("スタッフ状態の更新に失敗しました")
             return
-
-        update_staff_table(config, staff_status)
         
         logger.debug("スタッフステータスの同期が完了しました")
     except requests.exceptions.RequestException as e:
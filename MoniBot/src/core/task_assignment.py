@@ -11,9 +11,22 @@ import requests
 import mysql.connector
 import configparser
 from datetime import datetime
-import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Dict, Any
 from src.utils.logger import LoggerFactory
+from src.utils.db_pool import get_db_pool
+from src.utils.backlog_client import get_backlog_client
+from src.utils.metrics import get_metrics_registry
+from src.core.assignment_trigger import REASON_REVERTED, REASON_STAFF_STATUS, REASON_SWEEP
+from src.core.staff_status_sync import get_staff_status_sync_service
+from src.core.webhook_notifier import get_webhook_notifier, shutdown_webhook_notifier
+from src.core.patient_trace import STAGE_ASSIGNED, get_patient_trace_store
+from src.core.reverted_ticket_tracker import (
+    STATUS_NOT_AVAILABLE, get_reverted_ticket_tracker, get_staff_issue_cache
+)
+from src.core.assignment_planner import (
+    load_pending_accounts, load_available_staff, plan_assignments, apply_assignments, cancel_assignments
+)
 
 # ロガーの初期化
 logger = LoggerFactory.setup_logger('task_assignment')
@@ -25,13 +38,26 @@ logger.propagate = False  # 確実に伝播を無効化
 SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 CONFIG_DIR = os.path.join(SCRIPT_DIR, 'config')
 
+# メトリクス
+_metrics = get_metrics_registry()
+ASSIGNMENT_SECONDS = _metrics.histogram(
+    'monibot_assignment_seconds', 'タスク割り当て処理（process_pending_accounts）の所要時間')
+ASSIGNMENT_STAGE_SECONDS = _metrics.histogram(
+    'monibot_assignment_stage_seconds', 'タスク割り当ての各段階の所要時間', ('stage',))
+ASSIGNMENTS_TOTAL = _metrics.counter(
+    'monibot_assignments_total', '割り当て件数', ('system', 'result'))
+TIME_TO_ASSIGNMENT_SECONDS = _metrics.histogram(
+    'monibot_time_to_assignment_seconds', '会計データの登録から割り当て完了までの時間', ('system',),
+    buckets=(5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+
 # チケットステータスの定義
 TASK_STATUS_UNASSIGNED = '未割当'
 TASK_STATUS_ASSIGNED = '割当済'
 TASK_STATUS_REVERTED = '差戻'
 
-# P0対策: HTTP通信タイムアウト設定 (接続タイムアウト, 読み取りタイムアウト)
-HTTP_TIMEOUT = (5, 30)  # 5秒で接続、30秒で読み取り
+# Backlog更新を並行実行するスレッド数の既定値（[setting] assignment_fanout_workers で上書き可能）
+DEFAULT_FANOUT_WORKERS = 8
+_fanout_executor = None
 
 # P1対策: ハートビート監視設定
 HEARTBEAT_INTERVAL = 60  # 60秒ごとにハートビート
@@ -74,82 +100,28 @@ def clean_old_logs(log_dir, days):
                 logger.info(f"古い出力ログファイルを削除しました: {filename}")
 
 def get_team_pending_accounts(cursor):
-    """チームごとの未処理タスクを取得"""
+    """チームごとの未処理タスクを、割り当てに必要な付帯情報と合わせて取得"""
     try:
-        # NULLパラメータを明示的に渡す
-        args = (None,)
-        cursor.callproc('get_team_pending_accounts', args)
-        
-        # 結果の取得
-        for result in cursor.stored_results():
-            pending_accounts = result.fetchall()
-            if pending_accounts:
-                logger.debug(f"未処理タスクを {len(pending_accounts)} 件取得しました")
-            else:
-                logger.info("未処理タスクはありません")
-            return pending_accounts
-        return []
+        pending_accounts = load_pending_accounts(cursor)
+        if pending_accounts:
+            logger.debug(f"未処理タスクを {len(pending_accounts)} 件取得しました")
+        else:
+            logger.info("未処理タスクはありません")
+        return pending_accounts
     except mysql.connector.Error as e:
         logger.error(f"未処理タスクの取得中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
         raise
 
-def get_available_staff(cursor):
-    '''
-    tbl_staffテーブルから「在席」状態のスタッフを取得する
-    最終割り当て時間でソートし、最も古い順に返す
-    '''
-    cursor.callproc('get_available_staff')
-    return cursor.fetchall()
-
-def get_available_staff_for_hospital(cursor, team):
-    """チームに所属する利用可能なスタッフを取得する関数"""
-    try:
-        query = """
-            SELECT DISTINCT s.スタッフID, s.名前, s.BacklogユーザーID, s.ステータス, s.最終割り当て時間
-            FROM tbl_staff s
-            JOIN tbl_staff_teams st ON s.スタッフID = st.スタッフID
-            WHERE s.ステータス = '在席'  -- 厳密に「在席」のみ
-            AND st.チーム = %s
-            ORDER BY s.最終割り当て時間 ASC
-            FOR UPDATE
-        """
-        
-        cursor.execute(query, (team,))
-        staff_list = cursor.fetchall()
-
-        for staff in staff_list:
-            logger.debug(f"利用可能なスタッフ: ID={staff[0]}, 名前={staff[1]}, "
-                      f"ステータス={staff[3]}, 最終割り当て時間={staff[4]}")
-
-        return staff_list
-
-    except Exception as e:
-        logger.error(f"利用可能なスタッフの取得中にエラー: {e}", exc_info=True)  # P1対策: スタックトレース追加
-        return []
-
-def get_pending_accounts(cursor):
-    '''tbl_pendingaccountsテーブルから「未登録」状態の会計を取得する'''
-    cursor.callproc('get_pending_accounts')
-    return cursor.fetchall()
+def get_reverted_tickets(config, full=False):
+    """
+    差し戻しステータスのチケットを取得（前回処理分以降の更新のみ）
 
-def get_reverted_tickets(config):
-    """差し戻しステータスのチケットを取得"""
+    Args:
+        full: True の場合は更新日時で絞り込まずに全件を取得する
+            （False でも一定間隔ごとに全件を取得する。RevertedTicketTracker を参照）
+    """
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
-        project_id = config['backlog']['billing_project_id']
-
-        # Backlog APIのエンドポイント
-        endpoint = f"https://{space_name}.backlog.com/api/v2/issues"
-        params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "statusId[]": "262863",  # 差し戻しのステータスID
-        }
-
-        response = requests.get(endpoint, params=params, timeout=HTTP_TIMEOUT)  # P0対策
-        response.raise_for_status()
-        return response.json()
+        return get_reverted_ticket_tracker(config).fetch(full=full)
 
     except Exception as e:
         logger.error(f"差し戻しチケットの取得中にエラーが発生: {e}", exc_info=True)  # P1対策: スタックトレース追加
@@ -159,47 +131,39 @@ def update_staff_status_in_backlog(config, backlog_user_id):
 # def update_backlog_status(config, backlog_user_id):
     """Backlogの在席管理プロジェクトのステータスを不在に更新"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['staff_project_id']
-        status_id_not_available = "242353"  # 不在のステータスID
-
-        # 該当ユーザーの在席管理チケットを取得
-        issues_url = f"https://{space_name}.backlog.com/api/v2/issues"
-        params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "assigneeId[]": backlog_user_id,
-        }
-        
-        response = requests.get(issues_url, params=params, timeout=HTTP_TIMEOUT)  # P0対策
-        response.raise_for_status()
-        issues = response.json()
-
-        if issues:
-            issue = issues[0]
-            
-            # すでに不在の場合は更新をスキップ
-            if issue['status']['id'] == int(status_id_not_available):
-                logger.info(f"スタッフはすでに不在状態です: ユーザーID {backlog_user_id}")
-                return True
-
-            # ステータスを不在に更新
-            update_url = f"{issues_url}/{issue['id']}"
-            update_params = {
-                "apiKey": api_key,
-                "statusId": status_id_not_available
-            }
-            
-            response = requests.patch(update_url, params=update_params, timeout=HTTP_TIMEOUT)  # P0対策
-            response.raise_for_status()
-            logger.info(f"Backlogの在席状態を不在に更新しました: ユーザーID {backlog_user_id}")
-            return True
+        status_id_not_available = STATUS_NOT_AVAILABLE  # 不在のステータスID
+        client = get_backlog_client(config)
+        issue_cache = get_staff_issue_cache()
+
+        # 該当ユーザーの在席管理チケットを取得（スタッフ同期で取得済みであれば問い合わせない）
+        cached = issue_cache.get(backlog_user_id)
+        if cached:
+            issue_id, current_status_id = cached['id'], cached['status_id']
         else:
-            logger.error(f"在席管理チケットが見つかりません: ユーザーID {backlog_user_id}", exc_info=True)  # P1対策: スタックトレース追加
-            return False
+            issues = client.get_issues({
+                "projectId[]": project_id,
+                "assigneeId[]": backlog_user_id,
+            }, max_items=1)
+            if not issues:
+                logger.error(f"在席管理チケットが見つかりません: ユーザーID {backlog_user_id}", exc_info=True)  # P1対策: スタックトレース追加
+                return False
+            issue_id, current_status_id = issues[0]['id'], str(issues[0]['status']['id'])
+
+        # すでに不在の場合は更新をスキップ
+        if current_status_id == status_id_not_available:
+            logger.info(f"スタッフはすでに不在状態です: ユーザーID {backlog_user_id}")
+            return True
+
+        # ステータスを不在に更新
+        client.update_issue(issue_id, {"statusId": status_id_not_available})
+        issue_cache.set_status(backlog_user_id, issue_id, status_id_not_available)
+        logger.info(f"Backlogの在席状態を不在に更新しました: ユーザーID {backlog_user_id}")
+        return True
             
     except requests.exceptions.RequestException as e:
+        # キャッシュした課題IDが古い可能性があるため、次回は問い合わせ直す
+        get_staff_issue_cache().invalidate(backlog_user_id)
         logger.error(f"Backlog API リクエストエラー: {e}", exc_info=True)  # P1対策: スタックトレース追加
         if hasattr(e, 'response') and e.response is not None:
             logger.error(f"レスポンス内容: {e.response.content}", exc_info=True)  # P1対策: スタックトレース追加
@@ -211,19 +175,10 @@ def update_staff_status_in_backlog(config, backlog_user_id):
 def update_billing_ticket_status(config, ticket_id):
     """請求管理の差し戻しチケットのステータスを差し戻し済みに更新"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         status_id_reverted = "263209"  # 差し戻し済みのステータスID
 
         # チケットのステータスを更新
-        issues_url = f"https://{space_name}.backlog.com/api/v2/issues/{ticket_id}"
-        update_params = {
-            "apiKey": api_key,
-            "statusId": status_id_reverted
-        }
-        
-        response = requests.patch(issues_url, params=update_params, timeout=HTTP_TIMEOUT)  # P0対策
-        response.raise_for_status()
+        get_backlog_client(config).update_issue(ticket_id, {"statusId": status_id_reverted})
         logger.info(f"請求管理チケット {ticket_id} のステータスを差し戻し済みに更新しました")
         return True
             
@@ -236,303 +191,316 @@ def update_billing_ticket_status(config, ticket_id):
         logger.error(f"請求管理チケットの更新中にエラー: {e}", exc_info=True)  # P1対策: スタックトレース追加
         return False
 
-def handle_reverted_ticket(cursor, ticket, conn, config):
-    """差し戻しチケットの処理"""
-    try:
-        # BacklogユーザーIDからスタッフIDを取得
-        backlog_user_id = ticket['assignee']['id']
-        cursor.execute("""
-            SELECT スタッフID 
-            FROM tbl_staff 
-            WHERE BacklogユーザーID = %s
-        """, (str(backlog_user_id),))
-        
-        staff_result = cursor.fetchone()
-        if not staff_result:
-            logger.error(f"BacklogユーザーID {backlog_user_id} に対応するスタッフが見つかりません", exc_info=True)  # P1対策: スタックトレース追加
-            return
-            
-        staff_id = staff_result[0]
-        ticket_id = ticket['issueKey']
-        
-        # revert_assignmentプロシージャを呼び出し
-        assignment_id = get_assignment_id(cursor, ticket_id)
-        
-        if assignment_id:
-            cursor.execute("START TRANSACTION")
-            
-            try:
-                # 1. revert_assignmentプロシージャ実行
-                cursor.callproc('revert_assignment', (staff_id, assignment_id, ticket_id))
-                
-                # 2. Backlogの在席状態を不在に更新
-                backlog_status_updated = update_staff_status_in_backlog(config, backlog_user_id)
-                # backlog_status_updated = update_backlog_status(config, backlog_user_id)
-                if not backlog_status_updated:
-                    logger.warning(f"Backlogの在席状態の更新に失敗しました: ユーザーID {backlog_user_id}")
-
-                # 3. 請求管理チケットのステータスを差し戻し済みに更新
-                billing_status_updated = update_billing_ticket_status(config, ticket_id)
-                if not billing_status_updated:
-                    logger.warning(f"請求管理チケット {ticket_id} のステータス更新に失敗しました")
-                
-                cursor.execute("COMMIT")
-                logger.info(f"チケット {ticket_id} の差し戻し処理が完了しました")
-                logger.info(f"スタッフID {staff_id} のステータスを不在に更新しました")
-                
-            except Exception as e:
-                cursor.execute("ROLLBACK")
-                logger.error(f"差し戻し処理中にエラー発生: {e}", exc_info=True)  # P1対策: スタックトレース追加
-                raise e
-                
-    except KeyError as e:
-        logger.error(f"チケット情報の取得中にエラー: キー {e} が見つかりません", exc_info=True)  # P1対策: スタックトレース追加
-        logger.debug(f"チケット情報: {ticket}")
-    except Exception as e:
-        logger.error(f"差し戻し処理中にエラー: {e}", exc_info=True)  # P1対策: スタックトレース追加
+def revert_ticket_in_db(cursor, ticket, staff_ids, assignment_ids):
+    """
+    差し戻しチケットの割り当てをDB上で取り消す
+
+    Returns:
+        bool: 取り消した場合True（対象が見つからない場合はFalse）
+    """
+    # BacklogユーザーIDからスタッフIDを取得
+    backlog_user_id = ticket['assignee']['id']
+    staff_id = staff_ids.get(str(backlog_user_id))
+    if not staff_id:
+        logger.error(f"BacklogユーザーID {backlog_user_id} に対応するスタッフが見つかりません", exc_info=True)  # P1対策: スタックトレース追加
+        return False
+
+    ticket_id = ticket['issueKey']
+    assignment_id = assignment_ids.get(ticket_id)
+    if not assignment_id:
+        logger.warning(f"チケット {ticket_id} の割り当て履歴が見つかりません")
+        return False
+
+    # revert_assignmentプロシージャ実行（プロシージャ内でコミットされる）
+    cursor.callproc('revert_assignment', (staff_id, assignment_id, ticket_id))
+    logger.info(f"スタッフID {staff_id} のステータスを不在に更新しました")
+    return True
+
+def update_reverted_ticket_in_backlog(config, ticket):
+    """差し戻しを処理したチケットのBacklog側の状態を更新する"""
+    backlog_user_id = ticket['assignee']['id']
+    ticket_id = ticket['issueKey']
+
+    # Backlogの在席状態を不在に更新
+    backlog_status_updated = update_staff_status_in_backlog(config, backlog_user_id)
+    if not backlog_status_updated:
+        logger.warning(f"Backlogの在席状態の更新に失敗しました: ユーザーID {backlog_user_id}")
+
+    # 請求管理チケットのステータスを差し戻し済みに更新
+    billing_status_updated = update_billing_ticket_status(config, ticket_id)
+    if not billing_status_updated:
+        logger.warning(f"請求管理チケット {ticket_id} のステータス更新に失敗しました")
+    return billing_status_updated
+
+def handle_reverted_tickets(cursor, tickets, conn, config):
+    """
+    差し戻しチケットをまとめて処理する
+
+    DBの割り当て取り消しを順に行った後、Backlog側の更新を並行して実行する。
+
+    Returns:
+        set: 処理に失敗したチケットの課題キー
+    """
+    failed = set()
+    valid = []
+    for ticket in tickets:
+        if not ticket.get('assignee') or not ticket.get('issueKey'):
+            logger.error(f"チケット情報に担当者または課題キーがありません: {ticket.get('issueKey', '不明')}")
+            logger.debug(f"チケット情報: {ticket}")
+            continue
+        valid.append(ticket)
+    if not valid:
+        return failed
+
+    staff_ids = get_staff_ids(cursor, [ticket['assignee']['id'] for ticket in valid])
+    assignment_ids = get_assignment_ids(cursor, [ticket['issueKey'] for ticket in valid])
+
+    reverted = []
+    for ticket in valid:
+        try:
+            if revert_ticket_in_db(cursor, ticket, staff_ids, assignment_ids):
+                reverted.append(ticket)
+        except Exception as e:
+            conn.rollback()
+            failed.add(ticket['issueKey'])
+            logger.error(f"差し戻し処理中にエラー発生: {e}", exc_info=True)  # P1対策: スタックトレース追加
+
+    if not reverted:
+        return failed
+
+    # 差し戻しでスタッフの状態を直接更新したため、同期サービスの保持状態を破棄する
+    sync_service = get_staff_status_sync_service(config)
+    for ticket in reverted:
+        sync_service.forget(ticket['assignee']['id'])
+
+    executor = _get_fanout_executor(config)
+    futures = {executor.submit(update_reverted_ticket_in_backlog, config, ticket): ticket for ticket in reverted}
+    for future in as_completed(futures):
+        ticket = futures[future]
+        if future.result():
+            logger.info(f"チケット {ticket['issueKey']} の差し戻し処理が完了しました")
+        else:
+            failed.add(ticket['issueKey'])
+    return failed
+
+def get_staff_ids(cursor, backlog_user_ids):
+    """
+    BacklogユーザーIDからスタッフIDをまとめて取得する
 
-def get_assignment_id(cursor, ticket_number):
+    Returns:
+        dict: BacklogユーザーID（文字列） -> スタッフID
+    """
+    backlog_user_ids = sorted({str(user_id) for user_id in backlog_user_ids})
+    if not backlog_user_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT BacklogユーザーID, スタッフID
+        FROM tbl_staff
+        WHERE BacklogユーザーID IN ({', '.join(['%s'] * len(backlog_user_ids))})
+    """, backlog_user_ids)
+    return {str(user_id): staff_id for user_id, staff_id in cursor.fetchall()}
+
+def get_assignment_ids(cursor, ticket_numbers):
     """
-    Backlogチケット番号から割り当てIDを取得する
+    Backlogチケット番号から最新の割り当てIDをまとめて取得する
     
     Args:
         cursor: データベースカーソル
-        ticket_number: Backlogチケット番号
+        ticket_numbers: Backlogチケット番号のリスト
         
     Returns:
-        int: 割り当てID
-        None: 割り当てが見つからない場合
+        dict: Backlogチケット番号 -> 割り当てID（割り当てが見つからないチケットは含まない）
     """
+    ticket_numbers = sorted(set(ticket_numbers))
+    if not ticket_numbers:
+        return {}
     try:
-        cursor.execute("""
-            SELECT 割り当てID 
+        cursor.execute(f"""
+            SELECT Backlogチケット番号, 割り当てID
             FROM tbl_assignmenthistory 
-            WHERE Backlogチケット番号 = %s
-            ORDER BY 割り当て時間 DESC 
-            LIMIT 1
-        """, (ticket_number,))
+            WHERE Backlogチケット番号 IN ({', '.join(['%s'] * len(ticket_numbers))})
+            ORDER BY 割り当て時間 ASC
+        """, ticket_numbers)
         
-        result = cursor.fetchone()
-        return result[0] if result else None
+        # 割り当て時間の昇順のため、最後に出現したものが最新
+        return {ticket_number: assignment_id for ticket_number, assignment_id in cursor.fetchall()}
         
     except Exception as e:
         logger.error(f"割り当てID取得中にエラー: {e}", exc_info=True)  # P1対策: スタックトレース追加
-        return None
+        return {}
 
-def update_billing_task_status_in_backlog(conn, config, account_info, staff_info):
-# def update_backlog_status(conn, config, account_info, staff_info):
-    """Backlogのチケットステータスを更新"""
-    space_name = config['backlog']['space_name']
-    api_key = config['backlog']['api_key']
-    
-    # チケット番号を取得
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT Backlogチケット番号
-        FROM tbl_pendingaccounts
-        WHERE 会計ID = %s
-    """, (account_info[0],))
-    result = cursor.fetchone()
-    cursor.close()
-    
-    if not result or not result['Backlogチケット番号']:
-        logger.error(f"会計ID {account_info[0]} のBacklogチケット番号が見つかりません", exc_info=True)  # P1対策: スタックトレース追加
-        return False
-    
-    ticket_number = result['Backlogチケット番号']
-    
+def update_billing_task_status_in_backlog(config, ticket_number, backlog_user_id):
+    """請求管理チケットを処理中にし、担当者を設定する"""
     # 処理中ステータスのID
     in_progress_status_id = "2"  # Backlogの処理中ステータスID
     
     # チケットの更新
-    endpoint = f"https://{space_name}.backlog.com/api/v2/issues/{ticket_number}"
     params = {
-        "apiKey": api_key,
         "statusId": in_progress_status_id,
-        "assigneeId": staff_info[2]  # BacklogユーザーID
+        "assigneeId": backlog_user_id
     }
     
     try:
-        response = requests.patch(endpoint, params=params)
-        response.raise_for_status()
+        get_backlog_client(config).update_issue(ticket_number, params)
         # logger.info(f"Backlogチケット {ticket_number} のステータスを更新しました")
         return True
     except Exception as e:
-        logger.error(f"Backlogチケットの更新中にエラー: {str(e)}", exc_info=True)  # P1対策: スタックトレース追加
+        logger.error(f"Backlogチケット {ticket_number} の更新中にエラー: {str(e)}", exc_info=True)  # P1対策: スタックトレース追加
         return False
 
-def get_hospital_info(conn, hospital_id):
-    '''病院情報を取得する'''
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.callproc('get_hospital_info', (hospital_id,))
-        for result in cursor.stored_results():
-            hospital_info = result.fetchone()
-        
-        if hospital_info:
-            return hospital_info
-        else:
-            logger.warning(f"病院ID {hospital_id} に対応する情報が見つかりません")
-            return {"病院名": "不明な病院", "電子カルテ名": "CLIUS"}  # デフォルト値を設定
-    except mysql.connector.Error as e:
-        logger.error(f"病院情報の取得中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
-        return {"病院名": "エラー", "電子カルテ名": "CLIUS"}  # エラー時もデフォルト値を設定
-    finally:
-        cursor.close()
+def _get_fanout_executor(config):
+    """Backlogのチケット更新を並行実行するスレッドプールを取得する"""
+    global _fanout_executor
+    if _fanout_executor is None:
+        workers = max(1, config.getint('setting', 'assignment_fanout_workers', fallback=DEFAULT_FANOUT_WORKERS))
+        _fanout_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='assignment_fanout')
+    return _fanout_executor
 
-def update_databases(conn, cursor, account_id, staff_id, backlog_issue_id):
-    try:
-        # デバッグログでbacklog_issue_idを確認
-        logger.debug(f"バックログチケットID: {backlog_issue_id}")
-        
-        # backlog_issue_idがNoneの場合、tbl_pendingaccountsから取得
-        if not backlog_issue_id:
-            cursor.execute("""
-                SELECT Backlogチケット番号
-                FROM tbl_pendingaccounts
-                WHERE 会計ID = %s
-            """, (account_id,))
-            result = cursor.fetchone()
-            backlog_issue_id = result[0] if result else 'Unknown'
-            logger.debug(f"会計ID {account_id} のバックログチケットIDを取得: {backlog_issue_id}")
-
-        # 差し戻しタスクかどうかを確認し、元チケット番号を取得
-        cursor.execute("""
-            SELECT Backlogチケット番号
-            FROM tbl_assignmenthistory
-            WHERE 会計ID = %s AND 差戻時間 IS NOT NULL
-            ORDER BY 差戻時間 DESC
-            LIMIT 1
-        """, (account_id,))
-        result = cursor.fetchone()
-        original_ticket_id = result[0] if result else None
-
-        # プロシージャ呼び出し（元チケット番号を追加）
-        cursor.callproc('update_assignment', (
-            account_id,
-            staff_id,
-            str(backlog_issue_id),
-            original_ticket_id
-        ))
-        conn.commit()
-        # logger.info(f"データベースが正常に更新されました: 会計ID={account_id}, BacklogチケットID={backlog_issue_id}")
-    except mysql.connector.Error as e:
-        logger.error(f"データベース更新中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
-        conn.rollback()
+def update_billing_tickets_in_backlog(config, plan):
+    """
+    割り当て計画のBacklogチケットを並行して更新する（レート制限は共通クライアントが管理する）
 
+    Returns:
+        list: 更新に失敗した割り当て
+    """
+    executor = _get_fanout_executor(config)
+    futures = {
+        executor.submit(update_billing_task_status_in_backlog, config, a.ticket_number, a.backlog_user_id): a
+        for a in plan
+    }
+    return [futures[future] for future in as_completed(futures) if not future.result()]
+
+def send_assignment_notifications(config, assignments):
+    """割り当て完了のWebhook通知を送信キューに積む（送信完了は待たない）"""
+    for a in assignments:
+        if a.created_at:
+            # 正しい取得時間で説明文を生成
+            description = (
+                f"電子カルテ名: {a.emr_name}\n"
+                f"病院名: {a.hospital_name}\n"
+                f"患者ID: {a.patient_id}\n"
+                f"診察日: {a.created_at.strftime('%Y-%m-%d')}\n"
+                f"取得時間: {a.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+            )
+            send_webhook_notification_with_description(
+                config, a.staff, a.ticket_number, a.account_id, a.hospital_name, a.patient_id, description)
+        else:
+            logger.warning(f"会計ID {a.account_id} の取得時間が見つかりません")
+            # フォールバック: 従来の方法でWebhook送信
+            send_webhook_notification(
+                config, a.staff, a.ticket_number, a.account_id, a.hospital_name, a.patient_id, a.hospital_info)
 
-def sync_staff_status():
-    try:
-        # スクリプトの絶対パスを使用
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        staff_status_sync_path = os.path.join(script_dir, "staff_status_sync.py")
-        
-        subprocess.run([sys.executable, staff_status_sync_path], check=True)
-        logger.debug("スタッフステータスの同期が完了しました")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"スタッフステータスの同期中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
-    except FileNotFoundError:
-        logger.error(f"staff_status_sync.pyファイルが見つかりません パス: {staff_status_sync_path}", exc_info=True)  # P1対策: スタックトレース追加
+def sync_staff_status(config, force=False):
+    """
+    スタッフステータスをBacklogから同期する（プロセス内の同期サービスを使用）
 
-def get_acquisition_time_from_db(conn, account_id):
-    """DBから実際の取得時間（作成時間）を取得"""
-    cursor = conn.cursor()
+    Args:
+        config: 設定
+        force: 直近に同期済みでも必ず同期する場合True（在席変更の通知を受けた場合など）
+    """
     try:
-        cursor.execute("SELECT 作成時間 FROM tbl_pendingaccounts WHERE 会計ID = %s", (account_id,))
-        result = cursor.fetchone()
-        return result[0] if result else None
+        service = get_staff_status_sync_service(config)
+        synced = service.sync() if force else service.sync_if_stale()
+        if synced:
+            logger.debug("スタッフステータスの同期が完了しました")
+        else:
+            logger.error("スタッフステータスの同期に失敗しました")
     except Exception as e:
-        logger.error(f"DB取得時間の取得エラー: {e}", exc_info=True)  # P1対策: スタックトレース追加
-        return None
-    finally:
-        cursor.close()
+        logger.error(f"スタッフステータスの同期中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
 
-def send_webhook_notification(config, staff_info, ticket_number, account_id, hospital_name, patient_id, hospital_info=None):
-    """タスク割り当て完了時にWebhookサーバーに通知を送信する（DB作成時間使用版）"""
-    try:
-        # Webhookサーバーの設定を読み込む
-        webhook_url = config.get('webhook', 'url', fallback='http://localhost:5000/webhook/new_ticket')
-        
-        # ★修正: DBから実際の取得時間を取得
-        # グローバルなconnectionを取得する必要があります
-        # process_pending_accounts関数内でconnectionを渡すように修正が必要
-        
-        # 現在の時刻（タスク割り当て時刻）
-        assignment_time = datetime.now().isoformat()
+def build_webhook_payload(config, staff_info, ticket_number, hospital_name, patient_id, description="", trace_id=None):
+    """タスク割り当て完了時にWebhookサーバーへ送るデータを作成する（trace_id は患者データのトレースID）"""
+    # 現在の時刻（タスク割り当て時刻）
+    assignment_time = datetime.now().isoformat()
+
+    return {
+        "event_type": "processing_ticket",  # Web画面での検出キー
+        "timestamp": assignment_time,  # タスク割り当て時刻
         
-        # 送信するデータを準備
-        data = {
-            "event_type": "processing_ticket",  # Web画面での検出キー
-            "timestamp": assignment_time,  # タスク割り当て時刻
-            
-            # Backlogチケット情報
-            "id": ticket_number,
-            "issueKey": ticket_number,
-            "assigneeId": str(staff_info[2]),  # BacklogユーザーIDを文字列に変換
-            
-            # プロジェクト情報
-            "projectId": config['backlog']['billing_project_id'],
-            "summary": f"{hospital_name} - {patient_id}",
-            
-            # ★修正: DBの作成時間を使用した説明文
-            # この部分は後で acquisition_time を使って生成
-            "description": "",  # 一旦空にして後で設定
-            
-            # ステータス情報
-            "status": {
-                "id": 2,  # 処理中ステータスID
-                "name": "処理中"
-            }
-        }
+        # Backlogチケット情報
+        "id": ticket_number,
+        "issueKey": ticket_number,
+        "assigneeId": str(staff_info[2]),  # BacklogユーザーIDを文字列に変換
         
-        # POSTリクエストでWebhookを送信
-        response = requests.post(webhook_url, json=data, timeout=HTTP_TIMEOUT)  # P0対策
+        # プロジェクト情報
+        "projectId": config['backlog']['billing_project_id'],
+        "summary": f"{hospital_name} - {patient_id}",
+        "description": description,
         
-        if response.status_code >= 200 and response.status_code < 300:
-            logger.info(f"Webhook通知の送信に成功しました: {ticket_number}")
-            return True
-        else:
-            logger.warning(f"Webhook通知の送信に失敗しました: ステータスコード {response.status_code}, レスポンス: {response.text}")
-            return False
-            
+        # ステータス情報
+        "status": {
+            "id": 2,  # 処理中ステータスID
+            "name": "処理中"
+        },
+
+        # 抽出から通知までを追跡するトレースID
+        "traceId": trace_id
+    }
+
+def send_webhook_notification(config, staff_info, ticket_number, account_id, hospital_name, patient_id, hospital_info=None):
+    """
+    タスク割り当て完了時にWebhookサーバーへの通知を送信キューに積む
+
+    送信はバックグラウンドで行い、失敗した通知はスプールから再送される。
+    """
+    try:
+        data = build_webhook_payload(config, staff_info, ticket_number, hospital_name, patient_id,
+                                     trace_id=get_patient_trace_store().trace_id_of(account_id))
+        return get_webhook_notifier(config).submit(data)
     except Exception as e:
-        logger.error(f"Webhook通知の送信中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
+        logger.error(f"Webhook通知の登録中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
         return False
 
-def process_pending_accounts(config):
+def process_pending_accounts(config, check_reverted=True, force_staff_sync=True, full_reverted_scan=True):
+    """
+    差し戻しチケットの処理と未割当タスクの割り当てを行う
+
+    Args:
+        config: 設定
+        check_reverted: Backlogの差し戻しチケットを確認する場合True
+            （新規会計データの登録で起動された場合は不要なため省略できる）
+        force_staff_sync: スタッフステータスを必ず同期する場合True
+            （False の場合は直近に同期済みであれば省略する）
+        full_reverted_scan: 差し戻しチケットを更新日時で絞り込まずに全件確認する場合True
+            （False の場合は前回処理した更新以降のみを問い合わせる）
+    """
+    with ASSIGNMENT_SECONDS.time():
+        _process_pending_accounts(config, check_reverted, force_staff_sync, full_reverted_scan)
+
+
+def _process_pending_accounts(config, check_reverted, force_staff_sync, full_reverted_scan):
     # P1対策: ハートビート更新
     update_heartbeat()
-    logger.info("=== タスク割当処理を開始 ===")
+    logger.debug("=== タスク割当処理を開始 ===")
     
-    conn = mysql.connector.connect(
-        host=config['mysql']['host'],
-        user=config['mysql']['user'],
-        password=config['mysql']['password'],
-        database=config['mysql']['database']
-    )
+    db_pool = get_db_pool()
+    conn = db_pool.get_connection('task_assignment')
     cursor = conn.cursor()
+    discard_connection = False
 
     try:
         # 1. 差戻ステータスのチケットを検知して処理
-        reverted_tickets = get_reverted_tickets(config)
-        logger.info(f"差戻しチケット数: {len(reverted_tickets)}")
-        
-        for ticket in reverted_tickets:
-            handle_reverted_ticket(cursor, ticket, conn, config)
-        
-        # 差戻し処理の確実なコミット
-        conn.commit()
-        # P1対策: ハートビート更新
-        update_heartbeat()
-        
-        # 少し待機して、状態の反映を待つ
-        time.sleep(2)
-
-        # 初期スタッフステータスを同期
-        sync_staff_status()
+        if check_reverted:
+            with ASSIGNMENT_STAGE_SECONDS.time(stage='reverted'):
+                reverted_tickets = get_reverted_tickets(config, full=full_reverted_scan)
+                if reverted_tickets:
+                    logger.info(f"差戻しチケット数: {len(reverted_tickets)}")
+                
+                failed_tickets = handle_reverted_tickets(cursor, reverted_tickets, conn, config)
+                get_reverted_ticket_tracker(config).commit(reverted_tickets, failed_tickets)
+                
+                # 差戻し処理の確実なコミット
+                conn.commit()
+            # P1対策: ハートビート更新
+            update_heartbeat()
+            
+            # 差し戻しを処理した場合は、Backlog側の状態の反映を少し待つ
+            if reverted_tickets:
+                time.sleep(2)
 
         # 2. 未割当タスクを取得
-        pending_accounts = get_team_pending_accounts(cursor)
+        with ASSIGNMENT_STAGE_SECONDS.time(stage='load_pending'):
+            pending_accounts = get_team_pending_accounts(cursor)
         # P1対策: ハートビート更新
         update_heartbeat()
         
@@ -542,7 +510,7 @@ def process_pending_accounts(config):
         
         if pending_accounts:
             for account in pending_accounts:
-                team = account[5]
+                team = account['team']
                 team_counts[team] = team_counts.get(team, 0) + 1
                 total_pending_accounts += 1
 
@@ -560,181 +528,117 @@ def process_pending_accounts(config):
             logger.info("未割当のタスクがないため、割り当て処理を終了します")
             return
 
-        # 1. ループの外でスタッフステータスを同期
-        sync_staff_status()
-
-        # 2. 各タスクに対して処理
-        for account in pending_accounts:
-            try:
-                # トランザクション開始
-                cursor.execute("START TRANSACTION")
-
-                team = account[5]
-                hospital_id = account[1]
-
-                # スタッフの選択前に状態を確認
-                cursor.execute("""
-                    SELECT s.スタッフID, s.名前, s.BacklogユーザーID, s.ステータス
-                    FROM tbl_staff s
-                    JOIN tbl_staff_teams st ON s.スタッフID = st.スタッフID
-                    WHERE s.ステータス = '在席'  -- 厳密に「在席」のみ
-                    AND st.チーム = %s
-                    ORDER BY s.最終割り当て時間 ASC
-                    FOR UPDATE
-                """, (team,))
-                
-                available_staff = cursor.fetchall()
+        # 3. 割り当て対象がある場合のみ、スタッフステータスを同期
+        with ASSIGNMENT_STAGE_SECONDS.time(stage='staff_sync'):
+            sync_staff_status(config, force=force_staff_sync)
 
-                if not available_staff:
-                    cursor.execute("ROLLBACK")
-                    continue
+        # 4. 在席スタッフを読み込み、割り当て計画を作成してDBへ一括反映
+        cursor.execute("START TRANSACTION")
+        staff_by_team = load_available_staff(cursor, list(team_counts))
+        plan = plan_assignments(pending_accounts, staff_by_team)
 
-                selected_staff = available_staff[0]
-                
-                # 再度状態を確認
-                cursor.execute("""
-                    SELECT ステータス 
-                    FROM tbl_staff 
-                    WHERE スタッフID = %s 
-                    AND ステータス = '在席'
-                    FOR UPDATE
-                """, (selected_staff[0],))
-                
-                if not cursor.fetchone():
-                    logger.warning(f"スタッフ {selected_staff[1]} の状態が変更されたため、割り当てをスキップします")
-                    cursor.execute("ROLLBACK")
-                    continue
-
-                # Backlogの更新
-                if update_billing_task_status_in_backlog(conn, config, account, selected_staff):
-                    cursor.execute("""
-                        SELECT Backlogチケット番号
-                        FROM tbl_pendingaccounts
-                        WHERE 会計ID = %s
-                        FOR UPDATE
-                    """, (account[0],))
-                    ticket_result = cursor.fetchone()
-                    ticket_number = ticket_result[0] if ticket_result else 'Unknown'
-
-                    # 病院名取得
-                    cursor.execute("""
-                        SELECT 病院名 
-                        FROM tbl_hospital 
-                        WHERE 病院ID = %s
-                    """, (hospital_id,))
-                    hospital_name_result = cursor.fetchone()
-                    hospital_name = hospital_name_result[0] if hospital_name_result else "不明な病院"
-
-                    # データベースの更新
-                    update_databases(conn, cursor, account[0], selected_staff[0], None)
-
-                    # 3. スタッフのステータスを "在席(処理中)" に更新
-                    cursor.execute("""
-                        UPDATE tbl_staff
-                        SET ステータス = '在席(処理中)', 最終割り当て時間 = NOW()
-                        WHERE スタッフID = %s
-                    """, (selected_staff[0],))
-
-                    # すべての処理が成功したらコミット
-                    conn.commit()
-                    logger.info(f"🔥 タスク割当完了: スタッフ:{selected_staff[1]}, Backlog:{ticket_number}, "
-                                f"病院名:{hospital_name}, 患者ID:{account[2]}")
-                    
-                    # 病院情報を取得
-                    hospital_info = get_hospital_info(conn, hospital_id)
-
-                    # ★修正: DBから取得時間を取得してWebhook送信
-                    acquisition_time = get_acquisition_time_from_db(conn, account[0])
-                    
-                    if acquisition_time:
-                        # 正しい取得時間で説明文を生成
-                        description = (
-                            f"電子カルテ名: {hospital_info.get('電子カルテ名', 'Unknown')}\n"
-                            f"病院名: {hospital_name}\n"
-                            f"患者ID: {account[2]}\n"
-                            f"診察日: {acquisition_time.strftime('%Y-%m-%d')}\n"
-                            f"取得時間: {acquisition_time.strftime('%Y-%m-%d %H:%M:%S')}"
-                        )
-                        
-                        # Webhook通知を送信（修正版）
-                        send_webhook_notification_with_description(
-                            config, selected_staff, ticket_number, account[0], 
-                            hospital_name, account[2], description
-                        )
-                    else:
-                        logger.warning(f"会計ID {account[0]} の取得時間が見つかりません")
-                        # フォールバック: 従来の方法でWebhook送信
-                        send_webhook_notification(
-                            config,
-                            selected_staff,
-                            ticket_number,
-                            account[0],
-                            hospital_name,
-                            account[2],
-                            hospital_info
-                        )
-                else:
-                    cursor.execute("ROLLBACK")
-                    logger.error("Backlog更新に失敗したため、割り当てをロールバックしました")
-
-            except Exception as e:
-                logger.error(f"会計ID {account[0]} の処理中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
-                cursor.execute("ROLLBACK")
+        waiting_ticket = sum(1 for account in pending_accounts if not account['ticket_number'])
+        if waiting_ticket:
+            logger.info(f"Backlogチケット作成待ちのため割り当て対象外: {waiting_ticket}件")
+
+        if not plan:
+            conn.rollback()
+            logger.info("割り当て可能なスタッフがいないため、割り当て処理を終了します")
+            return
+
+        apply_assignments(cursor, plan)
+        conn.commit()
+        update_heartbeat()
+
+        # スタッフの状態を直接更新したため、同期サービスの保持状態を破棄する
+        sync_service = get_staff_status_sync_service(config)
+        for assignment in plan:
+            sync_service.forget(assignment.backlog_user_id)
+
+        # 5. Backlogのチケット更新を並行実行し、失敗した割り当ては取り消す
+        with ASSIGNMENT_STAGE_SECONDS.time(stage='backlog_update'):
+            failed = update_billing_tickets_in_backlog(config, plan)
+        if failed:
+            cursor.execute("START TRANSACTION")
+            cancel_assignments(cursor, failed)
+            conn.commit()
+            for assignment in failed:
+                logger.error(f"Backlog更新に失敗したため、割り当てを取り消しました: 会計ID {assignment.account_id}, "
+                             f"スタッフ:{assignment.staff_name}")
+
+        succeeded = [assignment for assignment in plan if assignment not in failed]
+        record_assignment_metrics(succeeded, failed)
+        trace_store = get_patient_trace_store()
+        for assignment in succeeded:
+            trace_id = trace_store.record_account(assignment.account_id, STAGE_ASSIGNED,
+                                                  staff=assignment.staff_name, ticket_number=assignment.ticket_number)
+            logger.info(f"🔥 タスク割当完了: スタッフ:{assignment.staff_name}, Backlog:{assignment.ticket_number}, "
+                        f"病院名:{assignment.hospital_name}, 患者ID:{assignment.patient_id}, トレース:{trace_id or '-'}")
+
+        # 6. Webhook通知を送信キューに積む（ダッシュボードへの配信は待たない）
+        send_assignment_notifications(config, succeeded)
+        update_heartbeat()
 
     except mysql.connector.Error as e:
         logger.error(f"データベース操作中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
-        conn.rollback()
+        discard_connection = isinstance(e, (mysql.connector.errors.OperationalError,
+                                            mysql.connector.errors.InterfaceError))
+        if not discard_connection:
+            conn.rollback()
     finally:
         cursor.close()
-        conn.close()
+        db_pool.release_connection(conn, discard=discard_connection)
+
+
+def record_assignment_metrics(succeeded, failed):
+    """割り当て件数と、会計データの登録から割り当てまでの時間を記録する"""
+    now = datetime.now()
+    for assignment in failed:
+        ASSIGNMENTS_TOTAL.inc(system=assignment.emr_name or '', result='failed')
+    for assignment in succeeded:
+        ASSIGNMENTS_TOTAL.inc(system=assignment.emr_name or '', result='assigned')
+        if isinstance(assignment.created_at, datetime):
+            TIME_TO_ASSIGNMENT_SECONDS.observe((now - assignment.created_at).total_seconds(),
+                                               system=assignment.emr_name or '')
 
 
 def send_webhook_notification_with_description(config, staff_info, ticket_number, account_id, hospital_name, patient_id, description):
-    """説明文を指定してWebhook通知を送信"""
+    """説明文を指定してWebhook通知を送信キューに積む"""
     try:
-        webhook_url = config.get('webhook', 'url', fallback='http://localhost:5000/webhook/new_ticket')
-        assignment_time = datetime.now().isoformat()
-        
-        data = {
-            "event_type": "processing_ticket",
-            "timestamp": assignment_time,
-            "id": ticket_number,
-            "issueKey": ticket_number,
-            "assigneeId": str(staff_info[2]),
-            "projectId": config['backlog']['billing_project_id'],
-            "summary": f"{hospital_name} - {patient_id}",
-            "description": description,  # ★正しい取得時間を含む説明文
-            "status": {
-                "id": 2,
-                "name": "処理中"
-            }
-        }
-        
-        response = requests.post(webhook_url, json=data, timeout=HTTP_TIMEOUT)  # P0対策
-        
-        if response.status_code >= 200 and response.status_code < 300:
-            logger.info(f"Webhook通知の送信に成功しました: {ticket_number}")
-            return True
-        else:
-            logger.warning(f"Webhook通知の送信に失敗しました: ステータスコード {response.status_code}")
-            return False
-            
+        data = build_webhook_payload(config, staff_info, ticket_number, hospital_name, patient_id,
+                                     description,  # ★正しい取得時間を含む説明文
+                                     trace_id=get_patient_trace_store().trace_id_of(account_id))
+        return get_webhook_notifier(config).submit(data)
     except Exception as e:
-        logger.error(f"Webhook通知の送信中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
+        logger.error(f"Webhook通知の登録中にエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
         return False
     
-def main():
-    '''エントリーポイント'''
+def main(reasons=None):
+    '''
+    エントリーポイント
+
+    Args:
+        reasons: 割り当て処理を起動した理由の集合（assignment_trigger の REASON_*）。
+            省略時は差し戻しチケットの確認を含むすべての処理を行う
+    '''
     try:
         config = load_config()
         if config is None:
             logger.error("設定の読み込みに失敗しました")
             return
 
-        process_pending_accounts(config)
+        check_reverted = reasons is None or bool(reasons & {REASON_REVERTED, REASON_SWEEP})
+        # 定期チェックでは直近に同期済みであれば省略する（在席変更・差し戻しの通知を受けた場合は必ず同期する）
+        force_staff_sync = reasons is None or bool(reasons & {REASON_STAFF_STATUS, REASON_REVERTED})
+        # 定期チェックも差分で確認する（全件の確認はトラッカーが reverted_full_scan_interval ごとに行う）
+        full_reverted_scan = reasons is None
+        process_pending_accounts(config, check_reverted=check_reverted, force_staff_sync=force_staff_sync,
+                                 full_reverted_scan=full_reverted_scan)
     except Exception as e:
         logger.error(f"予期せぬエラーが発生しました: {e}", exc_info=True)  # P1対策: スタックトレース追加
         logger.exception("スタックトレース:")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+    # キューに残ったWebhook通知を送信（または保存）してから終了する
+    shutdown_webhook_notifier()
\ No newline at end of file
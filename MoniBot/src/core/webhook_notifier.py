@@ -0,0 +1,191 @@
+# src/core/webhook_notifier.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+from src.utils.event_transport import LocalEventPublisher, load_transport_config
+from src.utils.spool import DEFAULT_MAX_ATTEMPTS, SPOOL_DIR, SpoolingWorker
+from src.core.patient_trace import STAGE_WEBHOOK_SENT, get_patient_trace_store
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('webhook_notifier')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# 送信できなかった通知を保存するスプールファイル（JSON Lines）
+DEFAULT_SPOOL_PATH = os.path.join(SPOOL_DIR, 'webhook_events.jsonl')
+
+# 通知設定の既定値（[webhook] セクションで上書き可能）
+DEFAULT_URL = 'http://localhost:5000/webhook/new_ticket'
+DEFAULT_QUEUE_SIZE = 200        # 送信待ちキューの上限
+DEFAULT_WORKERS = 2             # 送信を並行実行するスレッド数
+DEFAULT_RETRY_INTERVAL = 30     # スプールからの再送間隔（秒）
+DEFAULT_SPOOL_LIMIT = 1000      # スプールに保持する最大件数（超えた分は古い順に破棄）
+HTTP_TIMEOUT = (3, 10)          # 3秒で接続、10秒で読み取り
+
+
+class WebhookNotifier(SpoolingWorker):
+    """
+    Webhookサーバー（ダッシュボード）への通知をバックグラウンドで送信する
+
+    submit() はキューに積むだけで待たない。送信はセッションを使い回すワーカースレッドが行い、
+    Webhookサーバーが停止・遅延していても呼び出し側（タスク割り当て）は止まらない。
+    キューが満杯の場合や送信に失敗した場合はスプールへ保存し、一定間隔で再送する。
+
+    publisher を指定した場合は、同一端末のWebhookサーバーへローカル転送で直接送り、
+    ローカル転送できない場合のみ fallback_http に従ってHTTPで送信する。
+    """
+
+    thread_name = 'webhook_notifier'
+    label = 'Webhook通知'
+
+    def __init__(self, url: str,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 workers: int = DEFAULT_WORKERS,
+                 retry_interval: float = DEFAULT_RETRY_INTERVAL,
+                 spool_limit: int = DEFAULT_SPOOL_LIMIT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 spool_path: str = DEFAULT_SPOOL_PATH,
+                 publisher: Optional[LocalEventPublisher] = None,
+                 fallback_http: bool = True):
+        super().__init__(spool_path, queue_size, workers, retry_interval, spool_limit=spool_limit,
+                         max_attempts=max_attempts, stat_keys=('sent', 'sent_local'), log=logger)
+        self.url = url
+        self.publisher = publisher
+        self.fallback_http = fallback_http
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def start(self):
+        """送信・再送の各スレッドを開始する"""
+        if self._threads:
+            return
+        self._start_threads()
+        transport = f"ローカル転送 {self.publisher.address}" if self.publisher else self.url
+        logger.info(f"Webhook通知の送信を開始しました: {transport} (ワーカー {self.workers}件)")
+
+    def submit(self, payload: Dict[str, Any]) -> bool:
+        """
+        通知を送信キューに積む（待機しない）
+
+        Returns:
+            bool: キューに投入できた場合True（スプールへ回した場合False）
+        """
+        self._count('submitted')
+        return self._enqueue({'payload': payload, 'attempts': 0})
+
+    def _describe(self, event: Dict[str, Any]) -> str:
+        return str(event['payload'].get('issueKey'))
+
+    def _handle(self, event: Dict[str, Any]):
+        """通知を送信する"""
+        ticket_number = event['payload'].get('issueKey')
+        event['attempts'] += 1
+
+        # 同一端末のWebhookサーバーにはHTTPを経由せず直接送る
+        if self.publisher is not None:
+            if self.publisher.publish(event['payload']):
+                self._count('sent')
+                self._count('sent_local')
+                logger.info(f"Webhook通知の送信に成功しました（ローカル転送）: {ticket_number}")
+                get_patient_trace_store().record(event['payload'].get('traceId'), STAGE_WEBHOOK_SENT)
+                return
+            if not self.fallback_http:
+                self._count('failed')
+                logger.warning(f"Webhook通知をローカル転送できませんでした（後で再送）: {ticket_number}")
+                self._spool(event)
+                return
+
+        try:
+            response = self._session.post(self.url, json=event['payload'], timeout=HTTP_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            self._count('failed')
+            logger.warning(f"Webhook通知を送信できませんでした（{event['attempts']}回目、後で再送）: {ticket_number} - {e}")
+            self._spool(event)
+            return
+
+        if 200 <= response.status_code < 300:
+            self._count('sent')
+            logger.info(f"Webhook通知の送信に成功しました: {ticket_number}")
+            get_patient_trace_store().record(event['payload'].get('traceId'), STAGE_WEBHOOK_SENT)
+        elif response.status_code >= 500:
+            self._count('failed')
+            logger.warning(f"Webhook通知の送信に失敗しました（後で再送）: ステータスコード {response.status_code}")
+            self._spool(event)
+        else:
+            # リクエスト内容の問題のため再送しない
+            self._count('dropped')
+            logger.warning(f"Webhook通知の送信に失敗しました: ステータスコード {response.status_code}, "
+                           f"レスポンス: {response.text}")
+
+    def close(self):
+        """残りの通知を処理してからスレッドを停止する"""
+        if not self._threads:
+            return
+        self._stop_threads()
+        self._session.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        stats = self.get_stats()
+        logger.info(f"Webhook通知の送信を停止しました (送信 {stats['sent']}件, "
+                    f"失敗 {stats['failed']}件, スプール {stats['spooled']}件)")
+
+
+_notifier: Optional[WebhookNotifier] = None
+_notifier_lock = threading.Lock()
+
+
+def get_webhook_notifier(config: Optional[configparser.ConfigParser] = None) -> WebhookNotifier:
+    """プロセス内で共有するWebhook通知を取得する（初回呼び出しで開始する）"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            if config is None:
+                config = configparser.ConfigParser()
+                config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+            transport_config = load_transport_config(config)
+            transport = transport_config['transport']
+            publisher = None
+            if transport in ('auto', 'local'):
+                if transport_config['authkey']:
+                    publisher = LocalEventPublisher(transport_config['authkey'], transport_config['address'])
+                else:
+                    logger.error("ローカル転送の認証キーが無いため、Webhook通知はHTTPで送信します")
+                    transport = 'http'
+            _notifier = WebhookNotifier(
+                config.get('webhook', 'url', fallback=DEFAULT_URL),
+                queue_size=config.getint('webhook', 'queue_size', fallback=DEFAULT_QUEUE_SIZE),
+                workers=max(1, config.getint('webhook', 'workers', fallback=DEFAULT_WORKERS)),
+                retry_interval=config.getfloat('webhook', 'retry_interval', fallback=DEFAULT_RETRY_INTERVAL),
+                spool_limit=config.getint('webhook', 'spool_limit', fallback=DEFAULT_SPOOL_LIMIT),
+                max_attempts=max(1, config.getint('webhook', 'max_attempts', fallback=DEFAULT_MAX_ATTEMPTS)),
+                publisher=publisher,
+                fallback_http=transport != 'local',
+            )
+            _notifier.start()
+            get_metrics_registry().register_collector('webhook_notifier', _notifier.get_stats)
+        return _notifier
+
+
+def shutdown_webhook_notifier():
+    """共有のWebhook通知を停止する（キューに残った通知は処理してから停止する）"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is not None:
+            _notifier.close()
+            _notifier = None
@@ -0,0 +1,379 @@
+# src/utils/backlog_client.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import asyncio
+import configparser
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('backlog_client')
+
+# メトリクス（区分は read/search/write のレート制限区分）
+_metrics = get_metrics_registry()
+REQUEST_SECONDS = _metrics.histogram(
+    'monibot_backlog_request_seconds', 'Backlog APIリクエストの所要時間（リトライ・レート制限の待機を含む）',
+    ('method', 'category'))
+REQUESTS_TOTAL = _metrics.counter(
+    'monibot_backlog_requests_total', 'Backlog APIへの送信回数（リトライを含む）', ('method', 'category', 'status'))
+RATE_LIMIT_WAIT_SECONDS = _metrics.counter(
+    'monibot_backlog_rate_limit_wait_seconds_total', 'レート制限による待機時間の合計', ('category',))
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# HTTP通信タイムアウト (接続タイムアウト, 読み取りタイムアウト)
+HTTP_TIMEOUT = (5, 30)
+
+# リトライ設定
+MAX_RETRIES = 3        # 最大試行回数
+RETRY_DELAY = 3        # サーバーエラー・通信エラー時の待機（秒）
+RATE_LIMIT_DELAY = 15  # 429でリセット時刻が分からない場合の待機（秒）
+
+# 同じリクエストを繰り返しても結果が変わらないメソッド
+# それ以外（課題作成のPOSTなど）は、送信後の読み取りタイムアウトや5xxでは
+# サーバー側で処理済みの可能性があるため自動ではリトライしない
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'PATCH', 'DELETE'})
+
+# 課題一覧APIの1ページあたり最大件数
+ISSUES_PAGE_SIZE = 100
+
+# レート制限の既定値（1分あたりのリクエスト数）。レスポンスヘッダーで随時補正する
+DEFAULT_RATE_LIMITS = {
+    'read': 600,
+    'search': 150,
+    'write': 150,
+}
+
+
+class TokenBucket:
+    """
+    1分あたりの上限に合わせてリクエストを間引くトークンバケット
+
+    X-RateLimit-* ヘッダーを受け取るたびに上限・残数・リセット時刻を補正する。
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, per_minute)
+        self.tokens = float(self.capacity)
+        self.rate = self.capacity / 60.0
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """トークンを1つ取得する（必要なら待機し、待機した秒数を返す）"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, limit: Optional[int], remaining: Optional[int], reset: Optional[int]):
+        """レスポンスヘッダーの値でバケットを補正する"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = limit
+                self.rate = limit / 60.0
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+            if remaining == 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + max(0.0, reset - time.time()))
+
+    def block_for(self, seconds: float):
+        """指定秒数の間、リクエストを止める（429受信時など）"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+def _int_header(headers, name) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class BacklogAPIClient:
+    """
+    Backlog API v2 の共通クライアント
+
+    - Keep-Alive接続を再利用する requests.Session
+    - X-RateLimit-* ヘッダーに追従するトークンバケットでの流量制御
+    - 429・サーバーエラー・通信エラー時のリトライ（POST は送信前の接続失敗と429のみ）
+    - 課題一覧の自動ページング（100件超）
+    - run_in_executor による非同期ラッパー
+    """
+
+    def __init__(self, space_name: str, api_key: str, timeout=HTTP_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, rate_limits: Optional[Dict[str, int]] = None,
+                 max_workers: int = 8):
+        self.space_name = space_name
+        self.base_url = f"https://{space_name}.backlog.com/api/v2"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers * 2)
+        self.session.mount('https://', adapter)
+
+        limits = dict(DEFAULT_RATE_LIMITS)
+        limits.update(rate_limits or {})
+        self._buckets = {name: TokenBucket(value) for name, value in limits.items()}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backlog')
+
+    @staticmethod
+    def _rate_category(method: str, endpoint: str) -> str:
+        """エンドポイントからレート制限の区分を判定する"""
+        if method.upper() != 'GET':
+            return 'write'
+        if endpoint.rstrip('/') == '/issues':
+            return 'search'
+        return 'read'
+
+    def _update_rate_limit(self, bucket: TokenBucket, response: requests.Response):
+        headers = response.headers
+        limit = _int_header(headers, 'X-RateLimit-Limit')
+        remaining = _int_header(headers, 'X-RateLimit-Remaining')
+        reset = _int_header(headers, 'X-RateLimit-Reset')
+        if limit is not None or remaining is not None:
+            bucket.update(limit, remaining, reset)
+            if remaining is not None and limit and remaining < limit * 0.1:
+                logger.debug(f"Backlog APIのレート制限残数が少なくなっています: {remaining}/{limit}")
+
+    def request(self, method: str, endpoint: str, params: Optional[Dict] = None) -> Any:
+        """
+        APIリクエストを実行し、JSONレスポンスを返す
+
+        Args:
+            method: HTTPメソッド
+            endpoint: '/issues' のような base_url 以降のパス
+            params: クエリパラメータ（apiKey は自動付与）
+
+        Raises:
+            requests.exceptions.RequestException: リトライ後も失敗した場合
+        """
+        url = f"{self.base_url}{endpoint}"
+        params = dict(params or {})
+        params['apiKey'] = self.api_key
+        category = self._rate_category(method, endpoint)
+        bucket = self._buckets[category]
+        with REQUEST_SECONDS.time(method=method.upper(), category=category):
+            return self._request_with_retry(method, url, endpoint, params, category, bucket)
+
+    def _request_with_retry(self, method: str, url: str, endpoint: str, params: Dict,
+                            category: str, bucket: TokenBucket) -> Any:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(1, self.max_retries + 1):
+            waited = bucket.acquire()
+            if waited:
+                RATE_LIMIT_WAIT_SECONDS.inc(waited, category=category)
+            if waited > 1:
+                logger.debug(f"レート制限のため {waited:.1f}秒待機しました: {method} {endpoint}")
+
+            try:
+                response = self.session.request(method, url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                REQUESTS_TOTAL.inc(method=method.upper(), category=category, status='error')
+                # 接続できなかった場合はリクエストが届いていないため、POSTでもリトライできる
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, requests.exceptions.ConnectTimeout)):
+                    raise
+                logger.warning(f"Backlog API通信エラー. {RETRY_DELAY}秒後にリトライ {attempt}/{self.max_retries}: {e}")
+                time.sleep(RETRY_DELAY)
+                continue
+
+            REQUESTS_TOTAL.inc(method=method.upper(), category=category, status=str(response.status_code))
+            self._update_rate_limit(bucket, response)
+
+            if response.status_code == 429 and attempt < self.max_retries:
+                retry_after = _int_header(response.headers, 'Retry-After')
+                reset = _int_header(response.headers, 'X-RateLimit-Reset')
+                if retry_after is None and reset:
+                    retry_after = max(1, int(reset - time.time()))
+                wait_time = retry_after or RATE_LIMIT_DELAY
+                logger.warning(f"APIレート制限に達しました (429). {wait_time}秒後にリトライ {attempt}/{self.max_retries}...")
+                bucket.block_for(wait_time)
+                continue
+
+            if 500 <= response.status_code < 600 and idempotent and attempt < self.max_retries:
+                logger.warning(f"Backlog APIサーバーエラー ({response.status_code}). "
+                               f"{RETRY_DELAY}秒後にリトライ {attempt}/{self.max_retries}...")
+                time.sleep(RETRY_DELAY)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def get(self, endpoint: str, params: Optional[Dict] = None) -> Any:
+        return self.request('GET', endpoint, params)
+
+    def post(self, endpoint: str, params: Optional[Dict] = None) -> Any:
+        return self.request('POST', endpoint, params)
+
+    def patch(self, endpoint: str, params: Optional[Dict] = None) -> Any:
+        return self.request('PATCH', endpoint, params)
+
+    # 課題
+    def get_issues(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> List[Dict]:
+        """
+        課題一覧を取得する（100件を超える場合は offset で自動的にページングする）
+
+        Args:
+            params: 検索条件（projectId[] など）。count/offset は自動設定
+            max_items: 取得する最大件数（省略時は全件）
+        """
+        params = dict(params or {})
+        page_size = min(int(params.pop('count', ISSUES_PAGE_SIZE)), ISSUES_PAGE_SIZE)
+        offset = int(params.pop('offset', 0))
+        issues: List[Dict] = []
+
+        while True:
+            if max_items is not None:
+                page_size = min(page_size, max_items - len(issues))
+                if page_size <= 0:
+                    break
+            page = self.get('/issues', {**params, 'count': page_size, 'offset': offset})
+            issues.extend(page)
+            if len(page) < page_size:
+                break
+            offset += len(page)
+
+        return issues
+
+    def get_issue(self, issue_id_or_key) -> Dict:
+        return self.get(f'/issues/{issue_id_or_key}')
+
+    def create_issue(self, params: Dict) -> Dict:
+        return self.post('/issues', params)
+
+    def update_issue(self, issue_id_or_key, params: Dict) -> Dict:
+        return self.patch(f'/issues/{issue_id_or_key}', params)
+
+    # プロジェクト・メタデータ
+    def get_projects(self) -> List[Dict]:
+        return self.get('/projects')
+
+    def get_project(self, project_id) -> Dict:
+        return self.get(f'/projects/{project_id}')
+
+    def get_priorities(self) -> List[Dict]:
+        return self.get('/priorities')
+
+    def get_issue_types(self, project_id) -> List[Dict]:
+        return self.get(f'/projects/{project_id}/issueTypes')
+
+    def get_custom_fields(self, project_id) -> List[Dict]:
+        return self.get(f'/projects/{project_id}/customFields')
+
+    def get_statuses(self, project_id) -> List[Dict]:
+        return self.get(f'/projects/{project_id}/statuses')
+
+    # 用途別のショートカット（旧 api_json.BacklogAPIClient 互換）
+    def get_staff_issues(self, project_id: str = "550650") -> List[Dict]:
+        """在席管理プロジェクトの課題一覧を取得"""
+        return self.get_issues({"projectId[]": project_id})
+
+    def get_reverted_issues(self, project_id: str = "550648") -> List[Dict]:
+        """差し戻し状態の課題一覧を取得"""
+        return self.get_issues({"projectId[]": project_id, "statusId[]": "262863"})
+
+    def get_hospital_issues(self, project_id: str = "569286") -> List[Dict]:
+        """医療機関の課題一覧を取得"""
+        return self.get_issues({"projectId[]": project_id})
+
+    def update_issue_status(self, issue_id: str, status_id: str) -> Dict:
+        """課題のステータスを更新"""
+        return self.update_issue(issue_id, {"statusId": status_id})
+
+    # 非同期ラッパー
+    async def arequest(self, method: str, endpoint: str, params: Optional[Dict] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.request, method, endpoint, params)
+
+    async def aget_issues(self, params: Optional[Dict] = None, max_items: Optional[int] = None) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.get_issues, params, max_items)
+
+    async def acreate_issue(self, params: Dict) -> Dict:
+        return await self.arequest('POST', '/issues', params)
+
+    async def aupdate_issue(self, issue_id_or_key, params: Dict) -> Dict:
+        return await self.arequest('PATCH', f'/issues/{issue_id_or_key}', params)
+
+    def close(self):
+        """セッションとワーカーを閉じる"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_clients: Dict[tuple, BacklogAPIClient] = {}
+_clients_lock = threading.Lock()
+
+
+def load_backlog_config(filename='config.ini') -> configparser.ConfigParser:
+    """設定ファイルを読み込む"""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(CONFIG_DIR, filename), encoding='utf-8')
+    return config
+
+
+def get_backlog_client(config: Optional[configparser.ConfigParser] = None) -> BacklogAPIClient:
+    """
+    プロセス内で共有するBacklogクライアントを取得する
+
+    Args:
+        config: 読み込み済みの設定（省略時は config.ini を読み込む）
+    """
+    if config is None:
+        config = load_backlog_config()
+    space_name = config['backlog']['space_name']
+    api_key = config['backlog']['api_key']
+
+    key = (space_name, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            rate_limits = {
+                name: config.getint('backlog', f'rate_limit_{name}_per_minute', fallback=value)
+                for name, value in DEFAULT_RATE_LIMITS.items()
+            }
+            client = BacklogAPIClient(space_name, api_key, rate_limits=rate_limits)
+            _clients[key] = client
+        return client
+
+
+def close_backlog_clients():
+    """共有クライアントをすべて閉じる"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
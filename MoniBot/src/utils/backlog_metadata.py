@@ -0,0 +1,128 @@
+# src/utils/backlog_metadata.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from src.utils.logger import LoggerFactory
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('backlog_metadata')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# キャッシュの有効期間の既定値（秒）。[backlog] metadata_cache_ttl で上書き可能
+DEFAULT_METADATA_TTL = 3600
+# 存在しないことを記録する有効期間の既定値（秒）。[backlog] metadata_missing_ttl で上書き可能
+# 種別の追加がチケット作成の次回の再試行（issue_retry_interval）で反映されるよう、それより短くする
+DEFAULT_MISSING_TTL = 30
+
+
+class BacklogMetadataCache:
+    """
+    Backlogのメタデータ（優先度・課題種別・カスタムフィールド）のTTL付きキャッシュ
+
+    キーはタプルで、先頭要素にメタデータの種類、続けてスペース名とプロジェクトID（文字列）を持つ。
+    例: ('issue_types', space_name, '550648')
+    存在しないことが分かった値は短い有効期間（missing_ttl）で記録する（例: ('issue_type_missing', space_name, '550648', 種別名)）。
+    """
+
+    def __init__(self, ttl: float = DEFAULT_METADATA_TTL, missing_ttl: float = DEFAULT_MISSING_TTL):
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self._entries: Dict[Tuple, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """有効期限内のキャッシュ値を返す（無ければNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            return None
+
+    def put(self, key: Tuple, value: Any, ttl: Optional[float] = None):
+        """値を有効期間付きで保存する（ttl 省略時は既定の有効期間）"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def get_or_load(self, key: Tuple, loader: Callable[[], Any]) -> Optional[Any]:
+        """
+        キャッシュ値を返し、無ければ loader で取得して保存する
+
+        同じキーの取得が同時に走らないよう、キーごとにロックする。
+        loader が None を返した場合（API失敗など）はキャッシュしない。
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # 待機中に他スレッドが取得済みであればそれを使う
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            with self._lock:
+                self.misses += 1
+            value = loader()
+            if value is not None:
+                with self._lock:
+                    self._entries[key] = (value, time.monotonic() + self.ttl)
+                logger.debug(f"Backlogメタデータをキャッシュしました: {key}")
+            return value
+
+    def invalidate(self, *key_prefix: Hashable):
+        """
+        キャッシュを無効化する
+
+        Args:
+            key_prefix: 指定した要素で始まるキーのみ無効化する（省略時は全件）
+        """
+        with self._lock:
+            if not key_prefix:
+                self._entries.clear()
+            else:
+                n = len(key_prefix)
+                for key in [k for k in self._entries if k[:n] == key_prefix]:
+                    del self._entries[key]
+        logger.info(f"Backlogメタデータのキャッシュを無効化しました: {key_prefix or '全件'}")
+
+    def invalidate_project(self, space_name: str, project_id):
+        """指定プロジェクトに紐づくメタデータ（課題種別・カスタムフィールド）を無効化する"""
+        project_id = str(project_id)
+        with self._lock:
+            for key in [k for k in self._entries if k[1:3] == (space_name, project_id)]:
+                del self._entries[key]
+        logger.info(f"プロジェクト {project_id} のBacklogメタデータを無効化しました")
+
+
+_cache: Optional[BacklogMetadataCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_metadata_cache() -> BacklogMetadataCache:
+    """プロセス内で共有するメタデータキャッシュを取得する"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = configparser.ConfigParser()
+            config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+            ttl = config.getfloat('backlog', 'metadata_cache_ttl', fallback=DEFAULT_METADATA_TTL)
+            missing_ttl = config.getfloat('backlog', 'metadata_missing_ttl', fallback=DEFAULT_MISSING_TTL)
+            _cache = BacklogMetadataCache(ttl=ttl, missing_ttl=missing_ttl)
+        return _cache
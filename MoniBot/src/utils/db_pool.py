@@ -0,0 +1,287 @@
+# src/utils/db_pool.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+
+from src.utils.logger import LoggerFactory
+from src.utils.metrics import get_metrics_registry
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('db_pool')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# プール設定の既定値（[mysql] セクションで上書き可能）
+DEFAULT_POOL_SIZE = 5                # 同時に貸し出せる接続の最大数
+DEFAULT_CHECKOUT_TIMEOUT = 30        # 空き接続を待つ最大時間（秒）
+DEFAULT_HEALTH_CHECK_INTERVAL = 30   # この秒数以上アイドルだった接続は貸出前にpingする
+DEFAULT_MAX_IDLE_TIME = 600          # この秒数以上アイドルだった接続は破棄して作り直す
+SLOW_HOLD_WARNING = 30               # 貸出時間がこの秒数を超えたら警告する
+
+# 接続パラメータとして mysql.connector に渡すキー
+CONNECTION_KEYS = ('host', 'port', 'user', 'password', 'database')
+
+
+class DatabasePool:
+    """
+    MySQL接続プール
+
+    接続は必要になった時点で作成し、返却後はアイドル接続として再利用する。
+    貸出数は max_size で制限し、呼び出し元ごとの貸出メトリクスを記録する。
+    """
+
+    def __init__(self, db_config: Dict[str, Any], max_size: int = DEFAULT_POOL_SIZE,
+                 checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+                 max_idle_time: float = DEFAULT_MAX_IDLE_TIME):
+        self.db_config = dict(db_config)
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.max_idle_time = max_idle_time
+
+        self._idle = deque()            # (接続, 最終返却時刻)
+        self._checked_out = {}          # id(接続) -> (呼び出し元, 貸出時刻)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._created = 0
+        self._discarded = 0
+
+    def _caller_stats(self, caller: str) -> Dict[str, Any]:
+        """呼び出し元ごとのメトリクスを取得（ロック取得済みで呼ぶこと）"""
+        if caller not in self._stats:
+            self._stats[caller] = {
+                'checkouts': 0,
+                'failures': 0,
+                'in_use': 0,
+                'wait_total': 0.0,
+                'wait_max': 0.0,
+                'hold_total': 0.0,
+                'hold_max': 0.0,
+            }
+        return self._stats[caller]
+
+    def _create_connection(self):
+        """新しい接続を作成する"""
+        connection = mysql.connector.connect(autocommit=False, **self.db_config)
+        with self._lock:
+            self._created += 1
+        logger.debug(f"DB接続を新規作成しました (累計: {self._created})")
+        return connection
+
+    def _discard(self, connection):
+        """接続を破棄する"""
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self._lock:
+            self._discarded += 1
+
+    def _take_idle_connection(self):
+        """健全なアイドル接続を取り出す（無ければNone）"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, last_used = self._idle.pop()
+
+            idle_time = time.monotonic() - last_used
+            if idle_time > self.max_idle_time:
+                self._discard(connection)
+                continue
+
+            if idle_time > self.health_check_interval:
+                try:
+                    connection.ping(reconnect=True, attempts=1, delay=0)
+                except Error as e:
+                    logger.warning(f"ヘルスチェックに失敗した接続を破棄します: {e}")
+                    self._discard(connection)
+                    continue
+
+            return connection
+
+    def get_connection(self, caller: str = 'unknown'):
+        """
+        接続を借りる
+
+        Args:
+            caller: メトリクス集計用の呼び出し元名
+
+        Returns:
+            MySQL接続（使用後は release_connection で返却すること）
+
+        Raises:
+            PoolError: 制限時間内に空き接続が得られなかった場合
+            mysql.connector.Error: 接続の作成に失敗した場合
+        """
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._caller_stats(caller)['failures'] += 1
+            raise PoolError(f"DB接続プールが枯渇しています (最大 {self.max_size}, 呼び出し元: {caller})")
+
+        try:
+            connection = self._take_idle_connection() or self._create_connection()
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._caller_stats(caller)['failures'] += 1
+            raise
+
+        now = time.monotonic()
+        wait = now - start
+        with self._lock:
+            self._checked_out[id(connection)] = (caller, now)
+            stats = self._caller_stats(caller)
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['wait_total'] += wait
+            stats['wait_max'] = max(stats['wait_max'], wait)
+        return connection
+
+    def release_connection(self, connection, discard: bool = False):
+        """
+        借りた接続を返却する（未完了のトランザクションはロールバックする）
+
+        Args:
+            connection: get_connection で借りた接続
+            discard: 接続エラー等で再利用できない場合はTrue（プールに戻さず破棄する）
+        """
+        if connection is None:
+            return
+
+        with self._lock:
+            caller, checkout_time = self._checked_out.pop(id(connection), (None, None))
+        if caller is None:
+            logger.warning("プール外の接続が返却されたため破棄します")
+            self._discard(connection)
+            return
+
+        try:
+            if discard:
+                self._discard(connection)
+                return
+            if connection.in_transaction:
+                connection.rollback()
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+        except Error as e:
+            logger.warning(f"返却時のロールバックに失敗したため接続を破棄します: {e}")
+            self._discard(connection)
+        finally:
+            self._slots.release()
+            hold = time.monotonic() - checkout_time
+            with self._lock:
+                stats = self._caller_stats(caller)
+                stats['in_use'] -= 1
+                stats['hold_total'] += hold
+                stats['hold_max'] = max(stats['hold_max'], hold)
+            if hold > SLOW_HOLD_WARNING:
+                logger.warning(f"DB接続の貸出時間が長くなっています: {caller} ({hold:.1f}秒)")
+
+    @contextmanager
+    def connection(self, caller: str = 'unknown'):
+        """with文で接続を借りて自動返却する"""
+        connection = self.get_connection(caller)
+        discard = False
+        try:
+            yield connection
+        except (OperationalError, InterfaceError):
+            # 通信系のエラーが起きた接続は再利用しない
+            discard = True
+            raise
+        finally:
+            self.release_connection(connection, discard=discard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """プール全体と呼び出し元ごとのメトリクスを返す"""
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'created': self._created,
+                'discarded': self._discarded,
+                'idle': len(self._idle),
+                'in_use': len(self._checked_out),
+                'callers': {name: dict(stats) for name, stats in self._stats.items()},
+            }
+
+    def log_stats(self):
+        """メトリクスをログに出力する"""
+        stats = self.get_stats()
+        logger.info(f"DB接続プール: 作成 {stats['created']}件, 破棄 {stats['discarded']}件, "
+                    f"アイドル {stats['idle']}件, 貸出中 {stats['in_use']}件")
+        for name, caller in stats['callers'].items():
+            checkouts = caller['checkouts'] or 1
+            logger.info(f"  {name}: 貸出 {caller['checkouts']}回, 失敗 {caller['failures']}回, "
+                        f"平均待機 {caller['wait_total'] / checkouts * 1000:.1f}ms, "
+                        f"平均保持 {caller['hold_total'] / checkouts * 1000:.1f}ms, "
+                        f"最大保持 {caller['hold_max'] * 1000:.1f}ms")
+
+    def close_all(self):
+        """アイドル接続をすべて閉じる"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+_pool: Optional[DatabasePool] = None
+_pool_lock = threading.Lock()
+
+
+def load_pool_config(filename='config.ini'):
+    """[mysql] セクションから接続パラメータとプール設定を読み込む"""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(CONFIG_DIR, filename), encoding='utf-8')
+    section = config['mysql']
+
+    db_config = {key: section[key] for key in CONNECTION_KEYS if key in section}
+    if 'port' in db_config:
+        db_config['port'] = int(db_config['port'])
+
+    pool_options = {
+        'max_size': section.getint('pool_size', fallback=DEFAULT_POOL_SIZE),
+        'checkout_timeout': section.getfloat('pool_checkout_timeout', fallback=DEFAULT_CHECKOUT_TIMEOUT),
+        'health_check_interval': section.getfloat('pool_health_check_interval', fallback=DEFAULT_HEALTH_CHECK_INTERVAL),
+        'max_idle_time': section.getfloat('pool_max_idle_time', fallback=DEFAULT_MAX_IDLE_TIME),
+    }
+    return db_config, pool_options
+
+
+def get_db_pool() -> DatabasePool:
+    """プロセス内で共有する接続プールを取得する"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            db_config, pool_options = load_pool_config()
+            _pool = DatabasePool(db_config, **pool_options)
+            get_metrics_registry().register_collector('db_pool', _pool.get_stats)
+            logger.info(f"DB接続プールを初期化しました (最大 {_pool.max_size}接続)")
+        return _pool
+
+
+def close_db_pool():
+    """共有接続プールを閉じる"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.log_stats()
+            _pool.close_all()
+            _pool = None
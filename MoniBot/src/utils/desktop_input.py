@@ -0,0 +1,26 @@
+# src/utils/desktop_input.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import asyncio
+import threading
+from typing import Optional
+
+# pyautogui による画面操作（証明書選択ダイアログ）の排他ロック
+# 各監視は同じイベントループ上で並行してログインするため、ダイアログの表示から
+# 選択完了までの間だけこのロックを保持し、キー入力が他のダイアログへ届かないようにする
+_lock: Optional[asyncio.Lock] = None
+_lock_guard = threading.Lock()
+
+
+def get_desktop_input_lock() -> asyncio.Lock:
+    """プロセス内で共有する画面操作ロックを取得する"""
+    global _lock
+    with _lock_guard:
+        if _lock is None:
+            _lock = asyncio.Lock()
+        return _lock
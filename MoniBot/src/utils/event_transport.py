@@ -0,0 +1,239 @@
+# src/utils/event_transport.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import json
+import secrets
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, Optional
+
+from src.utils.logger import LoggerFactory
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('event_transport')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# ローカル転送の既定値（[webhook] セクションで上書き可能）
+# Windowsでは名前付きパイプ、それ以外ではUnixドメインソケットを使う
+if sys.platform == 'win32':
+    DEFAULT_ADDRESS = r'\\.\pipe\monibot_webhook'
+else:
+    DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), 'monibot_webhook.sock')
+# [webhook] local_authkey が空欄の場合に使う、インストールごとに生成する認証キーの保存先
+AUTHKEY_PATH = os.path.join(CONFIG_DIR, 'local_authkey')
+RECONNECT_INTERVAL = 30  # 接続できなかった場合に再接続を試みるまでの間隔（秒）
+
+
+def load_local_authkey(path: str = AUTHKEY_PATH) -> Optional[bytes]:
+    """
+    インストールごとの認証キーを読み込む（無ければランダムに生成して保存する）
+
+    オーケストレーターとWebhookサーバーは同じファイルを読むため、先に起動した側が生成する。
+
+    Returns:
+        認証キー（読み込み・生成のどちらもできない場合はNone）
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        logger.error(f"ローカル転送の認証キーを生成できません: {e}")
+        return None
+    else:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(secrets.token_hex(32))
+        logger.info(f"ローカル転送の認証キーを生成しました: {path}")
+
+    # 他方のプロセスが生成した直後は書き込み中で空の場合があるため、少し待って読み直す
+    for _ in range(10):
+        try:
+            with open(path, encoding='utf-8') as f:
+                authkey = f.read().strip()
+        except OSError as e:
+            logger.error(f"ローカル転送の認証キーを読み込めません: {e}")
+            return None
+        if authkey:
+            return authkey.encode('utf-8')
+        time.sleep(0.1)
+    logger.error(f"ローカル転送の認証キーが空です: {path}")
+    return None
+
+
+def load_transport_config(config: Optional[configparser.ConfigParser] = None) -> Dict[str, Any]:
+    """
+    [webhook] セクションからローカル転送の設定を読み込む
+
+    認証キー（authkey）は local_authkey、空欄の場合はインストールごとに生成したキーを使う。
+    どちらも得られない場合は None で、ローカル転送は使わない。
+    """
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+    authkey = config.get('webhook', 'local_authkey', fallback='')
+    return {
+        'transport': config.get('webhook', 'transport', fallback='auto'),
+        'address': config.get('webhook', 'local_address', fallback='') or DEFAULT_ADDRESS,
+        'authkey': authkey.encode('utf-8') if authkey else load_local_authkey(),
+    }
+
+
+if sys.platform == 'win32':
+    import _winapi
+    from multiprocessing.connection import BUFSIZE, PipeListener
+
+    # CreateNamedPipe の PIPE_REJECT_REMOTE_CLIENTS（_winapi には定義されていない）
+    PIPE_REJECT_REMOTE_CLIENTS = 0x00000008
+
+    class _LocalPipeListener(PipeListener):
+        """他の端末（SMB経由）からの接続を拒否する名前付きパイプ"""
+
+        def _new_handle(self, first=False):
+            flags = _winapi.PIPE_ACCESS_DUPLEX | _winapi.FILE_FLAG_OVERLAPPED
+            if first:
+                flags |= _winapi.FILE_FLAG_FIRST_PIPE_INSTANCE
+            return _winapi.CreateNamedPipe(
+                self._address, flags,
+                _winapi.PIPE_TYPE_MESSAGE | _winapi.PIPE_READMODE_MESSAGE | _winapi.PIPE_WAIT
+                | PIPE_REJECT_REMOTE_CLIENTS,
+                _winapi.PIPE_UNLIMITED_INSTANCES, BUFSIZE, BUFSIZE,
+                _winapi.NMPWAIT_WAIT_FOREVER, _winapi.NULL
+            )
+
+
+class _LocalListener(Listener):
+    """同一端末からの接続のみを受け付ける Listener"""
+
+    def __init__(self, address: str, authkey: bytes):
+        if sys.platform == 'win32':
+            self._listener = _LocalPipeListener(address, 1)
+            self._authkey = authkey
+        else:
+            super().__init__(address, authkey=authkey)
+            # ソケットファイルは起動したユーザーのみ接続できるようにする
+            os.chmod(address, 0o600)
+
+
+class LocalEventPublisher:
+    """
+    同一端末のWebhookサーバーへイベントを直接送る（HTTPを経由しない）
+
+    接続は使い回し、切断された場合は次回の送信時に再接続する。
+    Webhookサーバーに接続できない場合は一定時間ローカル転送を休止し、
+    その間 publish() は False を返す（呼び出し側でHTTPに切り替える）。
+    """
+
+    def __init__(self, authkey: bytes, address: str = DEFAULT_ADDRESS):
+        self.address = address
+        self.authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+
+    def publish(self, payload: Dict[str, Any]) -> bool:
+        """
+        イベントを送信する
+
+        Returns:
+            bool: 送信できた場合True
+        """
+        with self._lock:
+            if self._conn is None:
+                if time.monotonic() < self._retry_at:
+                    return False
+                try:
+                    self._conn = Client(self.address, authkey=self.authkey)
+                    logger.info(f"Webhookサーバーにローカル接続しました: {self.address}")
+                except (OSError, EOFError, AuthenticationError) as e:
+                    self._retry_at = time.monotonic() + RECONNECT_INTERVAL
+                    logger.debug(f"Webhookサーバーにローカル接続できません（HTTPで送信します）: {e}")
+                    return False
+            try:
+                self._conn.send_bytes(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+                return True
+            except (OSError, EOFError, ValueError) as e:
+                logger.warning(f"ローカル転送が切断されました（HTTPで送信します）: {e}")
+                self._close_conn()
+                return False
+
+    def _close_conn(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+    def close(self):
+        with self._lock:
+            self._close_conn()
+
+
+class LocalEventListener:
+    """
+    LocalEventPublisher からのイベントを受け取り、ハンドラーに渡す
+
+    接続ごとにスレッドを起動し、受信したイベントを handler(payload) に渡す。
+    イベントはJSONで受け渡し、authkey による認証を通った同一端末からの接続のみ受け付ける。
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], None], authkey: bytes,
+                 address: str = DEFAULT_ADDRESS):
+        self.handler = handler
+        self.address = address
+        self.authkey = authkey
+        self._listener: Optional[Listener] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """受信を別スレッドで開始する"""
+        if self._listener is not None:
+            return
+        if sys.platform != 'win32' and os.path.exists(self.address):
+            # 前回の異常終了で残ったソケットファイルを削除する
+            os.remove(self.address)
+        self._listener = _LocalListener(self.address, self.authkey)
+        self._thread = threading.Thread(target=self._accept_loop, name='local_event_listener', daemon=True)
+        self._thread.start()
+        logger.info(f"ローカルイベントの受信を開始しました: {self.address}")
+
+    def _accept_loop(self):
+        while self._listener is not None:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                if self._listener is None:
+                    return
+                logger.warning(f"ローカル接続の受け付けに失敗しました: {e}")
+                continue
+            threading.Thread(target=self._receive_loop, args=(conn,), name='local_event_receiver', daemon=True).start()
+
+    def _receive_loop(self, conn):
+        try:
+            while True:
+                raw = conn.recv_bytes()
+                try:
+                    self.handler(json.loads(raw.decode('utf-8')))
+                except Exception as e:
+                    logger.error(f"ローカルイベントの処理中にエラーが発生しました: {e}")
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+    def stop(self):
+        """受信を停止する"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+            logger.info("ローカルイベントの受信を停止しました")
@@ -0,0 +1,168 @@
+# src/utils/local_server.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import configparser
+import ipaddress
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from src.utils.logger import LoggerFactory
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('local_server')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# イベント受信サーバーの既定値（[event_server] セクションで上書き可能）
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8081
+
+# ルートの認証方式
+AUTH_LOCAL = 'local'   # token 未設定時は同一端末（ループバック）からのみ受け付ける。設定時は token が必要
+AUTH_TOKEN = 'token'   # 常に token が必要（token 未設定時は受け付けない）
+AUTH_ADMIN = 'admin'   # 管理用。常に admin_token が必要（admin_token 未設定時は受け付けない）
+
+# ハンドラーの型: (リクエストボディ, クエリパラメータ) -> (ステータスコード, レスポンス)
+Handler = Callable[[Dict[str, Any], Dict[str, str]], Tuple[int, Any]]
+
+
+class LocalEventServer:
+    """
+    オーケストレーター内で動く軽量HTTPサーバー
+
+    Backlogのwebhookや子プロセスからの通知を受け取るためのもので、
+    ルートごとにハンドラーを登録して使う。token を設定した場合は
+    クエリパラメータ token が一致するリクエストのみ受け付ける。token が未設定の場合、
+    AUTH_LOCAL のルートは同一端末からのリクエストのみ、AUTH_TOKEN のルートは一切受け付けない。
+    AUTH_ADMIN のルートは token とは別の admin_token（クエリパラメータ token で渡す）が必要。
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, token: str = '', admin_token: str = ''):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.admin_token = admin_token
+        self._routes: Dict[Tuple[str, str], Tuple[Handler, str]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def add_route(self, method: str, path: str, handler: Handler, auth: str = AUTH_LOCAL):
+        """ルートを登録する"""
+        self._routes[(method.upper(), path)] = (handler, auth)
+
+    def _is_authorized(self, auth: str, query: Dict[str, str], client_host: str) -> bool:
+        if auth == AUTH_ADMIN:
+            return bool(self.admin_token) and query.get('token') == self.admin_token
+        if self.token:
+            return query.get('token') == self.token
+        return auth == AUTH_LOCAL and is_loopback_address(client_host)
+
+    def _dispatch(self, method: str, path: str, query: Dict[str, str], body: Dict[str, Any],
+                  client_host: str = '127.0.0.1') -> Tuple[int, Any]:
+        route = self._routes.get((method, path))
+        if route is None:
+            return 404, {'error': 'not found'}
+        handler, auth = route
+        if not self._is_authorized(auth, query, client_host):
+            return 403, {'error': 'forbidden'}
+        return handler(body, query)
+
+    def _make_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                body: Dict[str, Any] = {}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    raw = self.rfile.read(length)
+                    try:
+                        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                            body = {k: v[0] for k, v in parse_qs(raw.decode('utf-8')).items()}
+                        else:
+                            body = json.loads(raw.decode('utf-8'))
+                    except (ValueError, UnicodeDecodeError):
+                        self._respond(400, {'error': 'invalid body'})
+                        return
+                try:
+                    status, payload = server._dispatch(method, parsed.path, query, body, self.client_address[0])
+                except Exception as e:
+                    logger.error(f"リクエスト処理中にエラーが発生しました: {method} {parsed.path} - {e}")
+                    status, payload = 500, {'error': 'internal error'}
+                self._respond(status, payload)
+
+            def _respond(self, status, payload):
+                if isinstance(payload, (bytes, str)):
+                    data = payload.encode('utf-8') if isinstance(payload, str) else payload
+                    content_type = 'text/plain; charset=utf-8'
+                else:
+                    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} - {format % args}")
+
+        return RequestHandler
+
+    def start(self):
+        """サーバーを別スレッドで開始する"""
+        if self._server is not None:
+            return
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='local_server', daemon=True)
+        self._thread.start()
+        logger.info(f"イベント受信サーバーを開始しました: {self.host}:{self.port}")
+
+    def stop(self):
+        """サーバーを停止する"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+        logger.info("イベント受信サーバーを停止しました")
+
+
+def is_loopback_address(host: str) -> bool:
+    """同一端末（ループバック）のアドレスか"""
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def load_server_config(config: Optional[configparser.ConfigParser] = None) -> Dict[str, Any]:
+    """[event_server] セクションからサーバー設定を読み込む"""
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+    return {
+        'enabled': config.getboolean('event_server', 'enabled', fallback=True),
+        'host': config.get('event_server', 'host', fallback=DEFAULT_HOST),
+        'port': config.getint('event_server', 'port', fallback=DEFAULT_PORT),
+        'token': config.get('event_server', 'token', fallback=''),
+        'admin_token': config.get('event_server', 'admin_token', fallback=''),
+    }
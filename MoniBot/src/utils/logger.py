@@ -1,18 +1,126 @@
 # src/utils/logger.py
 import os
 import logging
+import atexit
+import configparser
+import json
+import queue
+import threading
 from logging.handlers import TimedRotatingFileHandler
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import sys
 import shutil
+import time
 
+# キュー経由のログ出力の既定値（config.ini の [logging] セクションで上書き可能）
+DEFAULT_LOG_MODE = 'queued'        # queued: 書き込み専用スレッドでまとめて出力 / sync: 呼び出し元で即時出力
+DEFAULT_FLUSH_INTERVAL = 1.0       # ファイルへの反映（flush・fsync）間隔（秒）。BizRoboから見える最大の遅れ
+DEFAULT_LOG_QUEUE_SIZE = 10000     # 書き込み待ちの上限（超えた場合は呼び出し元で直接書き込む）
+DEFAULT_LOG_FORMAT = 'text'        # text: 従来の形式 / json: アプリケーションログを JSON Lines で出力
+DEFAULT_LEVEL_RELOAD_INTERVAL = 10 # [log_levels] の変更を反映する間隔（秒）。0 の場合は起動時のみ
 
-class BizRoboCompatibleFileHandler(TimedRotatingFileHandler):
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# LogRecord が標準で持つ属性（これ以外は extra で渡された項目として JSON に出力する）
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class LazyJson:
+    """
+    ログ出力時にだけ JSON へ変換する値
+
+    logger.debug("受信データ: %s", LazyJson(data)) のように引数として渡すと、
+    そのレベルのログが無効な場合は変換処理が行われない。
+    """
+
+    __slots__ = ('value', 'kwargs')
+
+    def __init__(self, value: Any, **kwargs):
+        self.value = value
+        self.kwargs = kwargs
+
+    def __str__(self):
+        kwargs = {'ensure_ascii': False, 'default': str}
+        kwargs.update(self.kwargs)
+        return json.dumps(self.value, **kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    ログレコードを1行の JSON に整形する
+
+    出力項目は ts・level・logger・thread・msg と、extra で渡された項目（所要時間など）。
+    例外がある場合は exc に格納する。
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class GroupCommitMixin:
+    """
+    書き込み専用スレッドからまとめて出力するためのファイルハンドラー拡張
+
+    batched が True の場合、emit() はストリームへ書き込むだけでフラッシュしない。
+    ディスクへの反映は書き込みスレッドが sync() で一定間隔ごとにまとめて行う。
+    """
+
+    batched = False
+    reopen_on_sync = False
+
+    def _emit_batched(self, record):
+        if self.shouldRollover(record):
+            self.doRollover()
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write(self.format(record) + self.terminator)
+
+    def sync(self):
+        """書き込んだ内容をディスクへ反映する"""
+        self.acquire()
+        try:
+            if self.stream is None:
+                return
+            self.stream.flush()
+            os.fsync(self.stream.fileno())
+            if self.reopen_on_sync:
+                # ファイルを閉じてサイズ・更新日時を確定させる（次の書き込みで開き直す）
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+
+
+class BizRoboCompatibleFileHandler(GroupCommitMixin, TimedRotatingFileHandler):
     """BizRobo監視に対応したファイルハンドラー"""
+
+    reopen_on_sync = True
     
     def emit(self, record):
         """ログ出力時の処理をオーバーライド"""
+        if self.batched:
+            # 書き込みスレッドからの出力: ファイルの反映は sync() でまとめて行う
+            try:
+                self._emit_batched(record)
+            except Exception:
+                self.handleError(record)
+            return
+
         try:
             # 現在のファイル名を保持
             current_file = self.baseFilename
@@ -39,10 +147,159 @@ class BizRoboCompatibleFileHandler(TimedRotatingFileHandler):
             self.handleError(record)
 
 
+class ApplicationFileHandler(GroupCommitMixin, TimedRotatingFileHandler):
+    """アプリケーションログ用のファイルハンドラー（書き込みスレッドからの出力に対応）"""
+
+    def emit(self, record):
+        if self.batched:
+            try:
+                self._emit_batched(record)
+            except Exception:
+                self.handleError(record)
+            return
+        super().emit(record)
+
+
+class QueuedHandler(logging.Handler):
+    """
+    ログレコードを書き込みスレッドのキューへ積むハンドラー
+
+    メッセージの整形（引数の埋め込み・例外の文字列化）は呼び出し元で済ませてから積むため、
+    後から参照先のオブジェクトが変わっても出力内容は変わらない。
+    """
+
+    def __init__(self, writer: 'LogWriter', targets: List[logging.Handler]):
+        super().__init__()
+        self.writer = writer
+        self.targets = targets
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.writer.put(self.targets, record)
+        except Exception:
+            self.handleError(record)
+
+
+class LogWriter:
+    """
+    ログ出力を1本のスレッドにまとめる
+
+    各ロガーの QueuedHandler から受け取ったレコードを実際のハンドラーへ書き込み、
+    flush_interval ごとにファイルへの反映（flush・fsync）をまとめて行う（グループコミット）。
+    """
+
+    def __init__(self, flush_interval: float = DEFAULT_FLUSH_INTERVAL, queue_size: int = DEFAULT_LOG_QUEUE_SIZE):
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._handlers: List[logging.Handler] = []
+        self._handlers_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.overflow = 0
+
+    def register(self, handler: logging.Handler):
+        """書き込みスレッドから出力するハンドラーを登録する"""
+        with self._handlers_lock:
+            if handler not in self._handlers:
+                if isinstance(handler, GroupCommitMixin):
+                    handler.batched = True
+                self._handlers.append(handler)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='log_writer', daemon=True)
+        self._thread.start()
+
+    def put(self, targets: List[logging.Handler], record: logging.LogRecord):
+        if self._thread is None:
+            # 停止後（終了処理中など）のログは呼び出し元で直接書き込む
+            self._write(targets, record)
+            return
+        try:
+            self._queue.put_nowait((targets, record))
+        except queue.Full:
+            # 書き込みが追いつかない場合はログを失わないよう呼び出し元で書き込む
+            self.overflow += 1
+            self._write(targets, record)
+
+    @staticmethod
+    def _write(targets: List[logging.Handler], record: logging.LogRecord):
+        for handler in targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _run(self):
+        next_sync = time.monotonic() + self.flush_interval
+        dirty = False
+        while True:
+            timeout = max(0.0, next_sync - time.monotonic()) if dirty else self.flush_interval
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                targets, record = item
+                self._write(targets, record)
+                # その時点で溜まっている分はまとめて書き込む
+                while True:
+                    try:
+                        targets, record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._write(targets, record)
+                if not dirty:
+                    dirty = True
+                    next_sync = time.monotonic() + self.flush_interval
+
+            if dirty and (time.monotonic() >= next_sync or self._stop.is_set()):
+                self._sync()
+                dirty = False
+
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+    def _sync(self):
+        with self._handlers_lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                if isinstance(handler, GroupCommitMixin):
+                    handler.sync()
+                else:
+                    handler.flush()
+            except Exception as e:
+                sys.stderr.write(f"ログの書き込み中にエラー: {e}\n")
+
+    def stop(self):
+        """キューに残ったログを書き込んでから停止する"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._sync()
+        with self._handlers_lock:
+            for handler in self._handlers:
+                if isinstance(handler, GroupCommitMixin):
+                    handler.batched = False
+
+
 class LoggerFactory:
     """集中管理されたロガー生成クラス"""
     
     _loggers = {}  # クラス変数としてロガーを保持
+    _lock = threading.RLock()
+    _settings: Optional[Dict[str, Any]] = None
+    _writer: Optional[LogWriter] = None
+    _shared_handlers: Dict[str, logging.Handler] = {}
     
     @classmethod
     def _get_project_root(cls):
@@ -92,14 +349,121 @@ class LoggerFactory:
         except Exception as e:
             logging.error(f"古いログファイルの移動処理中にエラー: {e}")
     
+    @classmethod
+    def _get_config_path(cls) -> str:
+        return os.path.join(cls._get_project_root(), 'config', 'config.ini')
+
+    @classmethod
+    def _load_settings(cls) -> Dict[str, Any]:
+        """config.ini の [logging] セクションからログ出力の設定を読み込む"""
+        config = configparser.ConfigParser()
+        config.read(cls._get_config_path(), encoding='utf-8')
+        return {
+            'mode': config.get('logging', 'mode', fallback=DEFAULT_LOG_MODE),
+            'flush_interval': config.getfloat('logging', 'flush_interval', fallback=DEFAULT_FLUSH_INTERVAL),
+            'queue_size': config.getint('logging', 'queue_size', fallback=DEFAULT_LOG_QUEUE_SIZE),
+            'format': config.get('logging', 'format', fallback=DEFAULT_LOG_FORMAT),
+            'level_reload_interval': config.getfloat('logging', 'level_reload_interval',
+                                                     fallback=DEFAULT_LEVEL_RELOAD_INTERVAL),
+            'levels': cls._parse_levels(config),
+        }
+
+    @staticmethod
+    def _parse_levels(config: configparser.ConfigParser) -> Dict[str, int]:
+        """[log_levels] セクション（ロガー名 = レベル名）を読み込む"""
+        levels = {}
+        if config.has_section('log_levels'):
+            for name, value in config.items('log_levels'):
+                level = logging.getLevelName(value.strip().upper())
+                if isinstance(level, int):
+                    levels[name] = level
+                else:
+                    sys.stderr.write(f"[log_levels] の不正なログレベルを無視します: {name} = {value}\n")
+        return levels
+
+    @classmethod
+    def _get_settings(cls) -> Dict[str, Any]:
+        """ログ出力の設定を返す（初回呼び出しで書き込みスレッドとレベルの監視を開始する）"""
+        if cls._settings is None:
+            cls._settings = cls._load_settings()
+            if cls._settings['mode'] == 'queued':
+                cls._writer = LogWriter(cls._settings['flush_interval'], cls._settings['queue_size'])
+                cls._writer.start()
+                atexit.register(cls.shutdown)
+            if cls._settings['level_reload_interval'] > 0:
+                threading.Thread(target=cls._watch_levels, name='log_level_watcher', daemon=True).start()
+        return cls._settings
+
+    @classmethod
+    def _watch_levels(cls) -> None:
+        """config.ini の更新を監視し、[log_levels] の変更を実行中のロガーに反映する"""
+        path = cls._get_config_path()
+        interval = cls._settings['level_reload_interval']
+        last_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        while True:
+            time.sleep(interval)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if mtime != last_mtime:
+                last_mtime = mtime
+                cls.reload_log_levels()
+
+    @classmethod
+    def reload_log_levels(cls) -> None:
+        """[log_levels] を読み直して各ロガーのレベルを変更する（記載のないロガーは INFO に戻す）"""
+        config = configparser.ConfigParser()
+        config.read(cls._get_config_path(), encoding='utf-8')
+        levels = cls._parse_levels(config)
+        with cls._lock:
+            settings = cls._get_settings()
+            if levels == settings['levels']:
+                return
+            settings['levels'] = levels
+            for name, logger in cls._loggers.items():
+                logger.setLevel(levels.get(name.lower(), logging.INFO))
+        logging.getLogger('orchestrator').info(
+            "ログレベルを変更しました: " + (', '.join(f"{name}={logging.getLevelName(level)}"
+                                            for name, level in sorted(levels.items())) or 'すべて INFO'))
+
+    @classmethod
+    def _get_writer(cls) -> Optional[LogWriter]:
+        """キュー経由で出力する場合は書き込みスレッドを返す（初回呼び出しで開始する）"""
+        cls._get_settings()
+        return cls._writer
+
+    @classmethod
+    def _get_shared_handler(cls, key: str, factory) -> logging.Handler:
+        """同じファイル・出力先へのハンドラーはロガー間で共有する（キュー経由の場合）"""
+        handler = cls._shared_handlers.get(key)
+        if handler is None:
+            handler = factory()
+            cls._shared_handlers[key] = handler
+        return handler
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """書き込みスレッドに残ったログをすべて書き込んで停止する"""
+        with cls._lock:
+            if cls._writer is not None:
+                cls._writer.stop()
+
     @classmethod
     def setup_logger(cls, name: str) -> logging.Logger:
         """ロガーをセットアップまたは既存のロガーを返す"""
+        with cls._lock:
+            return cls._setup_logger(name)
+
+    @classmethod
+    def _setup_logger(cls, name: str) -> logging.Logger:
         if name in cls._loggers:
             return cls._loggers[name]
         
+        settings = cls._get_settings()
         logger = logging.getLogger(name)
-        logger.setLevel(logging.INFO)
+        # レベルはロガーで管理する（[log_levels] で個別に変更可能、既定は INFO）
+        logger.setLevel(settings['levels'].get(name.lower(), logging.INFO))
         
         # 既存のハンドラーをクリア
         logger.handlers.clear()
@@ -108,9 +472,8 @@ class LoggerFactory:
         logger.propagate = False
         
         # フォーマッターを作成
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
+        formatter = logging.Formatter(TEXT_FORMAT)
+        json_output = settings['format'] == 'json'
         
         # ログディレクトリのパスを設定
         log_dir = os.path.join(cls._get_project_root(), "log")
@@ -121,6 +484,7 @@ class LoggerFactory:
         os.makedirs(orchestrator_dir, exist_ok=True)
         
         current_date = datetime.now().strftime("%Y%m%d")
+        writer = cls._get_writer()
         
         # orchestratorのログのみBizRoboCompatibleFileHandlerを使用
         if name == 'orchestrator':
@@ -135,27 +499,52 @@ class LoggerFactory:
                 encoding='utf-8',
                 delay=False
             )
+            file_handler.setFormatter(formatter)
+            file_handler.setLevel(logging.DEBUG)
+            file_handlers = [file_handler]
         else:
-            # その他のログは通常のTimedRotatingFileHandlerを使用
-            file_handler = TimedRotatingFileHandler(
-                os.path.join(log_dir, f"{current_date}_application.log"),
-                when="midnight",
-                interval=1,
-                backupCount=7,
-                encoding='utf-8'
-            )
-        
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(logging.INFO)
+            file_handlers = []
+        
+        # その他のログは共通のアプリケーションログに出力
+        # JSON形式の場合は orchestrator のログも含めて application.jsonl にまとめる（BizRobo用のログは従来の形式のまま）
+        if name != 'orchestrator' or json_output:
+            def create_application_handler():
+                extension = 'jsonl' if json_output else 'log'
+                handler = ApplicationFileHandler(
+                    os.path.join(log_dir, f"{current_date}_application.{extension}"),
+                    when="midnight",
+                    interval=1,
+                    backupCount=7,
+                    encoding='utf-8'
+                )
+                handler.setFormatter(JsonFormatter() if json_output else formatter)
+                handler.setLevel(logging.DEBUG)
+                return handler
+            
+            if writer is not None or json_output:
+                file_handlers.append(cls._get_shared_handler('application', create_application_handler))
+            else:
+                file_handlers.append(create_application_handler())
         
         # コンソールハンドラーの設定
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        console_handler.setLevel(logging.INFO)
-        
-        # ハンドラーを追加
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        def create_console_handler():
+            handler = logging.StreamHandler()
+            handler.setFormatter(formatter)
+            handler.setLevel(logging.DEBUG)
+            return handler
+        
+        if writer is not None:
+            console_handler = cls._get_shared_handler('console', create_console_handler)
+            # ファイル・コンソールへの書き込みは書き込みスレッドで行い、呼び出し元はキューに積むだけにする
+            targets = file_handlers + [console_handler]
+            for handler in targets:
+                writer.register(handler)
+            logger.addHandler(QueuedHandler(writer, targets))
+        else:
+            # ハンドラーを追加
+            for handler in file_handlers:
+                logger.addHandler(handler)
+            logger.addHandler(create_console_handler())
         
         # ロガーを保存
         cls._loggers[name] = logger
@@ -0,0 +1,115 @@
+# src/utils/loop_monitor.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import asyncio
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+from src.utils.logger import LoggerFactory
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('loop_monitor')
+
+# ループ遅延の警告しきい値の既定値（秒）。[setting] loop_lag_threshold で上書き可能
+DEFAULT_LAG_THRESHOLD = 0.5
+# ハートビートの間隔（秒）
+HEARTBEAT_INTERVAL = 0.1
+
+
+class LoopLagMonitor:
+    """
+    イベントループの遅延（ブロッキング）を検知するウォッチドッグ
+
+    ループ上のハートビートが最終更新時刻を記録し、別スレッドがその時刻を監視する。
+    しきい値を超えて更新が止まった場合は、その時点のループスレッドのスタックを出力するため、
+    どのコールバックがループを占有しているかを特定できる。
+    """
+
+    def __init__(self, threshold: float = DEFAULT_LAG_THRESHOLD,
+                 interval: float = HEARTBEAT_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.max_lag = 0.0
+        self.stall_count = 0
+
+    def start(self):
+        """ハートビートとウォッチドッグを開始する（イベントループ上から呼び出すこと）"""
+        if self._heartbeat_task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.get_event_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop_watchdog', daemon=True)
+        self._watchdog.start()
+        logger.info(f"イベントループ遅延の監視を開始しました (しきい値: {self.threshold}秒)")
+
+    async def stop(self):
+        """監視を停止する"""
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval * 5)
+            self._watchdog = None
+        logger.info(f"イベントループ遅延の監視を停止しました (最大遅延: {self.max_lag:.3f}秒 / 検知回数: {self.stall_count})")
+
+    async def _heartbeat(self):
+        """一定間隔で最終更新時刻を記録し、予定からの遅れを計測する"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - expected
+            self._last_beat = now
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.threshold:
+                logger.warning(f"イベントループが {lag:.3f}秒 ブロックされていました")
+
+    def _watch(self):
+        """ハートビートの停止を検知し、ループスレッドのスタックを出力する"""
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat
+            if stalled <= self.threshold or last_beat == reported_beat:
+                continue
+            # 同じ停止については一度だけ出力する
+            reported_beat = last_beat
+            self.stall_count += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else '(スタック取得不可)'
+            logger.warning(
+                f"イベントループが {stalled:.3f}秒 応答していません。ループを占有している処理:\n{stack}"
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """監視の統計情報を返す"""
+        return {
+            'threshold': self.threshold,
+            'max_lag': self.max_lag,
+            'stall_count': self.stall_count,
+        }
+
+
+def load_lag_threshold(config) -> float:
+    """設定からループ遅延の警告しきい値を読み込む"""
+    return config.getfloat('setting', 'loop_lag_threshold', fallback=DEFAULT_LAG_THRESHOLD)
@@ -0,0 +1,362 @@
+# src/utils/metrics.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import bisect
+import configparser
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.utils.logger import LoggerFactory
+from src.utils.local_server import AUTH_LOCAL
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('metrics')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# スナップショットの既定値（[metrics] セクションで上書き可能）
+DEFAULT_SNAPSHOT_PATH = os.path.join(project_root, 'bizrobo_flags', 'metrics_snapshot.json')
+DEFAULT_SNAPSHOT_INTERVAL = 60  # 秒。0 の場合は出力しない
+
+# 所要時間ヒストグラムの既定の区切り（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    """メトリクスの共通部分（ラベルの組み合わせごとに値を持つ）"""
+
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルが一致しません: {sorted(labels)} (期待値: {list(self.labelnames)})")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _items(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return [(key, self._copy(value)) for key, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    """単調増加する件数"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """現在値（キュー長・接続数など）"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """所要時間などの分布（区切りごとの件数・合計・件数を持つ）"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'max': 0.0}
+            if index < len(self.buckets):
+                state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+            if value > state['max']:
+                state['max'] = value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """with ブロックの所要時間を記録する（例外で抜けた場合も記録する）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _copy(value):
+        return {'counts': list(value['counts']), 'sum': value['sum'], 'count': value['count'], 'max': value['max']}
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    プロセス内のメトリクスを保持する
+
+    counter()・gauge()・histogram() は同じ名前で呼ぶと登録済みのメトリクスを返すため、
+    各モジュールはモジュール変数として取得しておけばよい。
+    register_collector() で登録した関数は出力のたびに呼ばれ、各コンポーネントの
+    get_stats() の値をゲージとして取り込む。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def _get_or_create(self, cls, name: str, help_text: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"メトリクス {name} は別の種類・ラベルで登録済みです")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def register_collector(self, component: str, collect: Callable[[], Dict[str, Any]]):
+        """
+        出力時に呼び出す統計情報の取得関数を登録する
+
+        collect() が返す辞書の数値項目を monibot_<component>_<項目名> のゲージとして出力する。
+        """
+        with self._lock:
+            self._collectors[component] = collect
+
+    def _collect(self) -> List[_Metric]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        for component, collect in collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                logger.debug(f"統計情報の取得に失敗しました: {component} - {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                gauge = Gauge(f"monibot_{component}_{key}", f"{component} の {key}")
+                gauge.set(value)
+                metrics.append(gauge)
+        return metrics
+
+    def render_prometheus(self) -> str:
+        """Prometheus のテキスト形式で出力する"""
+        lines = []
+        for metric in self._collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, value in metric._items():
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, value['counts']):
+                        cumulative += count
+                        lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames, values, ('le', _format_value(bound)))} {cumulative}")
+                    lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames, values, ('le', '+Inf'))} {value['count']}")
+                    lines.append(f"{metric.name}_sum{_format_labels(metric.labelnames, values)} {_format_value(value['sum'])}")
+                    lines.append(f"{metric.name}_count{_format_labels(metric.labelnames, values)} {value['count']}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(metric.labelnames, values)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        現在の値を辞書で返す
+
+        ヒストグラムは件数・合計・平均・最大と、区切りから推定した p50/p95 を返す。
+        """
+        result: Dict[str, Any] = {}
+        for metric in self._collect():
+            series = []
+            for values, value in metric._items():
+                entry: Dict[str, Any] = {'labels': dict(zip(metric.labelnames, values))}
+                if isinstance(metric, Histogram):
+                    count = value['count']
+                    entry.update({
+                        'count': count,
+                        'sum': round(value['sum'], 6),
+                        'avg': round(value['sum'] / count, 6) if count else 0.0,
+                        'max': round(value['max'], 6),
+                        'p50': _estimate_quantile(metric.buckets, value['counts'], count, 0.5),
+                        'p95': _estimate_quantile(metric.buckets, value['counts'], count, 0.95),
+                    })
+                else:
+                    entry['value'] = value
+                series.append(entry)
+            result[metric.name] = {'type': metric.kind, 'series': series}
+        return result
+
+
+def _estimate_quantile(buckets: Sequence[float], counts: Sequence[int], total: int, q: float) -> Optional[float]:
+    """区切りごとの件数から分位点の上限を推定する（最後の区切りを超える場合はNone）"""
+    if not total:
+        return None
+    threshold = total * q
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        if cumulative >= threshold:
+            return bound
+    return None
+
+
+class MetricsSnapshotWriter:
+    """メトリクスのスナップショットを一定間隔で JSON ファイルへ書き出す"""
+
+    def __init__(self, registry: MetricsRegistry, path: str = DEFAULT_SNAPSHOT_PATH,
+                 interval: float = DEFAULT_SNAPSHOT_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics_snapshot', daemon=True)
+        self._thread.start()
+        logger.info(f"メトリクスのスナップショット出力を開始しました: {self.path} ({self.interval}秒ごと)")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """スナップショットを書き出す（読み取り側が途中の内容を読まないよう置き換えで更新する）"""
+        data = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'metrics': self.registry.snapshot(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"メトリクスのスナップショットを書き出せませんでした: {e}")
+
+    def stop(self):
+        """停止し、最後のスナップショットを書き出す"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.write()
+
+
+_registry = MetricsRegistry()
+_snapshot_writer: Optional[MetricsSnapshotWriter] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """プロセス内で共有するメトリクスを取得する"""
+    return _registry
+
+
+def start_metrics_snapshot(config: Optional[configparser.ConfigParser] = None) -> MetricsSnapshotWriter:
+    """スナップショットの定期出力を開始する（[metrics] snapshot_path・snapshot_interval）"""
+    global _snapshot_writer
+    with _snapshot_lock:
+        if _snapshot_writer is None:
+            if config is None:
+                config = configparser.ConfigParser()
+                config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+            path = config.get('metrics', 'snapshot_path', fallback='') or DEFAULT_SNAPSHOT_PATH
+            if not os.path.isabs(path):
+                path = os.path.join(project_root, path)
+            _snapshot_writer = MetricsSnapshotWriter(
+                _registry, path,
+                config.getfloat('metrics', 'snapshot_interval', fallback=DEFAULT_SNAPSHOT_INTERVAL),
+            )
+            _snapshot_writer.start()
+        return _snapshot_writer
+
+
+def shutdown_metrics_snapshot():
+    """スナップショットの定期出力を停止する"""
+    global _snapshot_writer
+    with _snapshot_lock:
+        if _snapshot_writer is not None:
+            _snapshot_writer.stop()
+            _snapshot_writer = None
+
+
+def register_metrics_route(server):
+    """
+    LocalEventServer に Prometheus 形式の GET /metrics を登録する
+
+    token 未設定時は同一端末からのみ取得できる（他の端末からは ?token= が必要）。
+    """
+    server.add_route('GET', '/metrics', lambda body, query: (200, _registry.render_prometheus()), auth=AUTH_LOCAL)
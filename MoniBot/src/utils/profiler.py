@@ -0,0 +1,375 @@
+# src/utils/profiler.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import asyncio
+import configparser
+import json
+import linecache
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.logger import LoggerFactory
+from src.utils.local_server import AUTH_ADMIN
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('profiler')
+
+CONFIG_DIR = os.path.join(project_root, 'config')
+
+# プロファイラーの既定値（[profiler] セクションで上書き可能）
+DEFAULT_PROFILE_DIR = os.path.join(project_root, 'log', 'profile')
+DEFAULT_FLAG_FILE = os.path.join(CONFIG_DIR, 'profile.flag')
+DEFAULT_DURATION = 30        # 1回の計測時間（秒）
+MAX_DURATION = 300           # 計測時間の上限（秒）
+DEFAULT_INTERVAL = 0.01      # サンプリング間隔（秒）
+FLAG_CHECK_INTERVAL = 2.0    # フラグファイルの確認間隔（秒）
+
+# コルーチンごとの実時間を集計する対象
+DEFAULT_TARGETS = ('periodic_extract_all', 'monitor_hospital', 'run_task_assignment')
+
+# 待機中（CPUを使っていない）とみなすスレッドの最内フレームのモジュール
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'socketserver.py', 'socket.py', 'ssl.py',
+                'connection.py', 'windows_events.py', 'thread.py')
+# Cで実装された待機関数はフレームに現れないため、最内フレームの行の呼び出しで判定する
+IDLE_CALLS = ('time.sleep(', '.wait(', '.join(')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _is_idle(frame) -> bool:
+    """スレッドが待機中か（サンプリングではCPU時間を測れないため最内フレームから推定する）"""
+    filename = frame.f_code.co_filename
+    if os.path.basename(filename) in IDLE_MODULES:
+        return True
+    line = linecache.getline(filename, frame.f_lineno)
+    return any(call in line for call in IDLE_CALLS)
+
+
+def _thread_stack(frame) -> List[Any]:
+    """スレッドのフレームを外側から順に返す"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _coroutine_stack(coro) -> Tuple[List[Any], Optional[str]]:
+    """
+    タスクのコルーチンが await している先を外側から順にたどる
+
+    Returns:
+        (フレームのリスト, 最後に待っているコルーチン以外のオブジェクトの型名)
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None) or getattr(coro, 'ag_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaited = (getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+                   or getattr(coro, 'ag_await', None))
+        if awaited is not None and not any(hasattr(awaited, attr) for attr in ('cr_frame', 'gi_frame', 'ag_frame')):
+            return frames, type(awaited).__name__
+        coro = awaited
+    return frames, None
+
+
+class ProfileSession:
+    """
+    1回分のサンプリング結果
+
+    スレッドのスタック（CPUプロファイル）と、イベントループ上の各タスクのコルーチンの
+    await の連鎖（asyncio タスクプロファイル）を一定間隔で記録する。
+    """
+
+    def __init__(self, duration: float, interval: float, targets=DEFAULT_TARGETS):
+        self.duration = duration
+        self.interval = interval
+        self.targets = tuple(targets)
+        self.started_at = datetime.now()
+        self.thread_stacks: Counter = Counter()
+        self.task_stacks: Counter = Counter()
+        self.thread_samples = 0
+        self.idle_samples = 0
+        self.task_samples = 0
+        # 対象コルーチン -> 最内の待機先 -> サンプル数
+        self.coroutine_waits: Dict[str, Counter] = {name: Counter() for name in self.targets}
+        # 対象コルーチン -> ループスレッドで実行中だったサンプル数
+        self.coroutine_on_cpu: Counter = Counter()
+
+    def sample_threads(self, exclude_ident: int, loop_thread_ident: Optional[int]):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == exclude_ident:
+                continue
+            frames = _thread_stack(frame)
+            self.thread_samples += 1
+            if _is_idle(frames[-1]):
+                self.idle_samples += 1
+                continue
+            labels = [_frame_label(f) for f in frames]
+            self.thread_stacks[';'.join([f"thread:{names.get(ident, ident)}"] + labels)] += 1
+            if ident == loop_thread_ident:
+                names_in_stack = {f.f_code.co_name for f in frames}
+                for target in self.targets:
+                    if target in names_in_stack:
+                        self.coroutine_on_cpu[target] += 1
+
+    def sample_tasks(self, loop):
+        """イベントループ上で呼び出し、待機中の各タスクの await の連鎖を記録する"""
+        for task in asyncio.all_tasks(loop):
+            if task.done():
+                continue
+            frames, awaiting = _coroutine_stack(task.get_coro())
+            if not frames:
+                continue
+            self.task_samples += 1
+            labels = [_frame_label(f) for f in frames]
+            leaf = f"await {awaiting}" if awaiting else labels[-1]
+            if awaiting:
+                labels.append(leaf)
+            self.task_stacks[';'.join([f"task:{task.get_name()}"] + labels)] += 1
+
+            names_in_stack = [f.f_code.co_name for f in frames]
+            for target in self.targets:
+                if target in names_in_stack:
+                    # 対象コルーチンの内側で、どこで時間を使っているか（待っているか）
+                    inner = frames[names_in_stack.index(target) + 1:]
+                    where = ' > '.join(_frame_label(f) for f in inner[-2:]) if inner else labels[-1]
+                    if awaiting:
+                        where = f"{where} > {leaf}" if inner else leaf
+                    self.coroutine_waits[target][where] += 1
+                    break
+
+    def summary(self) -> Dict[str, Any]:
+        """対象コルーチンごとの実時間（タスク数×計測時間に対する内訳）"""
+        coroutines = {}
+        for target, waits in self.coroutine_waits.items():
+            total = sum(waits.values())
+            coroutines[target] = {
+                'task_seconds': round(total * self.interval, 3),
+                'on_loop_cpu_seconds': round(self.coroutine_on_cpu[target] * self.interval, 3),
+                'breakdown': [
+                    {'where': where, 'seconds': round(count * self.interval, 3),
+                     'ratio': round(count / total, 4)}
+                    for where, count in waits.most_common(15)
+                ],
+            }
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'duration': self.duration,
+            'interval': self.interval,
+            'thread_samples': self.thread_samples,
+            'idle_thread_samples': self.idle_samples,
+            'task_samples': self.task_samples,
+            'coroutines': coroutines,
+        }
+
+    def write(self, directory: str) -> Dict[str, str]:
+        """
+        結果を出力する
+
+        *_cpu.folded・*_tasks.folded は flamegraph.pl や speedscope で読める折り畳み形式
+        （1行に「フレーム;フレーム;... サンプル数」）。
+        """
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, self.started_at.strftime('%Y%m%d_%H%M%S'))
+        paths = {
+            'cpu': f"{prefix}_cpu.folded",
+            'tasks': f"{prefix}_tasks.folded",
+            'summary': f"{prefix}_summary.json",
+        }
+        for key, stacks in (('cpu', self.thread_stacks), ('tasks', self.task_stacks)):
+            with open(paths[key], 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        with open(paths['summary'], 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return paths
+
+
+class ProfilerController:
+    """
+    稼働中のオーケストレーターをその場でプロファイルする
+
+    start() で指定秒数のサンプリングを別スレッドで行い、結果を log/profile へ出力する。
+    起動方法はシグナル（SIGUSR1、Windows以外）、フラグファイル（config/profile.flag。
+    中身に秒数を書くと計測時間になる）、イベント受信サーバーの POST /admin/profile の3通り。
+    """
+
+    def __init__(self, output_dir: str = DEFAULT_PROFILE_DIR,
+                 flag_file: str = DEFAULT_FLAG_FILE,
+                 default_duration: float = DEFAULT_DURATION,
+                 interval: float = DEFAULT_INTERVAL):
+        self.output_dir = output_dir
+        self.flag_file = flag_file
+        self.default_duration = default_duration
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_ident: Optional[int] = None
+        self._lock = threading.Lock()
+        self._session: Optional[ProfileSession] = None
+        self._last_result: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """プロファイル対象のイベントループを設定する（ループ上から呼び出すこと）"""
+        self._loop = loop
+        self._loop_thread_ident = threading.get_ident()
+
+    def start_watching(self):
+        """フラグファイルの監視を開始する"""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch_flag, name='profiler_flag_watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch_flag(self):
+        while not self._stop.wait(FLAG_CHECK_INTERVAL):
+            if not os.path.exists(self.flag_file):
+                continue
+            try:
+                with open(self.flag_file, encoding='utf-8') as f:
+                    content = f.read().strip()
+                os.remove(self.flag_file)
+            except OSError as e:
+                logger.warning(f"プロファイル要求のフラグファイルを読み込めませんでした: {e}")
+                continue
+            duration = None
+            if content:
+                try:
+                    duration = float(content)
+                except ValueError:
+                    logger.warning(f"フラグファイルの計測時間が不正なため既定値を使います: {content}")
+            self.start(duration)
+
+    def install_signal_handler(self):
+        """SIGUSR1 でプロファイルを開始する（シグナルのないWindowsでは何もしない）"""
+        import signal
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.start())
+
+    def start(self, duration: Optional[float] = None) -> bool:
+        """
+        プロファイルを開始する（待たずに戻る）
+
+        Returns:
+            bool: 開始した場合True（計測中の場合False）
+        """
+        duration = min(MAX_DURATION, max(1.0, duration or self.default_duration))
+        with self._lock:
+            if self._session is not None:
+                logger.info("プロファイルは計測中のため、新しい要求を無視します")
+                return False
+            self._session = ProfileSession(duration, self.interval)
+        threading.Thread(target=self._run, args=(self._session,), name='profiler', daemon=True).start()
+        logger.info(f"プロファイルを開始しました: {duration:g}秒 (間隔 {self.interval * 1000:.0f}ms)")
+        return True
+
+    def _run(self, session: ProfileSession):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + session.duration
+        task_sample_pending = threading.Event()
+
+        def sample_tasks():
+            try:
+                session.sample_tasks(self._loop)
+            finally:
+                task_sample_pending.clear()
+
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                session.sample_threads(own_ident, self._loop_thread_ident)
+                # タスクの状態はループ上で読む（ループが止まっている間は前回の要求を待つ）
+                if self._loop is not None and not self._loop.is_closed() and not task_sample_pending.is_set():
+                    task_sample_pending.set()
+                    self._loop.call_soon_threadsafe(sample_tasks)
+                time.sleep(session.interval)
+            paths = session.write(self.output_dir)
+            summary = session.summary()
+            self._last_result = {'files': paths, 'summary': summary}
+            logger.info(f"プロファイルを出力しました: {paths['summary']}")
+            for target, result in summary['coroutines'].items():
+                if result['breakdown']:
+                    top = result['breakdown'][0]
+                    logger.info(f"  {target}: タスク時間 {result['task_seconds']:.1f}秒, "
+                                f"ループ上の実行 {result['on_loop_cpu_seconds']:.1f}秒, "
+                                f"最多: {top['where']} ({top['ratio']:.0%})")
+        except Exception as e:
+            logger.error(f"プロファイル中にエラーが発生しました: {e}")
+            logger.debug(traceback.format_exc())
+        finally:
+            with self._lock:
+                self._session = None
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            session = self._session
+        return {
+            'running': session is not None,
+            'started_at': session.started_at.isoformat(timespec='seconds') if session else None,
+            'last_result': self._last_result,
+        }
+
+    def register_routes(self, server):
+        """
+        LocalEventServer に POST /admin/profile?seconds=N と GET /admin/profile を登録する
+
+        [event_server] admin_token が未設定の場合は登録しない（フラグファイル・シグナルは利用できる）。
+        """
+        if not server.admin_token:
+            logger.info("[event_server] admin_token が未設定のため、POST /admin/profile は無効です")
+            return
+
+        def handle_start(body, query):
+            seconds = query.get('seconds') or body.get('seconds')
+            try:
+                duration = float(seconds) if seconds else None
+            except (TypeError, ValueError):
+                return 400, {'error': 'invalid seconds'}
+            if not self.start(duration):
+                return 409, {'error': 'already running', **self.get_status()}
+            return 202, self.get_status()
+
+        server.add_route('POST', '/admin/profile', handle_start, auth=AUTH_ADMIN)
+        server.add_route('GET', '/admin/profile', lambda body, query: (200, self.get_status()), auth=AUTH_ADMIN)
+
+    def stop(self):
+        """フラグファイルの監視と計測中のプロファイルを停止する"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=FLAG_CHECK_INTERVAL * 2)
+            self._watcher = None
+
+
+def load_profiler(config: Optional[configparser.ConfigParser] = None) -> Optional[ProfilerController]:
+    """[profiler] セクションからプロファイラーを作成する（enabled = false の場合None）"""
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(os.path.join(CONFIG_DIR, 'config.ini'), encoding='utf-8')
+    if not config.getboolean('profiler', 'enabled', fallback=True):
+        return None
+    flag_file = config.get('profiler', 'flag_file', fallback='') or DEFAULT_FLAG_FILE
+    if not os.path.isabs(flag_file):
+        flag_file = os.path.join(project_root, flag_file)
+    return ProfilerController(
+        flag_file=flag_file,
+        default_duration=config.getfloat('profiler', 'default_seconds', fallback=DEFAULT_DURATION),
+        interval=max(0.001, config.getfloat('profiler', 'interval', fallback=DEFAULT_INTERVAL)),
+    )
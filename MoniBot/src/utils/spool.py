@@ -0,0 +1,253 @@
+# src/utils/spool.py
+import os
+import sys
+
+# プロジェクトルートへのパスを追加
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import json
+import logging
+import queue
+import threading
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.logger import LoggerFactory
+
+# ロガーの初期化
+logger = LoggerFactory.setup_logger('spool')
+
+# スプールファイルの配置先
+SPOOL_DIR = os.path.join(project_root, 'spool')
+
+# 再試行の上限の既定値（これを超えたジョブはデッドレターファイルへ移す）
+DEFAULT_MAX_ATTEMPTS = 10
+
+_STOP = object()
+
+
+class JsonlSpool:
+    """
+    処理できなかったジョブを保存するスプールファイル（JSON Lines）
+
+    append() で1件ずつ追記し、take() で溜まった分をまとめて取り出す。
+    取り出す際は他プロセスの追記と衝突しないよう、ファイルを退避してから読み込む。
+    """
+
+    def __init__(self, path: str, limit: Optional[int] = None, log: logging.Logger = logger):
+        self.path = path
+        self.limit = limit
+        self.log = log
+        self._lock = threading.Lock()
+
+    def append(self, item: Dict[str, Any]) -> bool:
+        """ジョブを追記する（保存できなかった場合False）"""
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                return True
+            except OSError as e:
+                self.log.error(f"スプールへの保存に失敗しました: {e} / {json.dumps(item, ensure_ascii=False)}")
+                return False
+
+    def take(self) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        スプールファイルを取り出して空にする
+
+        Returns:
+            (ジョブのリスト, 上限を超えたため破棄した件数)
+        """
+        with self._lock:
+            if not os.path.exists(self.path):
+                return [], 0
+            taken_path = f"{self.path}.{os.getpid()}.retry"
+            try:
+                os.replace(self.path, taken_path)
+            except OSError as e:
+                self.log.debug(f"スプールファイルを退避できませんでした（次回再試行）: {e}")
+                return [], 0
+
+        items = []
+        with open(taken_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except json.JSONDecodeError:
+                    self.log.error(f"スプールの不正な行を読み飛ばします: {line}")
+        os.remove(taken_path)
+
+        dropped = 0
+        if self.limit is not None and len(items) > self.limit:
+            dropped = len(items) - self.limit
+            self.log.warning(f"スプールの上限を超えたため、古いジョブ {dropped}件 を破棄します")
+            items = items[-self.limit:]
+        return items, dropped
+
+
+class SpoolingWorker:
+    """
+    キューに積んだジョブをワーカースレッドで処理し、処理できなかったジョブを
+    スプールへ保存して一定間隔で再投入する処理の共通部分
+
+    サブクラスは _handle() で1件を処理し、失敗した場合は _spool() を呼ぶ。
+    ジョブは JSON に変換できる dict で、'attempts' に試行回数を持つ。
+    試行回数が max_attempts に達したジョブは再試行せず、デッドレターファイル
+    （スプールファイル名の拡張子の前に .dead を付けたもの）へ移す。
+    """
+
+    # スレッド名の接頭辞とログに出す処理名（サブクラスで設定する）
+    thread_name = 'spooling_worker'
+    label = 'ジョブ'
+
+    def __init__(self, spool_path: str, queue_size: int, workers: int, retry_interval: float,
+                 put_timeout: Optional[float] = None, spool_limit: Optional[int] = None,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 stat_keys: Tuple[str, ...] = (), log: logging.Logger = logger):
+        self.workers = workers
+        self.retry_interval = retry_interval
+        self.put_timeout = put_timeout
+        self.spool_path = spool_path
+        self.max_attempts = max_attempts
+        self.dead_letter_path = os.path.splitext(spool_path)[0] + '.dead.jsonl'
+        self.log = log
+
+        self._jobs: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._spool_file = JsonlSpool(spool_path, limit=spool_limit, log=log)
+        self._dead_letter_file = JsonlSpool(self.dead_letter_path, log=log)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._stats = {key: 0 for key in ('submitted', 'failed', 'dropped', 'spooled', 'retried', 'dead_lettered')
+                       + stat_keys}
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _extra_threads(self) -> List[threading.Thread]:
+        """ワーカー・再試行以外に開始するスレッド（サブクラスで必要に応じて定義する）"""
+        return []
+
+    def _start_threads(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker, name=f'{self.thread_name}_{i}', daemon=True))
+        self._threads.extend(self._extra_threads())
+        self._threads.append(threading.Thread(target=self._retry_loop, name=f'{self.thread_name}_retry', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _describe(self, job: Dict[str, Any]) -> str:
+        """ログに出すジョブの識別情報"""
+        return ''
+
+    def _enqueue(self, job: Dict[str, Any]) -> bool:
+        """
+        ジョブをキューに積む
+
+        put_timeout を指定した場合は、キューが満杯であればその秒数まで待機する（バックプレッシャー）。
+        それでも空かなければスプールへ保存して後で再試行する。
+
+        Returns:
+            bool: キューに投入できた場合True（スプールへ回した場合False）
+        """
+        try:
+            if self.put_timeout:
+                self._jobs.put(job, timeout=self.put_timeout)
+            else:
+                self._jobs.put_nowait(job)
+            return True
+        except queue.Full:
+            self.log.warning(f"{self.label}キューが満杯のため、スプールへ保存します: {self._describe(job)}")
+            self._spool(job)
+            return False
+
+    def _handle(self, job: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _worker(self):
+        """キューからジョブを取り出して処理する"""
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is _STOP:
+                    return
+                self._handle(job)
+            except Exception as e:
+                self.log.error(f"{self.label}の処理中に予期せぬエラーが発生しました: {e}")
+                self.log.debug(traceback.format_exc())
+                self._spool(job)
+            finally:
+                self._jobs.task_done()
+
+    def _spool(self, job: Dict[str, Any]):
+        """ジョブをスプールファイルへ追記する"""
+        if self._spool_file.append(job):
+            self._count('spooled')
+
+    def _is_exhausted(self, job: Dict[str, Any]) -> bool:
+        """再試行の上限に達したか"""
+        return job.get('attempts', 0) >= self.max_attempts
+
+    def _dead_letter(self, job: Dict[str, Any]):
+        """再試行をやめたジョブをデッドレターファイルへ移す"""
+        self.log.error(f"{self.label}を {job.get('attempts', 0)}回 試行しても完了できないため、再試行を中止します: "
+                       f"{self._describe(job)} (保存先 {self.dead_letter_path})")
+        if self._dead_letter_file.append(job):
+            self._count('dead_lettered')
+        else:
+            # デッドレターへ保存できない場合は失わないようスプールへ戻す
+            self._spool(job)
+
+    def _retry_loop(self):
+        """スプールに保存されたジョブを一定間隔で再投入する"""
+        while not self._stop.wait(self.retry_interval):
+            try:
+                jobs, dropped = self._spool_file.take()
+            except OSError as e:
+                self.log.error(f"スプールの読み込みに失敗しました: {e}")
+                continue
+            if dropped:
+                self._count('dropped', dropped)
+            retry_jobs = []
+            for job in jobs:
+                if self._is_exhausted(job):
+                    self._dead_letter(job)
+                else:
+                    retry_jobs.append(job)
+            jobs = retry_jobs
+            if not jobs:
+                continue
+            self.log.info(f"スプールから{self.label}を再試行します: {len(jobs)}件")
+            self._count('retried', len(jobs))
+            for job in jobs:
+                if self._stop.is_set():
+                    self._spool(job)
+                else:
+                    self._enqueue(job)
+
+    def drain(self):
+        """投入済みのジョブの処理（またはスプールへの保存）が完了するまで待機する"""
+        self._jobs.join()
+
+    def _stop_threads(self):
+        """キューに残ったジョブを処理してから全スレッドを停止する"""
+        self._stop.set()
+        for _ in range(self.workers):
+            self._jobs.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """処理状況のメトリクスを返す"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._jobs.qsize()
+        return stats
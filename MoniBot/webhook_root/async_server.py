@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import json
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from event_broadcaster import format_sse
+
+# SSEのキープアライブ送信間隔（秒）
+KEEPALIVE_INTERVAL = 15
+# 接続直後に送る履歴イベントの最大件数
+HISTORY_SIZE = 20
+# SSE以外のリクエストを処理するスレッド数
+WSGI_WORKERS = 4
+# リクエストヘッダー・ボディの上限（バイト）
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class AsyncWebhookServer:
+    """
+    asyncio で動くウェブフックサーバー
+
+    /events（SSE）はイベントループ上で直接処理し、1スレッドで多数のダッシュボードを
+    同時に扱う。それ以外のリクエスト（/webhook/new_ticket・/api/stats・画面・アセット）は
+    Flaskアプリをスレッドプールで呼び出して処理するため、応答内容はFlask単体で動かした場合と同じ。
+    """
+
+    def __init__(self, app, broadcaster, host='0.0.0.0', port=8080):
+        self.app = app
+        self.broadcaster = broadcaster
+        self.host = host
+        self.port = port
+        self._executor = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix='wsgi')
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                            limit=MAX_HEADER_SIZE)
+        print(f"ウェブフックサーバー（asyncioモード）を起動: {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request = await self._read_request(reader, writer)
+            if request is None:
+                return
+            method, target, headers, body = request
+            path = urlsplit(target).path
+            if method == 'GET' and path == '/events':
+                # 再接続時はブラウザが最後に受け取ったイベントIDを Last-Event-ID ヘッダーで送ってくる
+                last_event_id = (headers.get('last-event-id')
+                                 or parse_qs(urlsplit(target).query).get('lastEventId', [None])[0])
+                await self._stream_events(writer, last_event_id)
+            else:
+                await self._call_wsgi(writer, method, target, headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"リクエスト処理中にエラー: {e}")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader, writer):
+        try:
+            raw = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            await self._write_simple(writer, 431, 'Request Header Fields Too Large')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+
+        lines = raw.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            await self._write_simple(writer, 400, 'Bad Request')
+            return None
+
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY_SIZE:
+            await self._write_simple(writer, 413, 'Payload Too Large')
+            return None
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    async def _stream_events(self, writer, last_event_id=None):
+        """SSEでイベントを配信する（新しいイベントは届き次第すぐに送る）"""
+        client_id = str(uuid.uuid4())
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Connection: close\r\n\r\n')
+        # 初期接続メッセージ送信
+        writer.write((f"id: {client_id}\n"
+                      "event: connected\n"
+                      f"data: {json.dumps({'client_id': client_id, 'message': 'ウェブフックストリームに接続しました'})}\n\n")
+                     .encode('utf-8'))
+
+        count = self.broadcaster.register_client()
+        print(f"新しいクライアント接続: {client_id}。 総クライアント数: {count}")
+        try:
+            cursor = self.broadcaster.resolve_cursor(last_event_id)
+            if cursor is None:
+                # 既存の履歴イベントを送信
+                cursor, history = self.broadcaster.history(HISTORY_SIZE)
+                for _, event in history:
+                    writer.write(format_sse('history', event).encode('utf-8'))
+            else:
+                # 再接続: 切断中に届いたイベントだけを送信
+                loop = asyncio.get_running_loop()
+                cursor, missed = await loop.run_in_executor(None, self.broadcaster.read_since, cursor)
+                for _, event in missed:
+                    writer.write(format_sse('webhook', event).encode('utf-8'))
+            await writer.drain()
+
+            # 新しいイベントを監視
+            while True:
+                cursor, events = await self.broadcaster.wait_async(cursor, KEEPALIVE_INTERVAL)
+                if events:
+                    for _, event in events:
+                        writer.write(format_sse('webhook', event).encode('utf-8'))
+                else:
+                    # キープアライブコメントを送信して接続を維持
+                    writer.write(b": keepalive\n\n")
+                await writer.drain()
+        finally:
+            count = self.broadcaster.unregister_client()
+            print(f"クライアント {client_id} が切断しました。アクティブクライアント: {count}")
+
+    async def _call_wsgi(self, writer, method, target, headers, body):
+        """Flaskアプリをスレッドプールで呼び出し、応答を返す"""
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = self._build_environ(method, target, headers, body, peer[0])
+        loop = asyncio.get_running_loop()
+        status, response_headers, payload = await loop.run_in_executor(self._executor, self._run_wsgi, environ)
+
+        head = [f"HTTP/1.1 {status}"]
+        head += [f"{name}: {value}" for name, value in response_headers
+                 if name.lower() not in ('connection', 'content-length')]
+        head += [f"Content-Length: {len(payload)}", "Connection: close"]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(payload)
+        await writer.drain()
+
+    def _build_environ(self, method, target, headers, body, remote_addr):
+        parts = urlsplit(target)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(parts.path, encoding='latin-1'),
+            'QUERY_STRING': parts.query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': remote_addr,
+            'CONTENT_TYPE': headers.get('content-type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            if name in ('content-type', 'content-length'):
+                continue
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    def _run_wsgi(self, environ):
+        captured = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = response_headers
+
+        result = self.app(environ, start_response)
+        try:
+            payload = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return captured['status'], captured['headers'], payload
+
+    async def _write_simple(self, writer, status, reason):
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode('latin-1'))
+        await writer.drain()
+
+
+def run_async_server(app, broadcaster, host='0.0.0.0', port=8080):
+    """asyncioモードでウェブフックサーバーを起動する"""
+    server = AsyncWebhookServer(app, broadcaster, host, port)
+    asyncio.run(server.serve_forever())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+
+class EventBroadcaster:
+    """
+    SSEクライアントへのイベント配信を管理する
+
+    イベントは連番を付けて共有のリングバッファに1回だけ格納し、各クライアントは
+    自分が読んだ連番（カーソル）以降を読み出す。クライアントごとのキューを持たないため、
+    配信のコストはクライアント数によらず一定。
+    スレッドで動くクライアント（Flask/waitress）は wait()、asyncio で動くクライアントは
+    wait_async() で新しいイベントを待つ。
+
+    event_log を指定した場合はイベントをログにも保存し、起動時にログから直近のイベントと
+    連番を復元する。リングバッファから溢れた古いイベントはログから読み出す。
+    """
+
+    def __init__(self, capacity=100, event_log=None):
+        self.capacity = capacity
+        self.event_log = event_log
+        self._events = deque(maxlen=capacity)  # (連番, イベント)
+        self._seq = 0
+        if event_log is not None:
+            self._events.extend(event_log.tail(capacity))
+            self._seq = event_log.last_seq
+        self._cond = threading.Condition()
+        # 採番とログへの追記を直列化する（配信を待つクライアントはこのロックを取らない）
+        self._publish_lock = threading.Lock()
+        self._loop_waiters = {}  # イベントループ -> 待機中のFuture（ループごとに1つ）
+        self._clients = 0
+
+    @property
+    def latest_seq(self):
+        return self._seq
+
+    def publish(self, event):
+        """イベントを追加し、待機中のクライアントを起こす"""
+        with self._publish_lock:
+            # 連番を変更するのは publish() だけなので、このロック内で次の連番を決められる
+            seq = self._seq + 1
+            # ログへの書き込み中もクライアントの読み出し・待機は止めない。
+            # クライアントに見える前にログへ保存しておくため、ログからの再開で取りこぼさない
+            if self.event_log is not None:
+                self.event_log.append(seq, event)
+            with self._cond:
+                self._seq = seq
+                self._events.append((seq, event))
+                self._cond.notify_all()
+                loop_waiters, self._loop_waiters = self._loop_waiters, {}
+
+        for loop, future in loop_waiters.items():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, future)
+        return seq
+
+    def history(self, limit):
+        """
+        直近のイベントを返す
+
+        Returns:
+            (最新の連番, [(連番, イベント), ...])
+        """
+        with self._cond:
+            events = list(self._events)[-limit:] if limit > 0 else []
+            return self._seq, events
+
+    def resolve_cursor(self, event_id):
+        """
+        クライアントが最後に受け取ったイベントIDを連番に変換する
+
+        Returns:
+            連番（不明なIDの場合None）
+        """
+        if not event_id:
+            return None
+        with self._cond:
+            for seq, event in self._events:
+                if event.get('event_id') == event_id:
+                    return seq
+        if self.event_log is not None:
+            return self.event_log.seq_of(event_id)
+        return None
+
+    def read_since(self, cursor):
+        """
+        カーソルより新しいイベントを返す
+
+        Returns:
+            (新しいカーソル, [(連番, イベント), ...])
+        """
+        with self._cond:
+            result = self._read_since_locked(cursor)
+            if result is not None:
+                return result
+            latest = self._seq
+        # リングバッファより古い位置からの再開はログから読み出す
+        events = [(seq, event) for seq, event in self.event_log.read_since(cursor) if seq <= latest]
+        return latest, events
+
+    def _read_since_locked(self, cursor):
+        """リングバッファから読み出す（ログからの読み出しが必要な場合None）"""
+        if cursor >= self._seq:
+            return cursor, []
+        oldest = self._events[0][0] if self._events else self._seq + 1
+        if cursor + 1 < oldest and self.event_log is not None:
+            return None
+        # ログがない場合、リングバッファから溢れたイベントは読み飛ばされる
+        events = [(seq, event) for seq, event in self._events if seq > cursor]
+        return self._seq, events
+
+    def wait(self, cursor, timeout):
+        """カーソルより新しいイベントが届くまで待機する（スレッド用）"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > cursor, timeout=timeout)
+            result = self._read_since_locked(cursor)
+        return result if result is not None else self.read_since(cursor)
+
+    async def wait_async(self, cursor, timeout):
+        """カーソルより新しいイベントが届くまで待機する（asyncio用）"""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._seq > cursor:
+                result = self._read_since_locked(cursor)
+                future = None
+            else:
+                result = None
+                future = self._loop_waiters.get(loop)
+                if future is None or future.done():
+                    future = loop.create_future()
+                    self._loop_waiters[loop] = future
+        if result is not None:
+            return result
+        if future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            with self._cond:
+                result = self._read_since_locked(cursor)
+            if result is not None:
+                return result
+        # ログからの読み出しはファイルを読むため、イベントループを止めないようスレッドで行う
+        return await loop.run_in_executor(None, self.read_since, cursor)
+
+    def size(self):
+        """バッファに保持しているイベント数"""
+        with self._cond:
+            return len(self._events)
+
+    def register_client(self):
+        with self._cond:
+            self._clients += 1
+            return self._clients
+
+    def unregister_client(self):
+        with self._cond:
+            self._clients -= 1
+            return self._clients
+
+    @property
+    def client_count(self):
+        return self._clients
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def format_sse(event_name, event):
+    """イベントをSSEの形式に整形する（id には event_id を設定し、再接続時の Last-Event-ID に使う）"""
+    lines = []
+    if event.get('event_id'):
+        lines.append(f"id: {event['event_id']}\n")
+    lines.append(f"event: {event_name}\n")
+    lines.append(f"data: {json.dumps(event)}\n\n")
+    return ''.join(lines)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class EventLog:
+    """
+    配信したイベントを保存する追記専用のログ
+
+    イベントは連番付きで JSON Lines のセグメントファイル（events-<先頭の連番>.jsonl）に追記し、
+    segment_size 件ごとに新しいセグメントへ切り替える。保持するセグメントは max_segments 個までで、
+    古いものから削除する。event_id から連番を引く索引は保持中のイベント分だけメモリに持つ。
+    """
+
+    def __init__(self, directory, segment_size=1000, max_segments=10):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._segments = []           # [(先頭の連番, パス), ...] 古い順
+        self._index = OrderedDict()   # event_id -> 連番（古い順）
+        self._current = None          # 書き込み中のファイル
+        self._current_count = 0
+        self.last_seq = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"events-{first_seq:012d}.jsonl")
+
+    def _load(self):
+        """既存のセグメントから索引と最新の連番を復元する"""
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith('events-') and name.endswith('.jsonl'):
+                try:
+                    first_seq = int(name[len('events-'):-len('.jsonl')])
+                except ValueError:
+                    continue
+                self._segments.append((first_seq, os.path.join(self.directory, name)))
+
+        count = 0
+        for _, path in self._segments:
+            count = 0
+            for seq, event in self._read_segment(path):
+                count += 1
+                self.last_seq = max(self.last_seq, seq)
+                event_id = event.get('event_id')
+                if event_id:
+                    self._index[event_id] = seq
+        self._current_count = count
+
+    @staticmethod
+    def _read_segment(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で停止した行は読み飛ばす
+                        continue
+                    yield record['seq'], record['event']
+        except FileNotFoundError:
+            return
+
+    def append(self, seq, event):
+        """イベントを追記する（連番は呼び出し側で昇順に採番すること）"""
+        with self._lock:
+            if self._current is None or self._current_count >= self.segment_size:
+                self._rotate(seq)
+            self._current.write(json.dumps({'seq': seq, 'event': event}, ensure_ascii=False) + '\n')
+            self._current.flush()
+            self._current_count += 1
+            self.last_seq = seq
+            event_id = event.get('event_id')
+            if event_id:
+                self._index[event_id] = seq
+
+    def _rotate(self, first_seq):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        if self._segments and self._current_count < self.segment_size:
+            # 起動直後で、最後のセグメントにまだ空きがある場合は追記を続ける
+            path = self._segments[-1][1]
+        else:
+            path = self._segment_path(first_seq)
+            self._segments.append((first_seq, path))
+            self._current_count = 0
+        self._current = open(path, 'a', encoding='utf-8')
+
+        # 保持数を超えたセグメントと、その索引を削除する
+        while len(self._segments) > self.max_segments:
+            _, old_path = self._segments.pop(0)
+            oldest_kept = self._segments[0][0]
+            while self._index and next(iter(self._index.values())) < oldest_kept:
+                self._index.popitem(last=False)
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def seq_of(self, event_id):
+        """event_id に対応する連番を返す（保持期間外の場合None）"""
+        with self._lock:
+            return self._index.get(event_id)
+
+    def read_since(self, cursor, limit=None):
+        """連番が cursor より新しいイベントを古い順に返す"""
+        with self._lock:
+            segments = list(self._segments)
+            if self._current is not None:
+                self._current.flush()
+
+        # cursor を含むセグメントから読み始める
+        start = 0
+        for i, (first_seq, _) in enumerate(segments):
+            if first_seq <= cursor + 1:
+                start = i
+        events = []
+        for _, path in segments[start:]:
+            for seq, event in self._read_segment(path):
+                if seq > cursor:
+                    events.append((seq, event))
+                    if limit is not None and len(events) >= limit:
+                        return events
+        return events
+
+    def tail(self, count):
+        """直近のイベントを古い順に返す"""
+        return self.read_since(max(0, self.last_seq - count))
+
+    def close(self):
+        with self._lock:
+            if self._current is not None:
+                self._current.close()
+                self._current = None
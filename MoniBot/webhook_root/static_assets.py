@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import mimetypes
+import os
+import re
+
+from flask import request, send_from_directory
+
+try:
+    import brotli  # 任意: インストールされている場合のみ .br を生成・配信する
+except ImportError:
+    brotli = None
+
+# 事前圧縮する拡張子
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.html', '.svg', '.json', '.map', '.txt')
+# ビルド時にハッシュ付きのファイル名が付与されたアセット（例: common-D6Lta79p.css）は内容が変わらない
+HASHED_NAME_PATTERN = re.compile(r'-[A-Za-z0-9_]{8}\.[A-Za-z0-9]+$')
+
+# キャッシュ期間（秒）
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # ハッシュ付きファイル
+DEFAULT_MAX_AGE = 24 * 3600          # それ以外（ETag で更新を確認する）
+
+# Accept-Encoding に応じて優先する圧縮形式（拡張子, Content-Encoding）
+ENCODINGS = [('.br', 'br'), ('.gz', 'gzip')]
+
+
+def precompress_assets(assets_dir):
+    """
+    アセットの gzip（brotli が使える場合は brotli も）圧縮版を生成する
+
+    元ファイルより新しい圧縮版がある場合、または圧縮しても小さくならない場合は生成しない。
+
+    Returns:
+        int: 生成したファイル数
+    """
+    created = 0
+    for root, _, files in os.walk(assets_dir):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+
+            for ext, compress in variants:
+                target = path + ext
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue
+                with open(target, 'wb') as f:
+                    f.write(compressed)
+                created += 1
+    return created
+
+
+def send_asset(assets_dir, path):
+    """
+    アセットを配信する
+
+    クライアントが対応していれば事前圧縮版を返し、ファイル名に応じたキャッシュヘッダーを付ける。
+    """
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    full_path = os.path.join(assets_dir, path)
+    mimetype = mimetypes.guess_type(path)[0]
+
+    response = None
+    if path.endswith(COMPRESSIBLE_EXTENSIONS) and os.path.isfile(full_path):
+        for ext, encoding in ENCODINGS:
+            variant = full_path + ext
+            # 元ファイルの更新後に圧縮し直していない場合は使わない
+            if (encoding in accept_encoding and os.path.isfile(variant)
+                    and os.path.getmtime(variant) >= os.path.getmtime(full_path)):
+                response = send_from_directory(assets_dir, path + ext, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = send_from_directory(assets_dir, path)
+        response.headers['Vary'] = 'Accept-Encoding'
+    else:
+        response = send_from_directory(assets_dir, path)
+
+    if HASHED_NAME_PATTERN.search(path):
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={DEFAULT_MAX_AGE}'
+    return response
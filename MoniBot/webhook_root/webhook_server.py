@@ -1,31 +1,78 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request, Response, stream_with_context, render_template, jsonify, send_from_directory, redirect
+from flask import Flask, request, Response, stream_with_context, render_template, jsonify, redirect
 import json
-import time
 import threading
 import os
 from datetime import datetime
-import queue
 import uuid
+import sys
+import argparse
+import configparser
+
+# プロジェクトルートへのパスを追加（オーケストレーターからのローカル転送の受信に使用）
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from src.utils.event_transport import LocalEventListener, load_transport_config
+from src.utils.local_server import is_loopback_address
+from src.utils.metrics import get_metrics_registry
+from event_broadcaster import EventBroadcaster, format_sse
+from event_log import EventLog
+from static_assets import precompress_assets, send_asset
 
 app = Flask(__name__)
 
-# イベントキューとクライアント管理
-event_queue = queue.Queue(maxsize=100)  # メモリ使用量制限のためにキューサイズを制限
-clients = {}  # クライアントIDをキーとしたSSEクライアント管理用辞書
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(BASE_DIR, 'assets')
+CONFIG_PATH = os.path.join(project_root, 'config', 'config.ini')
+
+# イベントログ（再起動後や再接続時に配信済みイベントを再送するため、セグメント単位でローテーションして保存）
+EVENT_LOG_DIR = os.path.join(BASE_DIR, 'event_log')
+EVENT_LOG_SEGMENT_SIZE = 1000  # 1セグメントあたりのイベント数
+EVENT_LOG_MAX_SEGMENTS = 10    # 保持するセグメント数
+
+# イベント配信（全クライアントで共有するリングバッファ。メモリ使用量制限のためにサイズを制限）
+broadcaster = EventBroadcaster(
+    capacity=100,
+    event_log=EventLog(EVENT_LOG_DIR, segment_size=EVENT_LOG_SEGMENT_SIZE, max_segments=EVENT_LOG_MAX_SEGMENTS)
+)
+HISTORY_SIZE = 20        # 接続直後に送る履歴イベントの最大件数
+KEEPALIVE_INTERVAL = 15  # キープアライブの送信間隔（秒）
+
+# メトリクス（/metrics で Prometheus 形式、/api/stats でJSONを返す）
+metrics = get_metrics_registry()
+EVENTS_RECEIVED = metrics.counter('monibot_webhook_events_total', '受信したイベント数', ('source',))
+PUBLISH_SECONDS = metrics.histogram('monibot_webhook_publish_seconds', 'イベントの保存と配信の所要時間')
+metrics.register_collector('webhook_server', lambda: {
+    'active_clients': broadcaster.client_count,
+    'buffered_events': broadcaster.size(),
+    'latest_seq': broadcaster.latest_seq,
+})
 
 # 静的ファイル配信用のルート設定
 @app.route('/assets/<path:path>')
 def send_assets(path):
-    """アセットファイルの配信"""
-    return send_from_directory('assets', path)
+    """アセットファイルの配信（事前圧縮版・キャッシュヘッダー付き）"""
+    return send_asset(ASSETS_DIR, path)
+
+# テンプレートは変数を含まないため、描画結果を保持して使い回す（デバッグモードでは毎回描画）
+_page_cache = {}
+
+def render_page(template_name):
+    """テンプレートを描画する（描画結果はキャッシュする）"""
+    if app.debug:
+        return render_template(template_name)
+    html = _page_cache.get(template_name)
+    if html is None:
+        html = _page_cache[template_name] = render_template(template_name)
+    return html
 
 @app.route('/')
 def index():
     """ホームページへリダイレクト"""
-    return render_template('index.html')
+    return render_page('index.html')
 
 # 重要: .htmlサフィックス付きのURLも処理する
 @app.route('/index.html')
@@ -35,7 +82,7 @@ def index_html():
 @app.route('/status')
 def status_page():
     """ステータスページ配信"""
-    return render_template('status.html')
+    return render_page('status.html')
 
 @app.route('/status.html')
 def status_html():
@@ -44,7 +91,7 @@ def status_html():
 @app.route('/webhook_monitor')
 def monitor():
     """ウェブフックモニターページ配信"""
-    return render_template('webhook_monitor.html')
+    return render_page('webhook_monitor.html')
 
 @app.route('/webhook_monitor.html')
 def monitor_html():
@@ -53,7 +100,7 @@ def monitor_html():
 @app.route('/webhook_client')
 def client():
     """ウェブフックテストクライアントページ配信"""
-    return render_template('webhook_client.html')
+    return render_page('webhook_client.html')
 
 @app.route('/webhook_client.html')
 def client_html():
@@ -63,15 +110,25 @@ def client_html():
 def get_stats():
     """サーバー統計情報API"""
     return jsonify({
-        "active_clients": len(clients),
-        "events_in_queue": event_queue.qsize(),
+        "active_clients": broadcaster.client_count,
+        "events_in_queue": broadcaster.size(),
         "server_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """メトリクスAPI（Prometheus形式。同一端末から、または metrics_token が一致する場合のみ）"""
+    if not (is_loopback_address(request.remote_addr or '')
+            or (METRICS_TOKEN and request.args.get('token') == METRICS_TOKEN)):
+        return jsonify({'error': 'forbidden'}), 403
+    return Response(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/events')
 def events():
     """SSEエンドポイント - リアルタイムウェブフック監視用"""
     client_id = str(uuid.uuid4())
+    # 再接続時はブラウザが最後に受け取ったイベントIDを Last-Event-ID ヘッダーで送ってくる
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
     
     def event_stream():
         # 初期接続メッセージ送信
@@ -79,34 +136,33 @@ def events():
         yield "event: connected\n"
         yield f"data: {json.dumps({'client_id': client_id, 'message': 'ウェブフックストリームに接続しました'})}\n\n"
         
-        # このクライアント用のキューを作成
-        clients[client_id] = queue.Queue()
-        
+        broadcaster.register_client()
         try:
-            # 既存の履歴イベントを送信（最大20件）
-            history_size = min(event_queue.qsize(), 20)
-            history = list(event_queue.queue)[-history_size:]
-            
-            for event in history:
-                yield f"event: history\n"
-                yield f"data: {json.dumps(event)}\n\n"
+            cursor = broadcaster.resolve_cursor(last_event_id)
+            if cursor is None:
+                # 既存の履歴イベントを送信（最大20件）
+                cursor, history = broadcaster.history(HISTORY_SIZE)
+                for _, event in history:
+                    yield format_sse('history', event)
+            else:
+                # 再接続: 切断中に届いたイベントだけを送信
+                cursor, missed = broadcaster.read_since(cursor)
+                for _, event in missed:
+                    yield format_sse('webhook', event)
             
-            # 新しいイベントを監視
+            # 新しいイベントを監視（届き次第すぐに送信する）
             while True:
-                try:
-                    # ノンブロッキングでクライアント固有のキューを確認
-                    event = clients[client_id].get(timeout=0.1)
-                    yield f"event: webhook\n"
-                    yield f"data: {json.dumps(event)}\n\n"
-                except queue.Empty:
+                cursor, new_events = broadcaster.wait(cursor, timeout=KEEPALIVE_INTERVAL)
+                if not new_events:
                     # キープアライブコメントを送信して接続を維持
                     yield ": keepalive\n\n"
-                    time.sleep(5)  # 5秒ごとにチェック
-        except GeneratorExit:
+                    continue
+                for _, event in new_events:
+                    yield format_sse('webhook', event)
+        finally:
             # クライアント切断時の処理
-            if client_id in clients:
-                del clients[client_id]
-                print(f"クライアント {client_id} が切断しました。アクティブクライアント: {len(clients)}")
+            count = broadcaster.unregister_client()
+            print(f"クライアント {client_id} が切断しました。アクティブクライアント: {count}")
     
     # SSEレスポンスの作成
     response = Response(stream_with_context(event_stream()),
@@ -114,7 +170,7 @@ def events():
     response.headers.add('Cache-Control', 'no-cache')
     # response.headers.add('Connection', 'keep-alive')
     
-    print(f"新しいクライアント接続: {client_id}。 総クライアント数: {len(clients) + 1}")
+    print(f"新しいクライアント接続: {client_id}。 総クライアント数: {broadcaster.client_count + 1}")
     return response
 
 @app.route('/webhook/new_ticket', methods=['POST', 'GET'])
@@ -132,47 +188,76 @@ def webhook():
     else:  # GET
         data = request.args.to_dict()
     
-    # 標準イベントとしてフォーマット
-    event = {
+    # 標準イベントとしてフォーマットし、イベントキューに追加して全クライアントにブロードキャスト
+    EVENTS_RECEIVED.inc(source='http')
+    add_to_queue_and_broadcast(build_event(data, client_ip, request.method, timestamp))
+    
+    return jsonify({
+        "status": "success",
+        "message": "ウェブフックを受信し処理しました",
         "timestamp": timestamp,
+        "clients": broadcaster.client_count
+    })
+
+def build_event(data, source_ip, method, timestamp=None):
+    """受信したデータを標準イベントとしてフォーマットする"""
+    event = {
+        "timestamp": timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         "data": data,
-        "source_ip": client_ip,
-        "method": request.method,
+        "source_ip": source_ip,
+        "method": method,
         "event_id": str(uuid.uuid4())
     }
     
+    # オーケストレーターが付与したトレースID（抽出から通知までの追跡用）
+    if isinstance(data, dict) and data.get("traceId"):
+        event["trace_id"] = data["traceId"]
+    
     # チケット関連イベントの特別処理
     if "event_type" in data and data["event_type"] in ["processing_ticket", "patient_registration", "appointment_scheduled"]:
         # フロントエンド処理用のチケットフラグを追加
         event["is_ticket"] = True
-        
-    # イベントキューに追加して全クライアントにブロードキャスト
-    add_to_queue_and_broadcast(event)
+    return event
+
+_local_listener = None
+
+def start_local_listener():
+    """
+    同一端末のオーケストレーターからのイベントを、HTTPを経由せずに受信する
+
+    受信したイベントはHTTPで受けた場合と同じくブロードキャストする。
+    設定で transport = http の場合は起動しない。
+    """
+    global _local_listener
+    if _local_listener is not None:
+        return _local_listener
+    transport_config = load_transport_config()
+    if transport_config['transport'] == 'http':
+        return None
     
-    return jsonify({
-        "status": "success",
-        "message": "ウェブフックを受信し処理しました",
-        "timestamp": timestamp,
-        "clients": len(clients)
-    })
+    def handle_local_event(data):
+        EVENTS_RECEIVED.inc(source='local')
+        add_to_queue_and_broadcast(build_event(data, 'local', 'LOCAL'))
+    
+    if not transport_config['authkey']:
+        print("ローカル転送の認証キーが無いため、ローカル転送の受信を開始しません（HTTPのみで受信します）")
+        return None
+    listener = LocalEventListener(handle_local_event, transport_config['authkey'], transport_config['address'])
+    try:
+        listener.start()
+    except OSError as e:
+        print(f"ローカル転送の受信を開始できませんでした（HTTPのみで受信します）: {e}")
+        return None
+    print(f"ローカル転送の受信を開始しました: {transport_config['address']}")
+    _local_listener = listener
+    return listener
 
 def add_to_queue_and_broadcast(event):
-    """イベントをキューに追加し、クライアントにブロードキャストするヘルパー関数"""
+    """イベントを共有バッファに追加し、接続中の全クライアントに配信するヘルパー関数"""
     try:
-        # キューが満杯の場合は最古のアイテムを削除
-        if event_queue.full():
-            try:
-                event_queue.get_nowait()
-            except queue.Empty:
-                pass
-        event_queue.put(event)
-        
-        # 接続中の全クライアントにブロードキャスト
-        for client_id, client_queue in clients.items():
-            try:
-                client_queue.put(event)
-            except Exception as e:
-                print(f"クライアント {client_id} への送信中にエラー: {e}")
+        # バッファが満杯の場合は最古のイベントから破棄される
+        with PUBLISH_SECONDS.time():
+            broadcaster.publish(event)
     except Exception as e:
         print(f"イベントキューへの追加中にエラー: {e}")
 
@@ -285,23 +370,98 @@ pre {
                 f.write(content)
             print(f"{filename}を作成しました")
 
+def build():
+    """
+    テンプレート・アセットを準備する（デプロイ時に1回だけ実行する）
+
+    テンプレートとCSSの作成に加え、アセットの事前圧縮版（gzip / brotli）を生成する。
+    """
+    create_template_dir()
+    create_assets_dir()
+    created = precompress_assets(ASSETS_DIR)
+    print(f"アセットの圧縮版を {created} 件作成しました")
+
+def load_server_settings():
+    """[webhook_server] セクションからサーバー設定を読み込む"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH, encoding='utf-8')
+    return {
+        'mode': config.get('webhook_server', 'mode', fallback='waitress'),
+        'host': config.get('webhook_server', 'host', fallback='0.0.0.0'),
+        'port': config.getint('webhook_server', 'port', fallback=8080),
+        'threads': config.getint('webhook_server', 'threads', fallback=8),
+        'connection_limit': config.getint('webhook_server', 'connection_limit', fallback=100),
+        'metrics_token': config.get('webhook_server', 'metrics_token', fallback=''),
+    }
+
+# 他の端末から /metrics を取得する場合に必要なトークン（未設定の場合は同一端末からのみ）
+METRICS_TOKEN = load_server_settings()['metrics_token']
+
+def print_urls(host, port):
+    display_host = host if host != '0.0.0.0' else 'localhost'
+    print(f"ダッシュボード: http://{display_host}:{port}/webhook_monitor")
+    print(f"テストクライアント: http://{display_host}:{port}/webhook_client")
+    print(f"ウェブフックエンドポイント: http://{display_host}:{port}/webhook/new_ticket")
+
 # サーバー起動関数
 def start_server(host='0.0.0.0', port=8080):
-    """ウェブフックサーバーを起動"""
-    print(f"ウェブフックサーバーを起動: {host}:{port}")
-    print(f"ダッシュボード: http://{host if host != '0.0.0.0' else 'localhost'}:{port}/webhook_monitor")
-    print(f"テストクライアント: http://{host if host != '0.0.0.0' else 'localhost'}:{port}/webhook_client")
-    print(f"ウェブフックエンドポイント: http://{host if host != '0.0.0.0' else 'localhost'}:{port}/webhook/new_ticket")
+    """ウェブフックサーバーを開発用サーバーで起動（デバッガー・自動リロード有効。本番では使用しない）"""
+    print(f"ウェブフックサーバーを起動（開発モード）: {host}:{port}")
+    print_urls(host, port)
+    
+    # デバッグモードのリロード監視プロセスでは受信しない（実際にリクエストを処理する子プロセスでのみ開始する）
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_local_listener()
     
     app.run(host=host, port=port, threaded=True, debug=True)
 
+def start_production_server(host='0.0.0.0', port=8080, threads=8, connection_limit=100):
+    """
+    ウェブフックサーバーを waitress で起動（本番用）
+
+    SSEの接続はそれぞれ1スレッドを使うため、threads はダッシュボードの同時接続数より
+    多めに設定する。多数のダッシュボードを接続する場合は asyncio モードを使う。
+    """
+    from waitress import serve
+    print(f"ウェブフックサーバーを起動（waitress, スレッド数 {threads}）: {host}:{port}")
+    print_urls(host, port)
+    start_local_listener()
+    serve(app, host=host, port=port, threads=threads, connection_limit=connection_limit,
+          channel_timeout=KEEPALIVE_INTERVAL * 4)
+
+def start_async_server(host='0.0.0.0', port=8080):
+    """ウェブフックサーバーをasyncioモードで起動（多数のダッシュボード接続向け）"""
+    from async_server import run_async_server
+    print_urls(host, port)
+    start_local_listener()
+    run_async_server(app, broadcaster, host, port)
+
 if __name__ == '__main__':
-    # 必要なディレクトリとファイルを確認・作成
-    create_template_dir()
-    create_assets_dir()
+    settings = load_server_settings()
+    parser = argparse.ArgumentParser(description='ウェブフックサーバー')
+    parser.add_argument('--mode', choices=['waitress', 'async', 'dev'], default=settings['mode'],
+                        help='waitress: 本番用（スレッド） / async: 本番用（asyncio） / dev: 開発用サーバー')
+    parser.add_argument('--host', default=settings['host'])
+    parser.add_argument('--port', type=int, default=settings['port'])
+    parser.add_argument('--threads', type=int, default=settings['threads'], help='waitress モードのスレッド数')
+    parser.add_argument('--build', action='store_true',
+                        help='テンプレート・アセットの準備と事前圧縮だけを行って終了する')
+    args = parser.parse_args()
+    
+    if args.build:
+        build()
+        sys.exit(0)
     
     # サーバー起動
     try:
-        start_server()
+        if args.mode == 'async':
+            start_async_server(args.host, args.port)
+        elif args.mode == 'dev':
+            start_server(args.host, args.port)
+        else:
+            start_production_server(args.host, args.port, args.threads, settings['connection_limit'])
     except KeyboardInterrupt:
-        print("\nサーバーをシャットダウンします...")
\ No newline at end of file
+        print("\nサーバーをシャットダウンします...")
+else:
+    # waitress などのWSGIサーバーから読み込まれた場合もローカル転送を受信する
+    start_local_listener()
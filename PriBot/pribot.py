@@ -242,32 +242,68 @@ def get_custom_field_value(custom_fields, name):
         logger.error(f"カスタムフィールド '{name}' の値取得中にエラー: {e}")
         return ''
 
-def get_folder_settings(config):
-    """Backlogからフォルダ設定を取得する"""
-    try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
-        project_id = config['backlog']['pribot_project_id']
-        
-        logger.info("Backlog APIからフォルダ設定を取得します")
-        
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        issues_endpoint = f"{base_url}/issues"
+# Backlog API 通信設定
+HTTP_TIMEOUT = (5, 30)  # (接続, 読み取り) タイムアウト（秒）
+ISSUES_PAGE_SIZE = 100  # 課題一覧APIの1ページあたり最大件数
+RATE_LIMIT_DELAY = 15   # 429でリセット時刻が分からない場合の待機（秒）
+_backlog_session = requests.Session()
+
+def fetch_backlog_issues(config, project_id):
+    """
+    Backlogから課題一覧を全件取得する
+
+    Keep-Alive接続を再利用し、100件を超える場合は offset でページングする。
+    429（レート制限）の場合は X-RateLimit-Reset / Retry-After まで待って再試行する。
+    """
+    space_name = config['backlog']['space_name']
+    api_key = config['backlog']['api_key']
+    issues_endpoint = f"https://{space_name}.backlog.com/api/v2/issues"
+
+    issues = []
+    offset = 0
+    retries = 0
+    while True:
         issue_params = {
             "apiKey": api_key,
             "projectId[]": project_id,
-            "count": 100,
+            "count": ISSUES_PAGE_SIZE,
+            "offset": offset,
             "sort": "created",
             "order": "asc"
         }
+        response = _backlog_session.get(issues_endpoint, params=issue_params, timeout=HTTP_TIMEOUT)
+
+        if response.status_code == 429 and retries < 3:
+            retries += 1
+            wait_time = RATE_LIMIT_DELAY
+            if response.headers.get('Retry-After'):
+                wait_time = int(response.headers['Retry-After'])
+            elif response.headers.get('X-RateLimit-Reset'):
+                wait_time = max(1, int(response.headers['X-RateLimit-Reset']) - int(time.time()))
+            logger.warning(f"APIレート制限に達しました (429). {wait_time}秒後にリトライします")
+            time.sleep(wait_time)
+            continue
+
+        response.raise_for_status()
+        page = response.json()
+        issues.extend(page)
+        if len(page) < ISSUES_PAGE_SIZE:
+            return issues
+        offset += len(page)
+
+def get_folder_settings(config):
+    """Backlogからフォルダ設定を取得する"""
+    try:
+        project_id = config['backlog']['pribot_project_id']
         
-        response = requests.get(issues_endpoint, params=issue_params)
+        logger.info("Backlog APIからフォルダ設定を取得します")
         
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
+        try:
+            issues = fetch_backlog_issues(config, project_id)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return get_default_folder_settings()
         
-        issues = response.json()
         settings = None
         
         for issue in issues:
@@ -315,29 +351,16 @@ def get_default_folder_settings():
 def get_hospital_info(config):
     """Backlogから医療機関情報を取得する"""
     try:
-        space_name = config['backlog']['space_name']
-        api_key = config['backlog']['api_key']
         project_id = config['backlog']['pribot_project_id']
 
         logger.info("Backlog APIリクエストを開始します")
 
-        base_url = f"https://{space_name}.backlog.com/api/v2"
-        issues_endpoint = f"{base_url}/issues"
-        issue_params = {
-            "apiKey": api_key,
-            "projectId[]": project_id,
-            "count": 100,
-            "sort": "created",
-            "order": "asc"
-        }
-
-        response = requests.get(issues_endpoint, params=issue_params)
-        
-        if response.status_code != 200:
-            logger.error(f"課題一覧の取得に失敗: ステータスコード {response.status_code}")
+        try:
+            issues = fetch_backlog_issues(config, project_id)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"課題一覧の取得に失敗: {e}")
             return []
 
-        issues = response.json()
         logger.info(f"取得した全課題数: {len(issues)}")
         
         hospital_dict = {}